@@ -0,0 +1,122 @@
+import math
+import time
+
+import anyio
+
+# Weight of the latest request in a class's average service time
+SERVICE_TIME_WEIGHT = 0.2
+
+_classes = {}
+
+
+class Rejected(Exception):
+    """
+    Raised by AdmissionClass.slot() when a request is shed.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    """
+    Concurrency limit of one endpoint class: at most `limit` requests run at
+    once, at most `queue_size` more wait for a slot, and none waits longer
+    than `queue_seconds`. Requests beyond that are rejected straight away,
+    with a Retry-After estimated from the queue and recent service times.
+    """
+
+    def __init__(self, name, limit, queue_size, queue_seconds):
+        self.name = name
+        self.limiter = anyio.CapacityLimiter(limit)
+        self.queue_size = queue_size
+        self.queue_seconds = queue_seconds
+        self.waiting = 0
+        self.service_seconds = None  # moving average
+        self._stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def retry_after(self):
+        """
+        Whole seconds until a new request would likely get a slot (at least 1).
+        """
+        service = self.service_seconds or 1.0
+        return max(1, math.ceil(service * (self.waiting + 1) / self.limiter.total_tokens))
+
+    def slot(self):
+        return _Slot(self)
+
+    def stats(self):
+        return {
+            **self._stats,
+            "limit": self.limiter.total_tokens,
+            "active": self.limiter.borrowed_tokens,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "queue_seconds": self.queue_seconds,
+            "service_seconds": None if self.service_seconds is None else round(self.service_seconds, 4),
+        }
+
+    def _record(self, seconds):
+        if self.service_seconds is None:
+            self.service_seconds = seconds
+        else:
+            self.service_seconds += SERVICE_TIME_WEIGHT * (seconds - self.service_seconds)
+
+
+class _Slot:
+    """
+    Async context manager holding one of the class's slots; raises Rejected on entry when shed.
+    """
+
+    def __init__(self, admission):
+        self.admission = admission
+        self.borrower = None
+        self.started = None
+
+    async def __aenter__(self):
+        admission = self.admission
+        # Slots are borrowed per request, not per task
+        borrower = object()
+        if admission.waiting == 0 and admission.limiter.available_tokens:
+            admission.limiter.acquire_on_behalf_of_nowait(borrower)
+        elif admission.waiting >= admission.queue_size:
+            admission._stats["rejected_full"] += 1
+            raise Rejected(admission.retry_after())
+        else:
+            admission.waiting += 1
+            admission._stats["queued"] += 1
+            acquired = False
+            try:
+                with anyio.move_on_after(admission.queue_seconds):
+                    await admission.limiter.acquire_on_behalf_of(borrower)
+                    acquired = True
+            finally:
+                admission.waiting -= 1
+            if not acquired:
+                admission._stats["rejected_timeout"] += 1
+                raise Rejected(admission.retry_after())
+        self.borrower = borrower
+        admission._stats["admitted"] += 1
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.admission._record(time.monotonic() - self.started)
+        self.admission.limiter.release_on_behalf_of(self.borrower)
+
+
+def admission_class(name, limit, queue_size, queue_seconds):
+    """
+    The process-wide AdmissionClass called `name`, created on first use.
+    """
+    if name not in _classes:
+        _classes[name] = AdmissionClass(name, limit, queue_size, queue_seconds)
+    return _classes[name]
+
+
+def admission_stats():
+    """
+    {class name: stats} for this process.
+    """
+    return {name: admission.stats() for name, admission in _classes.items()}
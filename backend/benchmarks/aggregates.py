@@ -0,0 +1,79 @@
+"""
+Benchmark the sharded sales aggregation with different worker counts.
+
+Builds a synthetic sales_transactions table of --rows rows spread over
+--months months in a temporary database, writes its month shards and times
+SalesAggregator.aggregate() serially and on process pools of increasing size.
+
+    cd backend && python -m benchmarks.aggregates --rows 5000000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import build_sales_shards
+from services.aggregates import SalesAggregator, shutdown_pool
+
+
+def build_database(path, rows, months, seed=42):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2020-01-01")
+    days = rng.integers(0, months * 30, rows)
+    sales = pd.DataFrame(
+        {
+            "transaction_id": np.arange(1, rows + 1),
+            "customer_id": rng.integers(1, 10_001, rows),
+            "product_id": rng.integers(1, 501, rows),
+            "transaction_date": np.datetime_as_string(start + days.astype("timedelta64[D]")),
+            "quantity": rng.integers(1, 10, rows),
+            "sale_amount": rng.gamma(2.0, 500.0, rows).round(2),
+        }
+    )
+    conn = sqlite3.connect(path)
+    sales.to_sql("sales_transactions", conn, index=False, chunksize=100_000)
+    conn.execute("CREATE INDEX idx_sales_date ON sales_transactions (transaction_date)")
+    build_sales_shards(conn)
+    conn.close()
+
+
+def time_aggregate(aggregator, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        aggregator.aggregate()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"building {args.rows:,} rows over {args.months} months ...")
+        build_database(path, args.rows, args.months)
+
+        serial = time_aggregate(SalesAggregator(db_path=path, workers=1), args.repeat)
+        print(f"serial      {serial:8.3f}s  {args.rows / serial:12,.0f} rows/s")
+        for workers in sorted(set(args.workers)):
+            if workers < 2:
+                continue
+            aggregator = SalesAggregator(db_path=path, workers=workers, parallel_min_rows=0)
+            aggregator.aggregate()  # start the pool outside the timing
+            elapsed = time_aggregate(aggregator, args.repeat)
+            print(f"{workers:2d} workers  {elapsed:8.3f}s  {args.rows / elapsed:12,.0f} rows/s  x{serial / elapsed:.2f}")
+            shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Compare the approximate query mode with exact answers on synthetic data.
+
+Builds a temporary database with --rows sales over --customers customers and
+a third as many support tickets, builds the approximate-query sketches and
+reports time and error of each approximate figure next to its exact value:
+the 95th percentile of customer LTV (customer sample) and monthly sentiment
+means (daily rollup).
+
+    cd backend && python -m benchmarks.approx --rows 10000000 --customers 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import build_sales_shards
+from services.aggregates import SalesAggregator, shutdown_pool
+from services.approx import ApproxStore
+from services.customer import CustomerService
+
+
+def build_database(path, rows, customers, months=36, seed=42):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2022-01-01")
+    conn = sqlite3.connect(path)
+    pd.DataFrame({"customer_id": np.arange(1, customers + 1)}).to_sql("customers", conn, index=False)
+    # Skewed customer activity, so the LTV distribution has a long tail
+    weights = rng.pareto(1.5, customers) + 1
+    weights /= weights.sum()
+    for chunk in range(0, rows, 1_000_000):
+        n = min(1_000_000, rows - chunk)
+        pd.DataFrame(
+            {
+                "customer_id": rng.choice(customers, n, p=weights) + 1,
+                "product_id": rng.integers(1, 501, n),
+                "transaction_date": np.datetime_as_string(start + rng.integers(0, months * 30, n).astype("timedelta64[D]")),
+                "sale_amount": rng.gamma(2.0, 500.0, n).round(2),
+            }
+        ).to_sql("sales_transactions", conn, index=False, if_exists="append")
+    tickets = rows // 3
+    pd.DataFrame(
+        {
+            "customer_id": rng.integers(1, customers + 1, tickets),
+            "creation_date": np.datetime_as_string(start + rng.integers(0, months * 30, tickets).astype("timedelta64[D]")),
+            "sentiment_score": rng.random(tickets).round(2),
+        }
+    ).to_sql("support_tickets", conn, index=False, if_exists="append")
+    conn.execute("CREATE INDEX idx_sales_date ON sales_transactions (transaction_date, customer_id, sale_amount)")
+    conn.execute("CREATE INDEX idx_sales_customer_date ON sales_transactions (customer_id, transaction_date)")
+    conn.commit()
+    build_sales_shards(conn)
+    conn.close()
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def report(name, exact, exact_time, approx, approx_time, bounds):
+    error = abs(approx - exact) / abs(exact) if exact else 0.0
+    print(
+        f"{name:<22} exact {exact:>14,.2f} in {exact_time:7.3f}s | approx {approx:>14,.2f} in {approx_time:7.3f}s"
+        f"  error {error:6.2%}  x{exact_time / max(approx_time, 1e-9):.1f}  bounds {bounds}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--customers", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"building {args.rows:,} sales over {args.customers:,} customers ...")
+        build_database(path, args.rows, args.customers)
+        conn = sqlite3.connect(path)
+        store = ApproxStore(conn)
+        _, build_time = timed(store.rebuild)
+        print(f"sketches built in {build_time:.2f}s")
+        customers = CustomerService()
+
+        def exact_ltv():
+            stats = SalesAggregator(db_path=path, workers=1).aggregate()["customers"]
+            return customers._compute_ltv(stats).quantile(0.95)
+
+        def approx_ltv():
+            sales = pd.read_sql(
+                """
+                SELECT s.customer_id, s.transaction_date, s.sale_amount
+                FROM approx_customer_sample c JOIN sales_transactions s ON s.customer_id = c.customer_id
+                """,
+                conn,
+            )
+            sales["transaction_date"] = pd.to_datetime(sales["transaction_date"])
+            return store.sample_quantile(customers._compute_ltv(customers._aggregate_sales(sales)), 0.95)
+
+        exact, exact_time = timed(exact_ltv)
+        (approx, bounds), approx_time = timed(approx_ltv)
+        report("LTV p95", exact, exact_time, approx, approx_time, (round(bounds["lower"]), round(bounds["upper"])))
+
+        def exact_sentiment():
+            tickets = pd.read_sql("SELECT creation_date, sentiment_score FROM support_tickets", conn)
+            return tickets.groupby(tickets["creation_date"].str[:7])["sentiment_score"].mean()
+
+        def approx_sentiment():
+            monthly = store.monthly_sentiment().set_index("month")
+            return monthly["sentiment_sum"] / monthly["scored"]
+
+        exact, exact_time = timed(exact_sentiment)
+        approx, approx_time = timed(approx_sentiment)
+        report(
+            "monthly sentiment", exact.mean(), exact_time, approx.mean(), approx_time,
+            f"max abs diff {(exact - approx).abs().max():.2e}",
+        )
+        conn.close()
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Sustained throughput of the batched write API.
+
+Copies the database to a temporary directory and starts a server on it.
+--clients threads then POST batches of --batch transactions to
+/ingest/transactions for --seconds, each waiting for its batch to be
+committed. Meanwhile one reader polls /customers/1 with the caches bypassed.
+The run is repeated with every batch committed on its own ("per-batch") and
+with group commit ("grouped"). Reports rows per second, write latency, rows
+per commit and the reader's latency.
+
+    cd backend && python -m benchmarks.ingest --clients 8 --batch 100 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.startup import free_port
+
+RUNS = [("per-batch", 1), ("grouped", None)]
+
+
+def serve(port, db_path, group_rows):
+    from config import config
+
+    config.DB_PATH = db_path
+    config.WARMUP = False
+    config.PAYLOAD_CACHE = False
+    config.PROFILE_CACHE_SIZE = 0
+    config.ENV = "prod"
+    if group_rows:
+        config.INGEST_GROUP_ROWS = group_rows
+    import uvicorn
+
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def batch(size):
+    return [
+        {
+            "customer_id": random.randint(1, 100),
+            "product_id": random.randint(1, 45),
+            "quantity": random.randint(1, 5),
+            "sale_amount": round(random.uniform(10, 2000), 2),
+            "transaction_date": "2025-06-01",
+            "sentiment_score": round(random.uniform(-1, 1), 2),
+        }
+        for _ in range(size)
+    ]
+
+
+def run(db_path, group_rows, clients, size, seconds):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.ingest", "--serve", str(port), "--db", db_path, "--group-rows", str(group_rows or 0)]
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"{base}/metrics").read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+
+        stop = time.perf_counter() + seconds
+        writes, reads, errors = [], [], []
+
+        def write():
+            while time.perf_counter() < stop:
+                body = json.dumps(batch(size)).encode()
+                request = urllib.request.Request(
+                    f"{base}/ingest/transactions", body, {"Content-Type": "application/json"}
+                )
+                started = time.perf_counter()
+                try:
+                    urllib.request.urlopen(request).read()
+                    writes.append(time.perf_counter() - started)
+                except urllib.error.HTTPError as e:
+                    errors.append(e.code)
+
+        def read():
+            while time.perf_counter() < stop:
+                request = urllib.request.Request(f"{base}/customers/1", headers={"Cache-Control": "no-cache"})
+                started = time.perf_counter()
+                urllib.request.urlopen(request).read()
+                reads.append(time.perf_counter() - started)
+                time.sleep(0.05)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=write) for _ in range(clients)] + [threading.Thread(target=read)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stats = json.load(urllib.request.urlopen(f"{base}/metrics"))["ingest"]
+        return {
+            "rows/s": len(writes) * size / elapsed,
+            "write p50": percentile(writes, 0.5),
+            "write p99": percentile(writes, 0.99),
+            "rows/commit": stats["rows_per_commit"] or 0,
+            "read p50": percentile(reads, 0.5),
+            "read p99": percentile(reads, 0.99),
+            "errors": len(errors),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    from config import config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--group-rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.db, args.group_rows)
+        return
+
+    columns = ["rows/s", "write p50", "write p99", "rows/commit", "read p50", "read p99", "errors"]
+    print(f"{'run':<10} " + " ".join(f"{column:>12}" for column in columns))
+    for name, group_rows in RUNS:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            shutil.copy(config.DB_PATH, path)
+            result = run(path, group_rows, args.clients, args.batch, args.seconds)
+        print(
+            f"{name:<10} {result['rows/s']:12.0f} {result['write p50']:11.3f}s {result['write p99']:11.3f}s "
+            f"{result['rows/commit']:12.1f} {result['read p50']:11.3f}s {result['read p99']:11.3f}s {result['errors']:12d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
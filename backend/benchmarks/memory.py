@@ -0,0 +1,187 @@
+"""
+Peak memory of the heaviest endpoints with and without compact dtypes.
+
+Builds a temporary database with --rows sales, a third as many support
+tickets and the derived tables the services read, then calls each endpoint's
+service method in a fresh process, once with COMPACT_DTYPES off ("before")
+and once on ("after"), and reports the process's peak RSS above its
+post-import baseline.
+
+    cd backend && python -m benchmarks.memory --rows 10000000
+"""
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+REGIONS = ["North America", "Europe", "Asia", "South America", "Africa", "Oceania"]
+INDUSTRIES = ["Retail", "Technology", "Healthcare", "Finance", "Manufacturing", "Education"]
+CATEGORIES = ["Electronics", "Furniture", "Apparel", "Food", "Books", "Sports"]
+STATUSES = ["Open", "In Progress", "Resolved", "Closed"]
+ISSUE_TYPES = ["Damaged Product", "Delivery Delay", "Product Inquiry", "Refund Request", "Technical Issue"]
+
+# Service call behind each endpoint, given the services package
+ENDPOINTS = {
+    "/overview": lambda services: services.OverViewService().get_overview(),
+    "/customers/{id}": lambda services: services.CustomerService().get_customer_profile(1),
+    "/products/{id}": lambda services: services.ProductService().get_product_profile(1),
+    "POST /customers/profiles": lambda services: list(
+        services.CustomerService().get_customer_profiles(list(range(1, 2001)))
+    ),
+    "POST /products/profiles": lambda services: list(
+        services.ProductService().get_product_profiles(list(range(1, 101)))
+    ),
+}
+
+
+def dates(rng, n, start=np.datetime64("2022-01-01"), days=3 * 365):
+    return np.datetime_as_string(start + rng.integers(0, days, n).astype("timedelta64[D]"))
+
+
+def build_database(path, rows, seed=42):
+    from db import ensure_customer_product_purchases, ensure_indexes, ensure_sales_shards
+    from services.suppliers import SupplierMetrics
+
+    rng = np.random.default_rng(seed)
+    customers, products = max(rows // 100, 10), 500
+    conn = sqlite3.connect(path)
+    pd.DataFrame(
+        {
+            "customer_id": np.arange(1, customers + 1),
+            "customer_name": [f"Customer {i}" for i in range(1, customers + 1)],
+            "region": rng.choice(REGIONS, customers),
+            "industry": rng.choice(INDUSTRIES, customers),
+            "join_date": dates(rng, customers),
+        }
+    ).to_sql("customers", conn, index=False)
+    prices = rng.gamma(2.0, 400.0, products).round(2)
+    pd.DataFrame(
+        {
+            "product_id": np.arange(1, products + 1),
+            "product_name": [f"Product {i}" for i in range(1, products + 1)],
+            "category": rng.choice(CATEGORIES, products),
+            "sales_price": prices,
+            "cost_price": (prices * rng.uniform(0.3, 0.9, products)).round(2),
+        }
+    ).to_sql("products", conn, index=False)
+    pd.DataFrame(
+        {
+            "supplier_id": np.arange(1, products + 1),
+            "supplier_name": [f"Supplier {i}" for i in range(1, products + 1)],
+            "product_id": np.arange(1, products + 1),
+            "lead_time_days": rng.integers(3, 31, products),
+            "reliability_score": rng.uniform(0.7, 1.0, products).round(2),
+        }
+    ).to_sql("supplier_data", conn, index=False)
+
+    for chunk in range(0, rows, 1_000_000):
+        n = min(1_000_000, rows - chunk)
+        pd.DataFrame(
+            {
+                "transaction_id": np.arange(chunk + 1, chunk + n + 1),
+                "customer_id": rng.integers(1, customers + 1, n),
+                "product_id": rng.integers(1, products + 1, n),
+                "transaction_date": dates(rng, n),
+                "quantity": rng.integers(1, 10, n),
+                "sale_amount": rng.gamma(2.0, 500.0, n).round(2),
+            }
+        ).to_sql("sales_transactions", conn, index=False, if_exists="append")
+    for chunk in range(0, rows // 3, 1_000_000):
+        n = min(1_000_000, rows // 3 - chunk)
+        pd.DataFrame(
+            {
+                "ticket_id": np.arange(chunk + 1, chunk + n + 1),
+                "customer_id": rng.integers(1, customers + 1, n),
+                "product_id": rng.integers(1, products + 1, n),
+                "creation_date": dates(rng, n),
+                "resolution_date": None,
+                "issue_type": rng.choice(ISSUE_TYPES, n),
+                "status": rng.choice(STATUSES, n),
+                "sentiment_score": rng.random(n).round(2),
+            }
+        ).to_sql("support_tickets", conn, index=False, if_exists="append")
+    conn.commit()
+
+    ensure_indexes(conn)
+    ensure_sales_shards(conn)
+    ensure_customer_product_purchases(conn)
+    SupplierMetrics(conn).ensure()
+    conn.close()
+
+
+def measure(endpoint, db_path, compact):
+    """
+    Run one endpoint in this process and print its memory and time as JSON.
+    """
+    from config import config
+
+    config.DB_PATH = db_path
+    config.AGGREGATE_WORKERS = 1
+    config.COMPACT_DTYPES = compact
+    import services  # imports count towards the baseline
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    ENDPOINTS[endpoint](services)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    print(json.dumps({"peak_mib": (peak - baseline) / 1024, "seconds": elapsed}))
+
+
+def run(endpoint, db_path, compact):
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.memory", "--measure", endpoint, "--db", db_path]
+        + ([] if compact else ["--loose"]),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS))
+    parser.add_argument("--build", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--loose", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build:
+        build_database(args.build, args.rows)
+        return
+    if args.measure:
+        measure(args.measure, args.db, compact=not args.loose)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"building {args.rows:,} sales and {args.rows // 3:,} tickets ...")
+        # Built in a child process: Linux carries the peak RSS of a parent over
+        # fork/exec, so the measuring processes must come from a small parent
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.memory", "--build", path, "--rows", str(args.rows)], check=True
+        )
+        print(f"{'endpoint':<26} {'before MiB':>11} {'after MiB':>10} {'saved':>7} {'before s':>9} {'after s':>8}")
+        for endpoint in args.endpoints:
+            before, after = run(endpoint, path, compact=False), run(endpoint, path, compact=True)
+            saved = 1 - after["peak_mib"] / before["peak_mib"] if before["peak_mib"] else 0.0
+            print(
+                f"{endpoint:<26} {before['peak_mib']:11.1f} {after['peak_mib']:10.1f} {saved:7.1%}"
+                f" {before['seconds']:9.2f} {after['seconds']:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
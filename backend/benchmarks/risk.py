@@ -0,0 +1,81 @@
+"""
+Benchmark the blocked customer risk scorer on a synthetic customer base.
+
+Builds a temporary database with --customers customers, monthly sales and
+support tickets over the scorer's months, then scores everyone with a few
+block sizes and reports wall time and peak traced Python/NumPy memory.
+
+    cd backend && python -m benchmarks.risk --customers 1000000 --block-sizes 10000 50000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from services.risk import CustomerRiskScorer
+
+
+def build_database(path, customers, months=9, seed=42):
+    rng = np.random.default_rng(seed)
+    month_labels = [str(p) for p in pd.period_range(end="2025-05", periods=months, freq="M")]
+    conn = sqlite3.connect(path)
+    pd.DataFrame({"customer_id": np.arange(1, customers + 1)}).to_sql("customers", conn, index=False)
+
+    # About 1.5 sales and 0.5 tickets per customer and month, written month by month
+    for month in month_labels:
+        n_sales = int(customers * 1.5)
+        pd.DataFrame(
+            {
+                "customer_id": rng.integers(1, customers + 1, n_sales),
+                "transaction_date": f"{month}-15",
+                "sale_amount": rng.gamma(2.0, 500.0, n_sales).round(2),
+            }
+        ).to_sql("sales_transactions", conn, index=False, if_exists="append")
+        n_tickets = customers // 2
+        pd.DataFrame(
+            {
+                "customer_id": rng.integers(1, customers + 1, n_tickets),
+                "creation_date": f"{month}-10",
+                "status": rng.choice(["Open", "Closed", "Resolved", "In Progress"], n_tickets),
+                "sentiment_score": rng.random(n_tickets).round(2),
+            }
+        ).to_sql("support_tickets", conn, index=False, if_exists="append")
+    conn.execute("CREATE INDEX idx_sales_customer_date ON sales_transactions (customer_id, transaction_date)")
+    conn.execute("CREATE INDEX idx_tickets_customer_date ON support_tickets (customer_id, creation_date)")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=200_000)
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[10_000, 50_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"building {args.customers:,} customers ...")
+        build_database(path, args.customers)
+
+        conn = sqlite3.connect(path)
+        for block_size in args.block_sizes:
+            tracemalloc.start()
+            started = time.perf_counter()
+            CustomerRiskScorer(conn, block_size=block_size).score(top_n=100)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"block {block_size:>8,}  {elapsed:8.2f}s  {args.customers / elapsed:10,.0f} customers/s"
+                f"  peak {peak / 2**20:8.1f} MiB"
+            )
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cold-start cost of the API: import time and time to first response.
+
+Copies the database to a temporary directory, then reports the time to
+import the application in a fresh interpreter, and the time from starting
+a server process to the first successful response of each --endpoints
+path, for three starts:
+
+- cold: no startup warmup and an empty response cache
+- warmup: startup warmup, empty response cache
+- restart: startup warmup, response cache kept from the previous start
+
+    cd backend && python -m benchmarks.startup --endpoints /overview /customers/1
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+STARTS = [("cold", False, True), ("warmup", True, True), ("restart", True, False)]
+
+
+def import_time():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], check=True)
+    return time.perf_counter() - started
+
+
+def serve(port, db_path, warmup):
+    from config import config
+
+    config.DB_PATH = db_path
+    config.WARMUP = warmup
+    config.ENV = "prod"
+    import uvicorn
+
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_responses(db_path, warmup, endpoints, timeout=300):
+    """
+    Start a server and return the seconds from start to each endpoint's first 200.
+    """
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.startup", "--serve", str(port), "--db", db_path]
+        + ([] if warmup else ["--no-warmup"])
+    )
+    try:
+        times = {}
+        for endpoint in endpoints:
+            while True:
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(endpoint)
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{endpoint}") as response:
+                        response.read()
+                    break
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.02)
+            times[endpoint] = time.perf_counter() - started
+        return times
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    from config import config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", default=["/overview", "/customers/1", "/insights/trends"])
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--no-warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.db, warmup=not args.no_warmup)
+        return
+
+    print(f"import main: {import_time():.2f}s")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        shutil.copy(config.DB_PATH, path)
+        print(f"{'start':<8} " + " ".join(f"{endpoint:>18}" for endpoint in args.endpoints))
+        for name, warmup, clear_cache in STARTS:
+            if clear_cache:
+                shutil.rmtree(f"{path}.cache", ignore_errors=True)
+            times = first_responses(path, warmup, args.endpoints)
+            print(f"{name:<8} " + " ".join(f"{times[endpoint]:17.2f}s" for endpoint in args.endpoints))
+
+
+if __name__ == "__main__":
+    main()
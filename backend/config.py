@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Dict, Optional
 import json
 
 
@@ -6,6 +7,92 @@ class Config(BaseModel):
     DB_PATH: str
     PORT: int
     ENV: str
+    # Responses smaller than this are sent uncompressed
+    COMPRESSION_MIN_SIZE: int = 1024
+    # Processes used for sharded sales aggregates (0 = one per CPU core)
+    AGGREGATE_WORKERS: int = 0
+    # Below this many sales rows, aggregates come from one in-process grouped query
+    PARALLEL_MIN_ROWS: int = 200000
+    # Only tickets from the last N days count towards anomalies (None = all history)
+    ANOMALY_WINDOW_DAYS: Optional[int] = None
+    # Weights of the customer risk signals; missing signals keep their default weight
+    RISK_WEIGHTS: Dict[str, float] = {}
+    # Customers scored per block by the risk scorer (bounds its memory use)
+    RISK_BLOCK_SIZE: int = 50000
+    # Tickets resolved in more than this many days breach the support SLA
+    SLA_DAYS: int = 7
+    # Serve sketch-based approximate answers unless a request passes ?approx=
+    APPROX_MODE: bool = False
+    # Share of customers in the sample behind approximate quantiles ...
+    APPROX_SAMPLE_RATE: float = 0.01
+    # ... but never fewer than this many (all customers if there are fewer)
+    APPROX_MIN_SAMPLE: int = 10000
+    # Load frames with compact dtypes (int32 ids, categoricals, float32 scores)
+    COMPACT_DTYPES: bool = True
+    # Uvicorn worker processes; above 1 they share a memory-mapped data snapshot
+    WORKERS: int = 1
+    # Where snapshots are published (default: "<DB_PATH>.snapshot")
+    SNAPSHOT_DIR: Optional[str] = None
+    # Warm the page cache, sales aggregates and similarity matrix on startup
+    WARMUP: bool = True
+    # Keep JSON responses on disk per data version, so they survive restarts
+    PAYLOAD_CACHE: bool = True
+    # Where cached responses are kept (default: "<DB_PATH>.cache")
+    PAYLOAD_CACHE_DIR: Optional[str] = None
+    # ... and the disk space they may take up, in MiB (least recently used are evicted)
+    PAYLOAD_CACHE_MB: int = 512
+    # Customer and product profiles kept in memory per process (0 = no cache) ...
+    PROFILE_CACHE_SIZE: int = 1024
+    # ... and the memory they may take up, in MiB
+    PROFILE_CACHE_MB: int = 256
+    # How often live dashboard streams check the data version, in seconds
+    LIVE_POLL_SECONDS: float = 2.0
+    # Idle live dashboard streams get a heartbeat comment this often, in seconds
+    LIVE_HEARTBEAT_SECONDS: float = 15.0
+    # Seconds a request may compute before it is cancelled with 504, by path
+    # prefix (longest match wins) ...
+    REQUEST_DEADLINES: Dict[str, float] = {"/customers/": 10.0, "/products/": 10.0, "/insights/": 20.0}
+    # ... and for every other path (None = no limit)
+    DEFAULT_DEADLINE_SECONDS: Optional[float] = 30.0
+    # Endpoint class of each path prefix for admission control (longest match
+    # wins, None = not limited); every other path is "light"
+    ADMISSION_CLASSES: Dict[str, Optional[str]] = {
+        "/customers/": "heavy",
+        "/products/": "heavy",
+        "/insights/": "heavy",
+        "/dashboard": "heavy",
+        "/dashboard/stream": None,
+        "/cohorts": "heavy",
+        "/support/": "heavy",
+        "/suppliers": "heavy",
+        # Downloads hold their slot until the last byte is sent
+        "/export/": "export",
+        "/ingest/": None,
+    }
+    # Requests of each class running at once; keep the sum below the threadpool size (40)
+    ADMISSION_LIMITS: Dict[str, int] = {"heavy": 8, "export": 4, "light": 24}
+    # Requests of each class that may wait for a slot, and for how many seconds, before 503
+    ADMISSION_QUEUE_SIZES: Dict[str, int] = {"heavy": 32, "export": 8, "light": 256}
+    ADMISSION_QUEUE_SECONDS: Dict[str, float] = {"heavy": 5.0, "export": 5.0, "light": 1.0}
+    # Entries of the overview's top customers and of each product's top buyers
+    LEADERBOARD_SIZE: int = 5
+    # Batches waiting for the ingest writer before POST /ingest/* answers 503 ...
+    INGEST_QUEUE_SIZE: int = 256
+    # ... and the rows one batch may carry
+    INGEST_MAX_BATCH_ROWS: int = 10000
+    # The ingest writer commits up to this many queued rows in one transaction,
+    # waiting up to INGEST_GROUP_WAIT_SECONDS for more batches to join it
+    INGEST_GROUP_ROWS: int = 50000
+    INGEST_GROUP_WAIT_SECONDS: float = 0.0
+    # Seconds an ingest waits for the database write lock held by another worker's writer
+    INGEST_BUSY_TIMEOUT_SECONDS: float = 30.0
+    # Secret the X-Profile-Token header must carry to profile requests (None = profiling off)
+    PROFILE_TOKEN: Optional[str] = None
+    # Seconds between stack samples of a profiled request
+    PROFILE_INTERVAL_SECONDS: float = 0.005
+    # Where profiles are written (default: "<DB_PATH>.profiles") and how many are kept
+    PROFILE_DIR: Optional[str] = None
+    PROFILE_KEEP: int = 50
 
 
 def get_config():
@@ -15,4 +102,25 @@ def get_config():
     return config_data
 
 
-config: Config = get_config()
+class LazyConfig:
+    """
+    Stands in for the Config until an attribute is first read or set, so
+    importing a module that uses the config does not read env.json.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_config", None)
+
+    def _load(self) -> Config:
+        if self._config is None:
+            object.__setattr__(self, "_config", get_config())
+        return self._config
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+
+config: Config = LazyConfig()
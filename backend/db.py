@@ -0,0 +1,255 @@
+import sqlite3
+from config import config
+from deadline import current_deadline
+from profiling import track_thread
+
+# Date-leading indexes let range-filtered analytics scan only the rows in the
+# requested window. The date-only indexes include the columns the overview and
+# insight queries read, so those range scans never touch the base table.
+INDEXES = [
+    """CREATE INDEX IF NOT EXISTS idx_sales_date
+       ON sales_transactions (transaction_date, customer_id, product_id, sale_amount)""",
+    """CREATE INDEX IF NOT EXISTS idx_sales_customer_date
+       ON sales_transactions (customer_id, transaction_date)""",
+    """CREATE INDEX IF NOT EXISTS idx_sales_product_date
+       ON sales_transactions (product_id, transaction_date)""",
+    """CREATE INDEX IF NOT EXISTS idx_tickets_date
+       ON support_tickets (creation_date, customer_id, product_id, sentiment_score, status)""",
+    """CREATE INDEX IF NOT EXISTS idx_tickets_customer_date
+       ON support_tickets (customer_id, creation_date)""",
+    """CREATE INDEX IF NOT EXISTS idx_tickets_product_date
+       ON support_tickets (product_id, creation_date)""",
+    # Leaderboard walks look each ranked id up, to skip ids that are not listed
+    "CREATE INDEX IF NOT EXISTS idx_customers_id ON customers (customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_id ON products (product_id)",
+]
+
+
+def connect(db_path=None) -> sqlite3.Connection:
+    """
+    Open the analytics database. Inside a request, queries on the connection
+    are aborted when the request's deadline passes or its client disconnects,
+    and a profiled request starts sampling the calling thread.
+    """
+    conn = sqlite3.connect(db_path or config.DB_PATH)
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.attach(conn)
+    track_thread()
+    return conn
+
+
+def ensure_indexes(conn: sqlite3.Connection):
+    """
+    Create the analytics indexes if they do not exist yet.
+    """
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+
+# Sales are also stored month-partitioned, one table per calendar month
+# (sales_transactions_2024_01, ...), so aggregates can be computed shard by
+# shard in parallel. `sales_shards` is the catalog of the shard tables.
+SHARD_CATALOG = "sales_shards"
+
+
+def shard_table(month: str) -> str:
+    """
+    Name of the shard table holding a "YYYY-MM" month of sales.
+    """
+    return "sales_transactions_" + month.replace("-", "_")
+
+
+def build_sales_shards(conn: sqlite3.Connection):
+    """
+    (Re)build the month shards of sales_transactions and their catalog.
+    """
+    for (table,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'sales_transactions_[0-9]*'"
+    ).fetchall():
+        conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"DROP TABLE IF EXISTS {SHARD_CATALOG}")
+    conn.execute(
+        f"CREATE TABLE {SHARD_CATALOG} (month TEXT PRIMARY KEY, table_name TEXT NOT NULL, row_count INTEGER NOT NULL)"
+    )
+
+    months = [
+        row[0]
+        for row in conn.execute(
+            "SELECT DISTINCT substr(transaction_date, 1, 7) FROM sales_transactions ORDER BY 1"
+        ).fetchall()
+    ]
+    for month in months:
+        table = shard_table(month)
+        conn.execute(
+            f"CREATE TABLE {table} AS SELECT * FROM sales_transactions WHERE transaction_date >= ? AND transaction_date < ?",
+            (month, next_month(month)),
+        )
+        (row_count,) = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        conn.execute(f"INSERT INTO {SHARD_CATALOG} VALUES (?, ?, ?)", (month, table, row_count))
+    conn.commit()
+
+
+def ensure_sales_shards(conn: sqlite3.Connection):
+    """
+    Build the month shards if the database was ingested before they existed.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SHARD_CATALOG,)
+    ).fetchone()
+    if not exists:
+        build_sales_shards(conn)
+
+
+def list_sales_shards(conn: sqlite3.Connection, date_range=None):
+    """
+    (month, table_name, row_count) of the shards overlapping a DateRange.
+    Returns None when the database has no shard catalog.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SHARD_CATALOG,)
+    ).fetchone()
+    if not exists:
+        return None
+    conditions, params = [], []
+    if date_range is not None and date_range.start:
+        conditions.append("month >= ?")
+        params.append(date_range.start.strftime("%Y-%m"))
+    if date_range is not None and date_range.end:
+        conditions.append("month <= ?")
+        params.append(date_range.end.strftime("%Y-%m"))
+    where = " AND ".join(conditions) or "1 = 1"
+    return conn.execute(
+        f"SELECT month, table_name, row_count FROM {SHARD_CATALOG} WHERE {where} ORDER BY month", params
+    ).fetchall()
+
+
+def next_month(month: str) -> str:
+    """
+    The "YYYY-MM" month after `month`.
+    """
+    year, month = int(month[:4]), int(month[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def get_data_version(conn: sqlite3.Connection) -> int:
+    """
+    Counter bumped by every write to the analytics data (0 if never written).
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def bump_data_version(conn: sqlite3.Connection) -> int:
+    """
+    Increment the data version inside the caller's transaction and return it.
+    """
+    version = get_data_version(conn) + 1
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('data_version', ?)", (str(version),))
+    return version
+
+
+# Purchase counts and quantities per (customer, product): the sparse customer x
+# product matrix behind similar-customer and next-product recommendations.
+PURCHASES_TABLE = "customer_product_purchases"
+# Ranks each product's buyers, so its top buyers are the first index entries
+PURCHASES_RANK_INDEX = f"""CREATE INDEX IF NOT EXISTS idx_{PURCHASES_TABLE}_rank
+    ON {PURCHASES_TABLE} (product_id, purchase_count DESC, customer_id)"""
+
+
+def build_customer_product_purchases(conn: sqlite3.Connection):
+    """
+    (Re)build the customer x product purchase counts from sales_transactions.
+    """
+    conn.execute(f"DROP TABLE IF EXISTS {PURCHASES_TABLE}")
+    conn.execute(
+        f"""
+        CREATE TABLE {PURCHASES_TABLE} (
+            customer_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            purchase_count INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (customer_id, product_id)
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO {PURCHASES_TABLE} (customer_id, product_id, purchase_count, quantity)
+        SELECT customer_id, product_id, COUNT(*), COALESCE(SUM(quantity), 0)
+        FROM sales_transactions
+        GROUP BY customer_id, product_id
+        """
+    )
+    conn.execute(PURCHASES_RANK_INDEX)
+    conn.commit()
+
+
+def ensure_customer_product_purchases(conn: sqlite3.Connection):
+    """
+    Build the purchase counts if the database was ingested before they existed.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (PURCHASES_TABLE,)
+    ).fetchone()
+    if not exists:
+        build_customer_product_purchases(conn)
+    conn.execute(PURCHASES_RANK_INDEX)
+
+
+def insert_rows(conn: sqlite3.Connection, table: str, rows):
+    """
+    Insert a DataFrame's rows into an existing table. Does not commit, unlike
+    DataFrame.to_sql, so the rows stay in the caller's transaction.
+    """
+    columns = ", ".join(rows.columns)
+    placeholders = ", ".join("?" * len(rows.columns))
+    conn.executemany(
+        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+        rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None),
+    )
+
+
+def append_to_sales_shards(conn: sqlite3.Connection, sales):
+    """
+    Copy newly appended sales rows into their month shards, creating shards
+    for new months. Does not commit.
+    """
+    ensure_sales_shards(conn)
+    months = sales["transaction_date"].astype(str).str[:7]
+    for month, rows in sales.groupby(months):
+        table = shard_table(month)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM sales_transactions WHERE 0")
+        insert_rows(conn, table, rows)
+        conn.execute(
+            f"""
+            INSERT INTO {SHARD_CATALOG} (month, table_name, row_count) VALUES (?, ?, ?)
+            ON CONFLICT (month) DO UPDATE SET row_count = row_count + excluded.row_count
+            """,
+            (month, table, len(rows)),
+        )
+
+
+def add_customer_product_purchases(conn: sqlite3.Connection, sales):
+    """
+    Add newly appended sales rows to the purchase counts. Does not commit.
+    """
+    ensure_customer_product_purchases(conn)
+    quantity = sales["quantity"] if "quantity" in sales.columns else 0
+    counts = (
+        sales.assign(quantity=quantity)
+        .groupby(["customer_id", "product_id"])
+        .agg(purchase_count=("quantity", "size"), quantity=("quantity", "sum"))
+        .reset_index()
+    )
+    conn.executemany(
+        f"""
+        INSERT INTO {PURCHASES_TABLE} (customer_id, product_id, purchase_count, quantity) VALUES (?, ?, ?, ?)
+        ON CONFLICT (customer_id, product_id) DO UPDATE SET
+            purchase_count = purchase_count + excluded.purchase_count,
+            quantity = quantity + excluded.quantity
+        """,
+        ((int(r.customer_id), int(r.product_id), int(r.purchase_count), int(r.quantity)) for r in counts.itertuples()),
+    )
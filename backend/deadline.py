@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import sqlite3
+import threading
+import time
+
+# SQLite calls the progress handler every this many virtual machine instructions
+PROGRESS_INSTRUCTIONS = 10000
+
+_current = ContextVar("deadline", default=None)
+# Cancelled requests per reason and deadline prefix
+_cancellations = {}
+_cancellations_lock = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised inside a request whose deadline passed or whose client went away.
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"Request cancelled ({reason})")
+        self.reason = reason
+
+
+class Deadline:
+    """
+    Time limit and cancellation flag of one request. Connections opened
+    with db.connect() while it is current abort their queries once it
+    triggers: through a progress handler when time runs out, and through
+    Connection.interrupt() straight away when the request is cancelled.
+    Code between queries calls check_deadline() to stop pandas work.
+    """
+
+    def __init__(self, seconds=None):
+        self.expires = time.monotonic() + seconds if seconds else None
+        self.reason = None  # "timeout" or "disconnect" once triggered
+        self._lock = threading.Lock()
+        self._connections = []
+
+    @property
+    def triggered(self):
+        if self.reason is None and self.expires is not None and time.monotonic() > self.expires:
+            self.reason = "timeout"
+        return self.reason is not None
+
+    def check(self):
+        if self.triggered:
+            raise DeadlineExceeded(self.reason)
+
+    def cancel(self, reason):
+        """
+        Trigger now and interrupt the queries running on its connections.
+        """
+        if self.reason is None:
+            self.reason = reason
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.interrupt()
+            except sqlite3.ProgrammingError:  # already closed
+                pass
+
+    def disarm(self):
+        """
+        Stop the clock, e.g. once a streaming response has started. Cancellation still applies.
+        """
+        self.expires = None
+
+    def attach(self, conn: sqlite3.Connection):
+        conn.set_progress_handler(lambda: 1 if self.triggered else 0, PROGRESS_INSTRUCTIONS)
+        with self._lock:
+            self._connections.append(conn)
+
+
+def current_deadline():
+    """
+    The Deadline of the request being served, or None.
+    """
+    return _current.get()
+
+
+def check_deadline():
+    """
+    Raise DeadlineExceeded if the current request's deadline has triggered.
+    """
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """
+    Make `deadline` current for this context and the threads it starts work in.
+    """
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def record_cancellation(reason, prefix):
+    with _cancellations_lock:
+        counts = _cancellations.setdefault(prefix, {"timeout": 0, "disconnect": 0})
+        counts[reason] += 1
+
+
+def cancellation_stats():
+    """
+    {"timeout": n, "disconnect": n, "by_prefix": {prefix: {...}}} for this process.
+    """
+    with _cancellations_lock:
+        by_prefix = {prefix: dict(counts) for prefix, counts in _cancellations.items()}
+    return {
+        "timeout": sum(counts["timeout"] for counts in by_prefix.values()),
+        "disconnect": sum(counts["disconnect"] for counts in by_prefix.values()),
+        "by_prefix": by_prefix,
+    }
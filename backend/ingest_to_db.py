@@ -1,11 +1,41 @@
 import sqlite3
 import pandas as pd
+import argparse
 import os
+from db import ensure_indexes, build_sales_shards, build_customer_product_purchases, bump_data_version
+from config import config
+from services import IngestService
+from services.anomalies import AnomalyEngine
+from services.cohorts import CohortCube
+from services.sla import SlaHistograms
+from services.suppliers import SupplierMetrics
+from services.approx import ApproxStore
+from services.profile_cache import ProfileTouches
+from services.leaderboards import Leaderboards
+from services.snapshot import snapshots
+from services.payload_cache import payload_cache
 
 # Ensure 'data' folder exists
 DATA_DIR = 'data'
 DB_PATH = 'database.db'
 
+parser = argparse.ArgumentParser(description='Load the CSVs in data/ into the SQLite database.')
+parser.add_argument('--append-tickets', metavar='CSV',
+                    help='Append the support tickets in CSV instead of reloading everything')
+parser.add_argument('--append-transactions', metavar='CSV',
+                    help='Append the sales transactions in CSV instead of reloading everything')
+args = parser.parse_args()
+
+# Incremental path: insert the new rows and update the derived analytics state
+if args.append_transactions:
+    version = IngestService().append_transactions(pd.read_csv(args.append_transactions))
+    print(f'Appended transactions from {args.append_transactions} (data version {version})')
+if args.append_tickets:
+    version = IngestService().append_tickets(pd.read_csv(args.append_tickets))
+    print(f'Appended tickets from {args.append_tickets} (data version {version})')
+if args.append_transactions or args.append_tickets:
+    raise SystemExit
+
 # 1. Connect to SQLite DB (creates one if it doesn't exist)
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
@@ -17,9 +47,50 @@ sales_df = pd.read_csv(os.path.join(DATA_DIR, 'sales_transactions.csv'))
 support_df = pd.read_csv(os.path.join(DATA_DIR, 'support_tickets.csv'))
 suppliers_df = pd.read_csv(os.path.join(DATA_DIR, 'supplier_data.csv'))
 
+# Store dates as ISO strings so date-range filters are plain string comparisons
+# (sales_transactions.csv uses day-first dates)
+for df, column in [
+    (customers_df, 'join_date'),
+    (sales_df, 'transaction_date'),
+    (support_df, 'creation_date'),
+    (support_df, 'resolution_date'),
+]:
+    df[column] = pd.to_datetime(df[column], dayfirst=True).dt.strftime('%Y-%m-%d')
+
 # 3. Write DataFrames to SQLite
 customers_df.to_sql('customers', conn, if_exists='replace', index=False)
 products_df.to_sql('products', conn, if_exists='replace', index=False)
 sales_df.to_sql('sales_transactions', conn, if_exists='replace', index=False)
 support_df.to_sql('support_tickets', conn, if_exists='replace', index=False)
-suppliers_df.to_sql('supplier_data', conn, if_exists='replace', index=False)
\ No newline at end of file
+suppliers_df.to_sql('supplier_data', conn, if_exists='replace', index=False)
+
+# 4. Index the fact tables for date-range queries
+ensure_indexes(conn)
+
+# 5. Write month-partitioned shards of the sales for parallel aggregation
+build_sales_shards(conn)
+
+# 6. Count purchases per customer and product for similarity and recommendations
+build_customer_product_purchases(conn)
+
+# 7. Rebuild the incrementally maintained anomaly state, cohort cube, SLA histograms,
+#    supplier metrics, approximate-query sketches and leaderboards, and mark every
+#    profile as changed
+AnomalyEngine(conn, config.ANOMALY_WINDOW_DAYS).rebuild()
+CohortCube(conn).rebuild()
+SlaHistograms(conn).rebuild()
+SupplierMetrics(conn).rebuild()
+ApproxStore(conn).rebuild()
+Leaderboards(conn).rebuild()
+ProfileTouches(conn).rebuild()
+
+bump_data_version(conn)
+conn.commit()
+conn.close()
+
+# 8. Replace the shared snapshot read by multi-worker servers, if there is one
+if snapshots.enabled():
+    snapshots.publish()
+
+# 9. Drop cached responses: a recreated database can repeat an old data version
+payload_cache.clear()
@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import json
+import logging
+import sqlite3
+
+import anyio.to_thread
+
+from config import config
+from db import get_data_version
+
+logger = logging.getLogger(__name__)
+
+
+def merge_patch(old, new):
+    """
+    JSON merge patch (RFC 7396) turning `old` into `new`: changed keys with
+    their new value, removed keys as null. Lists and scalars are replaced whole.
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    patch = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            patch[key] = merge_patch(old[key], value)
+    return patch
+
+
+class LiveDashboard:
+    """
+    Pushes dashboard sections to Server-Sent Event subscribers when the
+    data version changes. One poller task watches the version while anyone
+    is subscribed; each new version's dashboard is computed once, in a
+    worker thread, and every subscriber is woken to send it. Subscribers
+    that saw the previous version get a merge-patch "delta", others (new or
+    lagging connections) a full "snapshot". Idle connections only cost an
+    asyncio.Event and get a comment line every heartbeat interval.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.payload = None
+        self._previous = None  # (version, payload) the latest delta is relative to
+        self._subscribers = set()
+        self._poller = None
+
+    async def stream(self, sections=None):
+        """
+        Async generator of SSE messages for one connection.
+        """
+        from services.dashboard import SECTIONS
+
+        sections = sections or SECTIONS
+        wake = asyncio.Event()
+        self._subscribers.add(wake)
+        self._ensure_poller()
+        sent_version = None
+        try:
+            if self.payload is not None:
+                wake.set()
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=config.LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                wake.clear()
+                version, payload = self.version, self.payload
+                if version == sent_version:
+                    continue
+                current = {section: payload[section] for section in sections}
+                if self._previous is not None and self._previous[0] == sent_version:
+                    previous = {section: self._previous[1][section] for section in sections}
+                    event, data = "delta", merge_patch(previous, current)
+                else:
+                    event, data = "snapshot", current
+                sent_version = version
+                yield f"event: {event}\nid: {version}\ndata: {json.dumps({'version': version, 'data': data})}\n\n"
+        finally:
+            self._subscribers.discard(wake)
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+    def _ensure_poller(self):
+        if self._poller is None or self._poller.done():
+            # A fresh context: the poller must not inherit the first subscriber's request deadline
+            self._poller = asyncio.get_running_loop().create_task(self._poll(), context=contextvars.Context())
+
+    async def _poll(self):
+        from services.dashboard import DashboardService
+
+        while self._subscribers:
+            try:
+                version = await anyio.to_thread.run_sync(self._read_version)
+                if version != self.version:
+                    payload = await anyio.to_thread.run_sync(DashboardService().get_dashboard)
+                    if self.payload is not None:
+                        self._previous = (self.version, self.payload)
+                    self.version, self.payload = version, payload
+                    for wake in self._subscribers:
+                        wake.set()
+            except Exception:
+                # Keep the streams alive; the next poll retries
+                logger.exception("Live dashboard update failed")
+            await asyncio.sleep(config.LIVE_POLL_SECONDS)
+
+    def _read_version(self):
+        conn = sqlite3.connect(config.DB_PATH)
+        try:
+            return get_data_version(conn)
+        finally:
+            conn.close()
+
+
+live_dashboard = LiveDashboard()
@@ -1,10 +1,114 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers import insights_router
+from middleware import (
+    AdmissionMiddleware,
+    CompressionMiddleware,
+    DeadlineMiddleware,
+    PayloadCacheMiddleware,
+    ProfilerMiddleware,
+)
+from live import live_dashboard
+from writer import ingest_writer
+from db import ensure_indexes, ensure_sales_shards, ensure_customer_product_purchases
+from services.payload_cache import payload_cache
+import anyio.to_thread
+import os
+import sqlite3
+import sys
+import threading
 import uvicorn
 from config import config
 
-app = FastAPI()
+
+def prepare_database():
+    # Databases ingested before the analytics indexes, month shards, purchase
+    # matrix, anomaly state, cohort cube, SLA histograms, supplier metrics,
+    # approximate-query sketches, profile touches and leaderboards existed get
+    # them on startup. The derived tables are imported here, not by the app,
+    # because they pull in pandas
+    from services.anomalies import AnomalyEngine
+    from services.cohorts import CohortCube
+    from services.sla import SlaHistograms
+    from services.suppliers import SupplierMetrics
+    from services.approx import ApproxStore
+    from services.profile_cache import ProfileTouches
+    from services.leaderboards import Leaderboards
+
+    conn = sqlite3.connect(config.DB_PATH)
+    ensure_indexes(conn)
+    ensure_sales_shards(conn)
+    ensure_customer_product_purchases(conn)
+    AnomalyEngine(conn, config.ANOMALY_WINDOW_DAYS).ensure()
+    CohortCube(conn).ensure()
+    SlaHistograms(conn).ensure()
+    SupplierMetrics(conn).ensure()
+    ApproxStore(conn).ensure()
+    ProfileTouches(conn).ensure()
+    Leaderboards(conn).ensure()
+    conn.close()
+
+
+def warm_up():
+    # Ask the kernel to read the database into the page cache, then pay for
+    # what the first requests would otherwise wait on: starting the
+    # aggregation workers and building the similarity matrix
+    from services.aggregates import SalesAggregator
+    from services.similarity import similarity_index
+
+    with open(config.DB_PATH, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+    SalesAggregator().warm_up()
+    conn = sqlite3.connect(config.DB_PATH)
+    try:
+        similarity_index.matrix(conn)
+    finally:
+        conn.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In multi-worker mode the parent process already prepared the database
+    if config.WORKERS <= 1:
+        prepare_database()
+    if config.WARMUP:
+        # In the background: requests are served while it runs
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    await live_dashboard.stop()
+    # Commit the rows still queued for the ingest writer
+    await anyio.to_thread.run_sync(ingest_writer.stop)
+    # Only an imported aggregates module can have started a worker pool
+    if "services.aggregates" in sys.modules:
+        sys.modules["services.aggregates"].shutdown_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+# Innermost, so cancelled requests are still answered through CORS and compression
+app.add_middleware(
+    DeadlineMiddleware, deadlines=config.REQUEST_DEADLINES, default=config.DEFAULT_DEADLINE_SECONDS
+)
+# Outside the deadlines, so time spent queued does not count against them,
+# and inside the payload cache, so cache hits are never queued
+app.add_middleware(
+    AdmissionMiddleware,
+    classes=config.ADMISSION_CLASSES,
+    limits=config.ADMISSION_LIMITS,
+    queue_sizes=config.ADMISSION_QUEUE_SIZES,
+    queue_seconds=config.ADMISSION_QUEUE_SECONDS,
+)
+if config.PAYLOAD_CACHE:
+    # Inside CORS and compression, so cached bodies are uncompressed and still get CORS headers
+    app.add_middleware(
+        PayloadCacheMiddleware,
+        cache=payload_cache,
+        routes=insights_router.routes,
+        exclude=["/export", "/cache", "/metrics", "/profiles", "/dashboard/stream"],
+    )
+# Outside the payload cache, so profiled requests are computed, not served from it
+app.add_middleware(ProfilerMiddleware, token=config.PROFILE_TOKEN, interval=config.PROFILE_INTERVAL_SECONDS)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -12,10 +116,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=config.COMPRESSION_MIN_SIZE)
 app.include_router(insights_router, tags=["Insights Dashboard"])
 
 
 def main():
+    if config.WORKERS > 1:
+        # This process is the loader: it prepares the database and publishes
+        # the shared snapshot once, then the workers map it read-only
+        from services.snapshot import snapshots
+
+        prepare_database()
+        snapshots.publish()
+        uvicorn.run("main:app", host="0.0.0.0", port=config.PORT, workers=config.WORKERS)
+        return
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,413 @@
+from datetime import date
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import gzip
+import hmac
+import json
+import sqlite3
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+
+from admission import Rejected, admission_class
+from config import config
+from db import get_data_version
+from deadline import Deadline, deadline_scope, record_cancellation
+from profiling import ProfileSession, profile_name, profile_scope, save_profile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is used when it is missing
+    brotli = None
+
+# Bodies above this size are compressed in a worker thread instead of on the event loop
+THREAD_MINIMUM_SIZE = 256 * 1024
+
+
+class CompressionMiddleware:
+    """
+    Compress complete (non-streaming) responses with brotli or gzip, whichever
+    the client accepts, when the body is at least `minimum_size` bytes.
+    Streaming responses and responses that already set Content-Encoding
+    (e.g. gzipped exports) are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Hold the headers until we know whether the body gets compressed
+                start_message = message
+                if "content-encoding" in Headers(raw=message["headers"]):
+                    passthrough = True
+                    await send(start_message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= THREAD_MINIMUM_SIZE:
+                body = await anyio.to_thread.run_sync(self._compress, body, encoding)
+            else:
+                body = self._compress(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _choose_encoding(self, accept_encoding):
+        """
+        Pick brotli or gzip from an Accept-Encoding header, honouring q=0.
+        """
+        accepted = set()
+        for part in accept_encoding.lower().split(","):
+            token, _, params = part.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(token.strip())
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+
+class PayloadCacheMiddleware:
+    """
+    Serve GET requests with a JSON response from an on-disk PayloadCache,
+    keyed by data version, path, the query parameters the matching route in
+    `routes` declares (others cannot change the response, so they do not
+    add entries), Accept header (it can pick the response format) and
+    today's date (relative date ranges and "as of today" defaults depend on
+    it). Misses are computed as usual and stored once their body is
+    complete. Requests with "Cache-Control: no-cache" skip the lookup but
+    refresh the entry. Paths starting with one of `exclude` (e.g. streamed
+    exports) and paths no route serves are never cached.
+    """
+
+    def __init__(self, app, cache, routes=(), exclude=()):
+        self.app = app
+        self.cache = cache
+        self.routes = routes
+        self.exclude = tuple(exclude)
+        self._query_names = {}  # route path -> names of its query parameters
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+        names = self._declared_query(scope)
+        if names is None:
+            await self.app(scope, receive, send)
+            return
+
+        pairs = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        query = urlencode(sorted((name, value) for name, value in pairs if name in names))
+        headers = Headers(scope=scope)
+        key = f"{scope['path']}?{query}|{headers.get('accept', '')}@{date.today().isoformat()}"
+        refresh = "no-cache" in headers.get("cache-control", "")
+        version, body = await anyio.to_thread.run_sync(self._lookup, key, refresh)
+        if body is not None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"x-payload-cache", b"hit"),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        cacheable = False
+        chunks = []
+
+        async def send_and_store(message):
+            nonlocal cacheable
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                cacheable = (
+                    message["status"] == 200
+                    and headers.get("content-type", "").startswith("application/json")
+                    and "content-encoding" not in headers
+                )
+                if cacheable:
+                    MutableHeaders(raw=message["headers"])["X-Payload-Cache"] = "miss"
+            await send(message)
+            if message["type"] == "http.response.body" and cacheable:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await anyio.to_thread.run_sync(self.cache.put, version, key, b"".join(chunks))
+
+        await self.app(scope, receive, send_and_store)
+
+    def _declared_query(self, scope):
+        """
+        Names of the query parameters of the route serving this request,
+        including those of its dependencies; None when no route serves it.
+        """
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                if route.path not in self._query_names:
+                    dependants, names = [getattr(route, "dependant", None)], set()
+                    while dependants:
+                        dependant = dependants.pop()
+                        if dependant is not None:
+                            names.update(param.alias for param in dependant.query_params)
+                            dependants.extend(dependant.dependencies)
+                    self._query_names[route.path] = frozenset(names)
+                return self._query_names[route.path]
+        return None
+
+    def _lookup(self, key, refresh):
+        conn = sqlite3.connect(config.DB_PATH)
+        try:
+            version = get_data_version(conn)
+        finally:
+            conn.close()
+        return version, None if refresh else self.cache.get(version, key)
+
+
+class DeadlineMiddleware:
+    """
+    Give every HTTP request a Deadline: the seconds of the longest path
+    prefix in `deadlines`, else `default` (None: no time limit). A client
+    disconnect cancels the request too. Work that notices the deadline
+    raises (DeadlineExceeded or an interrupted query); timeouts are answered
+    with 504, abandoned requests get no response. The clock stops when the
+    response starts, so streams only end on disconnect. Cancellations are
+    counted per deadline prefix (see deadline.cancellation_stats()).
+    """
+
+    def __init__(self, app, deadlines=None, default=None):
+        self.app = app
+        self.deadlines = sorted((deadlines or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        prefix, seconds = self._match(scope["path"])
+        deadline = Deadline(seconds)
+        messages = asyncio.Queue()
+
+        async def watch_disconnect():
+            # Reads the client's messages on behalf of the app, so a disconnect
+            # is seen even while the app is busy computing
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    deadline.cancel("disconnect")
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        started = False
+
+        async def send_started(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                deadline.disarm()
+            await send(message)
+
+        watcher = asyncio.get_running_loop().create_task(watch_disconnect())
+        try:
+            with deadline_scope(deadline):
+                await self.app(scope, messages.get, send_started)
+        except Exception:
+            if deadline.reason is None:
+                raise
+            record_cancellation(deadline.reason, prefix)
+            if deadline.reason == "timeout" and not started:
+                body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 504,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                    }
+                )
+                await send({"type": "http.response.body", "body": body})
+        finally:
+            watcher.cancel()
+
+    def _match(self, path):
+        for prefix, seconds in self.deadlines:
+            if path.startswith(prefix):
+                return prefix, seconds
+        return "*", self.default
+
+
+class AdmissionMiddleware:
+    """
+    Admission control per endpoint class. `classes` maps path prefixes to
+    class names (longest match wins; None leaves the path unlimited) and
+    other paths belong to `default_class`. `limits`, `queue_sizes` and
+    `queue_seconds` configure each class (see admission.AdmissionClass).
+    Shed requests are answered with 503 and Retry-After, so a saturated
+    class of expensive endpoints cannot take the threadpool from cheap ones.
+    """
+
+    def __init__(self, app, classes, limits, queue_sizes, queue_seconds, default_class="light"):
+        self.app = app
+        self.classes = sorted(classes.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_class = default_class
+        self.admissions = {
+            name: admission_class(name, limit, queue_sizes[name], queue_seconds[name])
+            for name, limit in limits.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        admission = self.admissions.get(self._match(scope["path"])) if scope["type"] == "http" else None
+        if admission is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            async with admission.slot():
+                await self.app(scope, receive, send)
+        except Rejected as rejected:
+            body = json.dumps({"detail": "Server busy, retry later"}).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", str(rejected.retry_after).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+
+    def _match(self, path):
+        for prefix, name in self.classes:
+            if path.startswith(prefix):
+                return name
+        return self.default_class
+
+
+class ProfilerMiddleware:
+    """
+    Run requests asking for it (`?profile=1` or an "X-Profile: 1" header)
+    under a sampling ProfileSession, if they carry `token` in
+    "X-Profile-Token"; others asking for it get 403, as does everyone when
+    no token is configured. The request bypasses the payload and profile
+    caches, and its speedscope profile, tagged with method, path, query
+    parameters, status, duration and data version, is written to the
+    profile directory. The file name is sent in an "X-Profile" header.
+    """
+
+    def __init__(self, app, token=None, interval=0.005):
+        self.app = app
+        self.token = token
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        params = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") != "1" and ("profile", "1") not in params:
+            await self.app(scope, receive, send)
+            return
+        if not self.token or not hmac.compare_digest(headers.get("x-profile-token", ""), self.token):
+            body = json.dumps({"detail": "Profiling not allowed"}).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 403,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        params = [(key, value) for key, value in params if key != "profile"]
+        scope = dict(scope)
+        scope["query_string"] = urlencode(params).encode("latin-1")
+        scope["headers"] = [
+            (key, value) for key, value in scope["headers"] if key not in (b"cache-control", b"x-profile", b"x-profile-token")
+        ] + [(b"cache-control", b"no-cache")]
+
+        name = profile_name(scope["method"], scope["path"])
+        status = None
+
+        async def send_tagged(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(raw=message["headers"])["X-Profile"] = name
+            await send(message)
+
+        session = ProfileSession(self.interval)
+        session.start()
+        try:
+            with profile_scope(session):
+                await self.app(scope, receive, send_tagged)
+        finally:
+            session.stop()
+            await anyio.to_thread.run_sync(self._save, session, name, scope, params, status)
+
+    def _save(self, session, name, scope, params, status):
+        conn = sqlite3.connect(config.DB_PATH)
+        try:
+            version = get_data_version(conn)
+        finally:
+            conn.close()
+        metadata = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "params": dict(params),
+            "status": status,
+            "seconds": round(session.finished - session.started, 6),
+            "data_version": version,
+            "interval": self.interval,
+        }
+        save_profile(session.speedscope(f"{scope['method']} {scope['path']}", metadata), name)
@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from config import config
+
+_current = ContextVar("profile_session", default=None)
+
+
+def profile_dir(db_path=None):
+    """
+    Directory profiles of a database's requests are written to.
+    """
+    return config.PROFILE_DIR or f"{db_path or config.DB_PATH}.profiles"
+
+
+class ProfileSession:
+    """
+    Statistical profile of one request. A sampler thread records the stacks
+    of the threads doing the request's work every `interval` seconds:
+    threads join through track_thread(), which db.connect() calls, so the
+    threadpool workers running its services are sampled without profiling
+    the rest of the server. Pooled aggregation shards run in other processes
+    and show up as time spent waiting on them.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.threads = set()
+        self.started = None
+        self.finished = None
+        self._samples = {}  # thread id -> list of (stack, weight)
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.finished = time.perf_counter()
+
+    def speedscope(self, name, metadata):
+        """
+        The samples in speedscope's file format, one profile per sampled thread.
+        """
+        frames, index = [], {}
+        profiles = []
+        for thread_id, samples in self._samples.items():
+            stacks = []
+            for stack, _ in samples:
+                ids = []
+                for frame in stack:
+                    if frame not in index:
+                        index[frame] = len(frames)
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                    ids.append(index[frame])
+                stacks.append(ids)
+            weights = [weight for _, weight in samples]
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": f"{name} (thread {thread_id})",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": stacks,
+                    "weights": weights,
+                }
+            )
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "contexq-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "metadata": metadata,
+        }
+
+    def _sample(self):
+        previous = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, previous = now - previous, now
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._samples.setdefault(thread_id, []).append((_stack(frame), weight))
+
+
+def _stack(frame):
+    """
+    (function, file, line) of every frame, outermost first.
+    """
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, frame.f_lineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def current_session():
+    """
+    The ProfileSession of the request being served, or None.
+    """
+    return _current.get()
+
+
+def track_thread():
+    """
+    Sample the calling thread for the current request's profile, if it is profiled.
+    """
+    session = _current.get()
+    if session is not None:
+        session.threads.add(threading.get_ident())
+
+
+@contextmanager
+def profile_scope(session):
+    """
+    Make `session` current for this context and the threads it starts work in.
+    """
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
+
+
+def profile_name(method, path):
+    """
+    File name for a new profile of a request: timestamp, method and path.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", f"{method} {path}").strip("-")[:80]
+    return f"{stamp}-{slug}.speedscope.json"
+
+
+def save_profile(document, name, root=None):
+    """
+    Write a speedscope document under the profile directory, keeping the
+    newest PROFILE_KEEP files.
+    """
+    root = root or profile_dir()
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f".{name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(document, f)
+    os.replace(tmp, os.path.join(root, name))
+    for old in list_profiles(root)[config.PROFILE_KEEP:]:
+        os.remove(os.path.join(root, old))
+
+
+def list_profiles(root=None):
+    """
+    Names of the saved profiles, newest first.
+    """
+    try:
+        names = os.listdir(root or profile_dir())
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if name.endswith(".speedscope.json")), reverse=True)
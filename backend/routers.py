@@ -1,43 +1,496 @@
-from fastapi import APIRouter, Query, Depends
-from fastapi.responses import JSONResponse
-from services import CustomerService,ProductService, OverViewService,InsightService
+from fastapi import APIRouter, Query, Depends, Request, HTTPException, Header
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+import asyncio
+import json
+from services.daterange import DateRange
+from live import live_dashboard
+from writer import QueueFull, ingest_writer
+from deadline import cancellation_stats
+from admission import admission_stats
+from profiling import list_profiles, profile_dir
+from config import config
+import hmac
+import os
+
+# The services and their pandas, numpy, pyarrow and scipy imports are
+# imported by the routes that use them, so importing the app stays cheap
 insights_router = APIRouter()
 
+FORMAT_QUERY = Query(None, pattern="^(json|arrow|parquet)$", description="json (default), arrow or parquet")
+TABLE_QUERY = Query(None, description="Table to return for arrow/parquet, e.g. sales_over_time")
+GRANULARITY_QUERY = Query("month", pattern="^(day|week|month|quarter)$", description="Time bucket of chart series")
+MAX_POINTS_QUERY = Query(None, ge=3, description="Downsample chart series to at most this many points")
+LAYOUT_QUERY = Query("records", pattern="^(records|columnar)$", description="JSON shape of chart and list fields")
+
+
+def get_date_range(
+    date_from: date = Query(None, alias="from", description="Earliest date (inclusive)"),
+    date_to: date = Query(None, alias="to", description="Latest date (inclusive)"),
+    last: str = Query(None, description="Relative window ending today, e.g. 90d, 12w, 6m or 1y"),
+):
+    try:
+        return DateRange.from_params(date_from, date_to, last)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+APPROX_QUERY = Query(None, description="Answer from sketches with error bounds (default: APPROX_MODE)")
+
+
+class CustomerProfilesRequest(BaseModel):
+    customer_ids: List[int]
+
+
+class ProductProfilesRequest(BaseModel):
+    product_ids: List[int]
+
+
+class TransactionIn(BaseModel):
+    transaction_id: Optional[int] = None
+    customer_id: int
+    product_id: int
+    quantity: int
+    sale_amount: float
+    transaction_date: date
+    sentiment_score: Optional[float] = None
+
+
+class TicketIn(BaseModel):
+    ticket_id: Optional[int] = None
+    customer_id: int
+    product_id: int
+    issue_type: str
+    status: str
+    creation_date: date
+    resolution_date: Optional[date] = None
+    sentiment_score: Optional[float] = None
+
+
+def _respond(request, frames, fmt=None, table=None, layout="records"):
+    """
+    Render a service payload as JSON, or one of its tables as an Arrow IPC
+    stream or Parquet file. The format comes from ?format= or the Accept header.
+    With layout="columnar", JSON tables are sent as {"column": [...]} dicts.
+    """
+    from services.serialization import (
+        ARROW_MEDIA_TYPE,
+        PARQUET_MEDIA_TYPE,
+        find_tables,
+        select_table,
+        to_arrow_ipc,
+        to_parquet,
+        to_python,
+    )
+
+    formats = {"arrow": ARROW_MEDIA_TYPE, "parquet": PARQUET_MEDIA_TYPE}
+    if fmt is None:
+        accept = request.headers.get("accept", "")
+        fmt = next((name for name, media_type in formats.items() if media_type in accept), "json")
+    if fmt == "json":
+        return to_python(frames, layout)
+
+    tables = find_tables(frames)
+    if not tables:
+        raise HTTPException(status_code=406, detail="This response has no tabular data")
+    try:
+        df = select_table(tables, table)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Choose one of these tables with ?table=: {', '.join(e.args[0])}")
+    try:
+        body = to_arrow_ipc(df) if fmt == "arrow" else to_parquet(df)
+    except ImportError:
+        raise HTTPException(status_code=406, detail="Arrow formats require pyarrow")
+    return Response(body, media_type=formats[fmt])
+
+
+def _ndjson(records):
+    """
+    Serialize an iterable of dicts as newline-delimited JSON, one line per record.
+    """
+    for record in records:
+        yield json.dumps(record) + "\n"
+
 
 @insights_router.get("/customers")
 def get_customers(
     search: str = Query(None, description="Search by name or region"),
 ):
+    from services import CustomerService
+
     return CustomerService().get_customers(search)
 
 
+@insights_router.post("/customers/profiles")
+def get_customer_profiles(request: CustomerProfilesRequest, date_range: DateRange = Depends(get_date_range)):
+    from services import CustomerService
+
+    profiles = CustomerService().get_customer_profiles(request.customer_ids, date_range)
+    return StreamingResponse(_ndjson(profiles), media_type="application/x-ndjson")
+
+
+@insights_router.get("/customers/{customer_id}/similar")
+def get_similar_customers(
+    request: Request,
+    customer_id: int,
+    k: int = Query(10, ge=1, le=100, description="Number of similar customers"),
+    metric: str = Query("cosine", pattern="^(cosine|jaccard)$", description="cosine (purchase counts) or jaccard (products bought)"),
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+):
+    from services import CustomerService
+
+    frame = CustomerService().get_similar_customers_frame(customer_id, k, metric)
+    if frame is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return _respond(request, frame, format, layout=layout)
+
+
+@insights_router.get("/customers/{customer_id}/recommendations")
+def get_customer_recommendations(
+    request: Request,
+    customer_id: int,
+    k: int = Query(5, ge=1, le=100, description="Number of recommended products"),
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+):
+    from services import CustomerService
+
+    frame = CustomerService().get_recommendations_frame(customer_id, k)
+    if frame is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return _respond(request, frame, format, layout=layout)
+
+
 @insights_router.get("/customers/{customer_id}")
-def get_customer_profile(customer_id: str):
-    return CustomerService().get_customer_profile(customer_id)
+def get_customer_profile(
+    request: Request,
+    customer_id: str,
+    format: str = FORMAT_QUERY,
+    table: str = TABLE_QUERY,
+    layout: str = LAYOUT_QUERY,
+    granularity: str = GRANULARITY_QUERY,
+    max_points: int = MAX_POINTS_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+    approx: bool = APPROX_QUERY,
+):
+    from services import CustomerService
+
+    frames = CustomerService().get_customer_profile_frames(customer_id, granularity, max_points, date_range, approx)
+    return _respond(request, frames, format, table, layout)
 
 
 @insights_router.get("/products")
 def get_products(
     search: str = Query(None, description="Search by name or category"),
 ):
+    from services import ProductService
+
     return ProductService().get_products(search)
 
 
+@insights_router.post("/products/profiles")
+def get_product_profiles(request: ProductProfilesRequest, date_range: DateRange = Depends(get_date_range)):
+    from services import ProductService
+
+    profiles = ProductService().get_product_profiles(request.product_ids, date_range=date_range)
+    return StreamingResponse(_ndjson(profiles), media_type="application/x-ndjson")
+
+
 @insights_router.get("/products/{product_id}")
-def get_product_profile(product_id: str):
-    return ProductService().get_product_profile(product_id)
+def get_product_profile(
+    request: Request,
+    product_id: str,
+    format: str = FORMAT_QUERY,
+    table: str = TABLE_QUERY,
+    layout: str = LAYOUT_QUERY,
+    granularity: str = GRANULARITY_QUERY,
+    max_points: int = MAX_POINTS_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+):
+    from services import ProductService
+
+    frames = ProductService().get_product_profile_frames(product_id, granularity, max_points, date_range)
+    return _respond(request, frames, format, table, layout)
 
 
 @insights_router.get("/overview")
-def get_overview():
-    return OverViewService().get_overview()
+def get_overview(
+    request: Request,
+    format: str = FORMAT_QUERY,
+    table: str = TABLE_QUERY,
+    layout: str = LAYOUT_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+    approx: bool = APPROX_QUERY,
+):
+    from services import OverViewService
+
+    return _respond(request, OverViewService().get_overview_frames(date_range, approx), format, table, layout)
+
+
+@insights_router.get("/dashboard")
+def get_dashboard(
+    request: Request,
+    sections: str = Query(None, description="Comma-separated sections: overview, anomalies, trends (default: all)"),
+    format: str = FORMAT_QUERY,
+    table: str = TABLE_QUERY,
+    layout: str = LAYOUT_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+    approx: bool = APPROX_QUERY,
+):
+    from services import DashboardService
+
+    names = [name.strip() for name in sections.split(",") if name.strip()] if sections else None
+    try:
+        frames = DashboardService().get_dashboard_frames(names, date_range, approx)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _respond(request, frames, format, table, layout)
+
+
+@insights_router.get("/dashboard/stream")
+async def stream_dashboard(
+    sections: str = Query(None, description="Comma-separated sections: overview, anomalies, trends (default: all)"),
+):
+    from services.dashboard import SECTIONS as DASHBOARD_SECTIONS
+
+    # async, so idle subscribers wait on the event loop instead of holding threadpool slots
+    names = [name.strip() for name in sections.split(",") if name.strip()] if sections else None
+    unknown = [name for name in names or [] if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    return StreamingResponse(
+        live_dashboard.stream(names),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @insights_router.get("/insights/anomalies")
-def get_anomalous_customers():
-    return InsightService().detect_anomalous_customers()
+def get_anomalous_customers(
+    request: Request,
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+):
+    from services import InsightService
+
+    frame = InsightService().detect_anomalous_customers_frame(date_range=date_range)
+    return _respond(request, frame, format, layout=layout)
+
+
+@insights_router.get("/insights/risk")
+def get_customer_risk(
+    request: Request,
+    top: int = Query(20, ge=1, le=1000, description="Number of highest-risk customers to return"),
+    spend_drop: float = Query(None, ge=0, description="Weight of the spend drop signal"),
+    ticket_spike: float = Query(None, ge=0, description="Weight of the ticket spike signal"),
+    sentiment_decline: float = Query(None, ge=0, description="Weight of the sentiment decline signal"),
+    open_backlog: float = Query(None, ge=0, description="Weight of the open-issue backlog signal"),
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+):
+    from services import InsightService
+
+    weights = {
+        name: value
+        for name, value in [
+            ("spend_drop", spend_drop),
+            ("ticket_spike", ticket_spike),
+            ("sentiment_decline", sentiment_decline),
+            ("open_backlog", open_backlog),
+        ]
+        if value is not None
+    }
+    try:
+        frame = InsightService().score_customer_risk_frame(weights, top, date_range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _respond(request, frame, format, layout=layout)
 
 
 @insights_router.get("/insights/trends")
-def get_trending_products():
-    return InsightService().highlight_trending_products()
+def get_trending_products(
+    request: Request,
+    format: str = FORMAT_QUERY,
+    table: str = TABLE_QUERY,
+    layout: str = LAYOUT_QUERY,
+    date_range: DateRange = Depends(get_date_range),
+):
+    from services import InsightService
+
+    frames = InsightService().highlight_trending_products_frames(date_range=date_range)
+    return _respond(request, frames, format, table, layout)
+
+
+@insights_router.get("/cohorts")
+def get_cohort_retention(
+    request: Request,
+    region: str = Query(None, description="Restrict to one region"),
+    industry: str = Query(None, description="Restrict to one industry"),
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+):
+    from services import CohortService
+
+    frames = CohortService().get_cohort_retention_frames(region, industry)
+    return _respond(request, frames, format, layout=layout)
+
+
+@insights_router.get("/support/sla")
+def get_support_sla(
+    request: Request,
+    by: str = Query("all", pattern="^(all|product|customer|issue_type)$", description="Breakdown of the SLA metrics"),
+    id: str = Query(None, description="Only this product id, customer id or issue type"),
+    as_of: date = Query(None, description="Date the backlog age is measured at (default: today)"),
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+):
+    from services import SlaService
+
+    frames = SlaService().get_sla_frames(by, id, as_of)
+    return _respond(request, frames, format, layout=layout)
+
+
+@insights_router.get("/suppliers")
+def get_suppliers(request: Request, format: str = FORMAT_QUERY, layout: str = LAYOUT_QUERY):
+    from services import SupplierService
+
+    frames = SupplierService().get_suppliers_frame()
+    return _respond(request, frames, format, layout=layout)
+
+
+@insights_router.get("/suppliers/{supplier_id}")
+def get_supplier(supplier_id: int):
+    from services import SupplierService
+
+    supplier = SupplierService().get_supplier_profile(supplier_id)
+    if "error" in supplier:
+        raise HTTPException(status_code=404, detail=supplier["error"])
+    return supplier
+
+
+@insights_router.get("/leaderboards/{board}")
+def get_leaderboard(
+    request: Request,
+    board: str,
+    n: int = Query(None, ge=1, le=1000, description="Entries (default: LEADERBOARD_SIZE)"),
+    region: str = Query(None, description="Only customers of this region (customers board)"),
+    category: str = Query(None, description="Only products of this category (product boards)"),
+    month: str = Query(None, pattern=r"^\d{4}-\d{2}$", description="Only this YYYY-MM month"),
+    format: str = FORMAT_QUERY,
+    layout: str = LAYOUT_QUERY,
+):
+    from services import LeaderboardService
+
+    try:
+        frame = LeaderboardService().get_leaderboard_frame(board, n, region, category, month)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _respond(request, frame, format, layout=layout)
+
+
+async def _ingest(kind, rows, wait):
+    import pandas as pd
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows")
+    if len(rows) > config.INGEST_MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {config.INGEST_MAX_BATCH_ROWS} rows per batch")
+    frame = pd.DataFrame([row.model_dump() for row in rows])
+    try:
+        future = ingest_writer.submit(kind, frame)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Ingest queue full, retry later", headers={"Retry-After": "1"})
+    if not wait:
+        return JSONResponse({"accepted": len(rows), "queued": True}, status_code=202)
+    # async, so requests waiting for their group commit hold no threadpool slots
+    try:
+        version = await asyncio.wrap_future(future)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Batch rejected: {e}")
+    return {"accepted": len(rows), "data_version": version}
+
+
+@insights_router.post("/ingest/transactions")
+async def ingest_transactions(rows: List[TransactionIn], wait: bool = Query(True, description="Answer once the rows are committed")):
+    return await _ingest("transactions", rows, wait)
+
+
+@insights_router.post("/ingest/tickets")
+async def ingest_tickets(rows: List[TicketIn], wait: bool = Query(True, description="Answer once the rows are committed")):
+    return await _ingest("tickets", rows, wait)
+
+
+@insights_router.get("/metrics")
+def get_metrics():
+    # Per process, like the cache stats
+    return {"cancellations": cancellation_stats(), "admission": admission_stats(), "ingest": ingest_writer.stats()}
+
+
+@insights_router.get("/cache/stats")
+def get_cache_stats():
+    from services.profile_cache import customer_profiles, product_profiles
+
+    # Per process: with several workers each one reports its own caches
+    return {"customer_profiles": customer_profiles.stats(), "product_profiles": product_profiles.stats()}
+
+
+def require_profile_token(x_profile_token: str = Header(None)):
+    if not config.PROFILE_TOKEN or not hmac.compare_digest(x_profile_token or "", config.PROFILE_TOKEN):
+        raise HTTPException(status_code=403, detail="Profiling not allowed")
+
+
+@insights_router.get("/profiles", dependencies=[Depends(require_profile_token)])
+def get_profiles():
+    # Written by requests made with ?profile=1, newest first
+    return list_profiles()
+
+
+@insights_router.get("/profiles/{name}", dependencies=[Depends(require_profile_token)])
+def get_profile(name: str):
+    if name not in list_profiles():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(os.path.join(profile_dir(), name), media_type="application/json")
+
+
+def _export(name, fmt, customer_id, product_id, date_range, gzip):
+    from services import ExportService
+
+    service = ExportService()
+    rows = service.export_rows(
+        name, fmt,
+        customer_id=customer_id,
+        product_id=product_id,
+        date_range=date_range,
+        compress=gzip,
+    )
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(rows, media_type=service.MEDIA_TYPES[fmt], headers=headers)
+
+
+@insights_router.get("/export/transactions")
+def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    customer_id: int = Query(None),
+    product_id: int = Query(None),
+    date_range: DateRange = Depends(get_date_range),
+    gzip: bool = Query(False, description="Gzip-compress the stream"),
+):
+    return _export("transactions", format, customer_id, product_id, date_range, gzip)
+
+
+@insights_router.get("/export/tickets")
+def export_tickets(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    customer_id: int = Query(None),
+    product_id: int = Query(None),
+    date_range: DateRange = Depends(get_date_range),
+    gzip: bool = Query(False, description="Gzip-compress the stream"),
+):
+    return _export("tickets", format, customer_id, product_id, date_range, gzip)
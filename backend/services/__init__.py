@@ -1,4 +1,26 @@
-from .customer import CustomerService
-from .product import ProductService
-from .overview import OverViewService
-from .insights import InsightService
\ No newline at end of file
+# The services import pandas and friends; they are loaded on first use, so
+# importing one light module of the package (or the app) does not pay for all
+_EXPORTS = {
+    "CustomerService": ".customer",
+    "ProductService": ".product",
+    "OverViewService": ".overview",
+    "InsightService": ".insights",
+    "ExportService": ".export",
+    "IngestService": ".ingest",
+    "CohortService": ".cohorts",
+    "SlaService": ".sla",
+    "SupplierService": ".suppliers",
+    "DashboardService": ".dashboard",
+    "LeaderboardService": ".leaderboards",
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+
+
+__all__ = list(_EXPORTS)
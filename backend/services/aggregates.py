@@ -0,0 +1,237 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from config import config
+import multiprocessing
+import os
+import threading
+import pandas as pd
+from db import get_data_version, list_sales_shards, connect
+from deadline import DeadlineExceeded, check_deadline
+from .daterange import ALL_TIME
+from .snapshot import snapshots
+
+# Worker processes are started once and reused by every request
+_pool = None
+# How often a request waiting on shard results checks its deadline
+DEADLINE_POLL_SECONDS = 0.1
+# Aggregates of the most recent (database, data version, range) requests
+CACHE_ENTRIES = 16
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    if _pool is None:
+        # spawn instead of fork: the server process runs threads that must not be forked
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    """
+    Stop the aggregation worker processes, if they were started.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def _gather(futures):
+    """
+    Results of shard tasks in order. If the request's deadline triggers
+    while waiting, the shards not started yet are cancelled.
+    """
+    results = []
+    for future in futures:
+        while True:
+            try:
+                results.append(future.result(timeout=DEADLINE_POLL_SECONDS))
+                break
+            except FuturesTimeout:
+                try:
+                    check_deadline()
+                except DeadlineExceeded:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+    return results
+
+
+def _worker_ready(_):
+    return os.getpid()
+
+
+def _aggregate_shard(db_path, table, condition, params):
+    """
+    Map step: partial sales aggregates of a single month shard.
+    Runs in a worker process, so it opens its own connection.
+    """
+    conn = connect(db_path)
+    sales = pd.read_sql(
+        f"SELECT customer_id, product_id, transaction_date, sale_amount FROM {table} WHERE {condition}",
+        conn,
+        params=params,
+    )
+    conn.close()
+    return _partial_aggregates(sales)
+
+
+def _grouped_aggregates(conn, condition, params):
+    """
+    The partial aggregates of all sales in the range from one grouped query
+    over sales_transactions: SQLite groups by customer, product and month,
+    and pandas only rolls up those (far fewer) groups.
+    """
+    groups = pd.read_sql(
+        f"""
+        SELECT customer_id, product_id, substr(transaction_date, 1, 7) AS month,
+               COUNT(*) AS sales_count, COALESCE(SUM(sale_amount), 0) AS sale_amount,
+               MIN(transaction_date) AS first_purchase, MAX(transaction_date) AS last_purchase
+        FROM sales_transactions
+        WHERE {condition}
+        GROUP BY customer_id, product_id, month
+        """,
+        conn,
+        params=params,
+    )
+    groups = groups.astype(
+        {"customer_id": "int64", "product_id": "int64", "sales_count": "int64", "sale_amount": "float64"}
+    )
+    groups["first_purchase"] = pd.to_datetime(groups["first_purchase"])
+    groups["last_purchase"] = pd.to_datetime(groups["last_purchase"])
+    monthly = groups.groupby("month").agg(count=("sales_count", "sum"), amount=("sale_amount", "sum"))
+    customers = groups.groupby("customer_id").agg(
+        total_purchases=("sales_count", "sum"),
+        total_spent=("sale_amount", "sum"),
+        first_purchase=("first_purchase", "min"),
+        last_purchase=("last_purchase", "max"),
+    )
+    product_months = groups.groupby(["product_id", "month"])[["sales_count", "sale_amount"]].sum()
+    return monthly, customers, product_months
+
+
+def _partial_aggregates(sales):
+    """
+    Monthly, per-customer and per-product-month aggregates of a sales frame.
+    """
+    # Empty result sets come back as object columns; keep the dtypes stable for the reduce
+    sales = sales.astype({"customer_id": "int64", "product_id": "int64", "sale_amount": "float64"})
+    sales["month"] = sales["transaction_date"].astype(str).str[:7]
+    # min/max on datetime64 stays in the cythonized groupby path (strings fall back to Python)
+    sales["transaction_date"] = pd.to_datetime(sales["transaction_date"])
+    monthly = sales.groupby("month").agg(
+        count=("sale_amount", "size"), amount=("sale_amount", "sum")
+    )
+    customers = sales.groupby("customer_id").agg(
+        total_purchases=("sale_amount", "size"),
+        total_spent=("sale_amount", "sum"),
+        first_purchase=("transaction_date", "min"),
+        last_purchase=("transaction_date", "max"),
+    )
+    product_months = sales.groupby(["product_id", "month"]).agg(
+        sales_count=("sale_amount", "size"), sale_amount=("sale_amount", "sum")
+    )
+    return monthly, customers, product_months
+
+
+def _copy(aggregates):
+    return {name: frame.copy() for name, frame in aggregates.items()}
+
+
+class SalesAggregator:
+    """
+    Sales aggregates shared by the overview, insight and customer services.
+    Large histories are map-reduced over the month shards of
+    sales_transactions, one task per shard on a process pool; otherwise one
+    grouped query computes them in-process. Results are cached per data
+    version and range.
+    """
+
+    def __init__(self, db_path=None, workers=None, parallel_min_rows=None):
+        self.db_path = db_path or config.DB_PATH
+        self.workers = workers or config.AGGREGATE_WORKERS or os.cpu_count() or 1
+        self.parallel_min_rows = (
+            parallel_min_rows if parallel_min_rows is not None else config.PARALLEL_MIN_ROWS
+        )
+
+    def aggregate(self, date_range=ALL_TIME, use_snapshot=True):
+        """
+        Compute, for the sales within a DateRange:
+        - monthly: month -> count, amount
+        - customers: customer_id -> total_purchases, total_spent, avg_order_value,
+          first_purchase, last_purchase (the LTV inputs)
+        - product_months: (product_id, month) -> sales_count, sale_amount
+        All-time aggregates are read from the shared snapshot when a current one is published.
+        Callers get their own copies of the frames.
+        """
+        if use_snapshot and not date_range:
+            snapshot = snapshots.current(self.db_path)
+            if snapshot is not None:
+                return snapshot.aggregates()
+
+        conn = connect(self.db_path)
+        try:
+            key = (self.db_path, get_data_version(conn), date_range.key())
+            with _cache_lock:
+                if key in _cache:
+                    _cache.move_to_end(key)
+                    return _copy(_cache[key])
+
+            shards = list_sales_shards(conn, date_range)
+            condition, params = date_range.condition("transaction_date")
+            if shards is not None and self._parallel(shards):
+                tasks = [(self.db_path, table, condition, params) for _, table, _ in shards]
+                partials = _gather([_get_pool(self.workers).submit(_aggregate_shard, *task) for task in tasks])
+            else:
+                partials = [_grouped_aggregates(conn, condition, params)]
+        finally:
+            conn.close()
+
+        check_deadline()
+        aggregates = self._reduce(partials)
+        with _cache_lock:
+            _cache[key] = aggregates
+            while len(_cache) > CACHE_ENTRIES:
+                _cache.popitem(last=False)
+        return _copy(aggregates)
+
+    def warm_up(self):
+        """
+        Start the worker processes ahead of the first request, if all-time
+        aggregates are large enough to be computed on them.
+        """
+        conn = connect(self.db_path)
+        shards = list_sales_shards(conn, ALL_TIME)
+        conn.close()
+        if shards is not None and self._parallel(shards):
+            # The pool starts its processes as tasks are queued
+            list(_get_pool(self.workers).map(_worker_ready, range(self.workers)))
+
+    def _parallel(self, shards):
+        # Small inputs are cheaper to aggregate in-process than to ship to workers
+        total_rows = sum(row_count for _, _, row_count in shards)
+        return self.workers > 1 and len(shards) > 1 and total_rows >= self.parallel_min_rows
+
+    def _reduce(self, partials):
+        """
+        Reduce step: merge the per-shard partial aggregates.
+        """
+        monthly = pd.concat([p[0] for p in partials])
+        customers = pd.concat([p[1] for p in partials])
+        product_months = pd.concat([p[2] for p in partials])
+
+        monthly = monthly.groupby(level="month").sum().sort_index()
+
+        customers = customers.groupby(level="customer_id").agg(
+            total_purchases=("total_purchases", "sum"),
+            total_spent=("total_spent", "sum"),
+            first_purchase=("first_purchase", "min"),
+            last_purchase=("last_purchase", "max"),
+        )
+        customers["avg_order_value"] = customers["total_spent"] / customers["total_purchases"]
+
+        product_months = product_months.groupby(level=["product_id", "month"]).sum().reset_index()
+
+        return {"monthly": monthly, "customers": customers, "product_months": product_months}
@@ -0,0 +1,296 @@
+from datetime import date, timedelta
+import math
+import sqlite3
+import pandas as pd
+from .utils import read_sql_in
+
+# Same cut-off as InsightService._label_negative_sentiment
+NEGATIVE_SENTIMENT = 0.4
+
+SCHEMA = [
+    # Tickets and negative tickets per customer inside the window
+    """CREATE TABLE IF NOT EXISTS anomaly_customer_counts (
+           customer_id INTEGER PRIMARY KEY,
+           ticket_count INTEGER NOT NULL,
+           negative_count INTEGER NOT NULL
+       )""",
+    # Anomalies are the top of this index, so a lookup only reads the anomalous rows
+    "CREATE INDEX IF NOT EXISTS idx_anomaly_negative_count ON anomaly_customer_counts (negative_count)",
+    # Per-day buckets, subtracted from the customer counts when they leave the window
+    """CREATE TABLE IF NOT EXISTS anomaly_daily_counts (
+           day TEXT NOT NULL,
+           customer_id INTEGER NOT NULL,
+           ticket_count INTEGER NOT NULL,
+           negative_count INTEGER NOT NULL,
+           PRIMARY KEY (day, customer_id)
+       )""",
+    # Welford running statistics of negative_count over customers with tickets
+    """CREATE TABLE IF NOT EXISTS anomaly_stats (
+           id INTEGER PRIMARY KEY CHECK (id = 1),
+           n INTEGER NOT NULL,
+           mean REAL NOT NULL,
+           m2 REAL NOT NULL,
+           window_days INTEGER,
+           window_start TEXT
+       )""",
+]
+
+
+class AnomalyEngine:
+    """
+    Incrementally maintained negative-ticket anomaly detector.
+
+    Per-customer ticket and negative-ticket counts, and the running mean and
+    variance (Welford) of the negative counts, are stored next to the data and
+    updated as tickets are appended, so listing the anomalous customers does
+    not rescan the support tickets. With `window_days`, only tickets from the
+    last `window_days` days count; older per-day buckets are subtracted as the
+    window slides.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, window_days=None):
+        self.conn = conn
+        self.window_days = window_days
+
+    def ensure(self, today: date = None):
+        """
+        Build the engine state if it is missing or was built for another window,
+        then slide the window up to `today`.
+        """
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        stats = self._read_stats()
+        if stats is None or stats["window_days"] != self.window_days:
+            self.rebuild(today)
+        else:
+            self.expire(today)
+
+    def rebuild(self, today: date = None):
+        """
+        Recompute all counts and statistics from the support tickets.
+        """
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.execute("DELETE FROM anomaly_customer_counts")
+        self.conn.execute("DELETE FROM anomaly_daily_counts")
+        self.conn.execute("DELETE FROM anomaly_stats")
+
+        window_start = self._window_start(today)
+        tickets = pd.read_sql(
+            """
+            SELECT st.customer_id, st.creation_date, st.sentiment_score
+            FROM support_tickets st
+            JOIN customers c ON st.customer_id = c.customer_id
+            WHERE st.sentiment_score IS NOT NULL AND st.creation_date >= ?
+            """,
+            self.conn,
+            params=[window_start or ""],
+        )
+        daily = self._daily_counts(tickets)
+        daily.to_sql("anomaly_daily_counts", self.conn, if_exists="append", index=False)
+
+        counts = daily.groupby("customer_id")[["ticket_count", "negative_count"]].sum().reset_index()
+        counts.to_sql("anomaly_customer_counts", self.conn, if_exists="append", index=False)
+
+        values = counts["negative_count"].astype(float)
+        n = len(values)
+        mean = float(values.mean()) if n else 0.0
+        m2 = float(((values - mean) ** 2).sum()) if n else 0.0
+        self._write_stats(n, mean, m2, window_start)
+        self.conn.commit()
+
+    def add_tickets(self, tickets: pd.DataFrame, today: date = None):
+        """
+        Account for newly appended tickets (customer_id, creation_date,
+        sentiment_score). Does not commit, so the caller can make it part of
+        the transaction that inserts the tickets.
+        """
+        stats = self._read_stats()
+        tickets = tickets[tickets["sentiment_score"].notna()]
+        known = read_sql_in(
+            self.conn,
+            "SELECT customer_id FROM customers WHERE customer_id IN ({ids})",
+            tickets["customer_id"].unique().tolist(),
+        )
+        tickets = tickets[tickets["customer_id"].isin(known["customer_id"])]
+        if stats["window_start"]:
+            tickets = tickets[tickets["creation_date"] >= stats["window_start"]]
+        if tickets.empty:
+            return
+
+        daily = self._daily_counts(tickets)
+        self.conn.executemany(
+            """
+            INSERT INTO anomaly_daily_counts (day, customer_id, ticket_count, negative_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, customer_id) DO UPDATE SET
+                ticket_count = ticket_count + excluded.ticket_count,
+                negative_count = negative_count + excluded.negative_count
+            """,
+            daily[["day", "customer_id", "ticket_count", "negative_count"]].itertuples(index=False),
+        )
+        self._apply(daily.groupby("customer_id")[["ticket_count", "negative_count"]].sum(), stats)
+        self.expire(today, commit=False)
+
+    def expire(self, today: date = None, commit=True):
+        """
+        Slide the window up to `today`, subtracting the per-day buckets that fell out of it.
+        """
+        stats = self._read_stats()
+        window_start = self._window_start(today)
+        if window_start is None or (stats["window_start"] and window_start <= stats["window_start"]):
+            return
+
+        deltas = self._expired(window_start)
+        self.conn.execute("DELETE FROM anomaly_daily_counts WHERE day < ?", (window_start,))
+        stats["window_start"] = window_start
+        self._apply(deltas, stats)
+        if commit:
+            self.conn.commit()
+
+    def anomalies(self, z_threshold: float = 2.0, today: date = None):
+        """
+        Customers whose negative-ticket count has a z-score above `z_threshold`,
+        highest first. Only the rows above the cut-off are read. Read-only:
+        when the window has slid past the stored state since the last ingest,
+        the expired buckets are subtracted in memory, not in the database.
+        """
+        stats = self._read_stats()
+        columns = ["customer_id", "customer_name", "negative_ticket_count", "z_score"]
+        window_start = self._window_start(today)
+        deltas = None
+        if window_start is not None and not (stats["window_start"] and window_start <= stats["window_start"]):
+            deltas = self._expired(window_start)
+            if not deltas.empty:
+                _, _, (n, mean, m2) = self._updated(deltas, stats)
+                stats = {**stats, "n": n, "mean": mean, "m2": m2}
+        std = math.sqrt(stats["m2"] / stats["n"]) if stats["n"] else 0.0
+        if std == 0:
+            return pd.DataFrame(columns=columns)
+
+        cutoff = stats["mean"] + z_threshold * std
+        anomalies = pd.read_sql(
+            """
+            SELECT cc.customer_id, c.customer_name, cc.negative_count AS negative_ticket_count
+            FROM anomaly_customer_counts cc
+            JOIN customers c ON cc.customer_id = c.customer_id
+            WHERE cc.negative_count > ?
+            ORDER BY cc.negative_count DESC, cc.customer_id
+            """,
+            self.conn,
+            params=[math.floor(cutoff)],
+        )
+        if deltas is not None and not deltas.empty:
+            # Expiry only lowers counts, so the rows above the cut-off still hold every anomaly
+            anomalies["negative_ticket_count"] += (
+                deltas["negative_count"].reindex(anomalies["customer_id"], fill_value=0).to_numpy()
+            )
+            anomalies = anomalies.sort_values(["negative_ticket_count", "customer_id"], ascending=[False, True])
+        anomalies["z_score"] = (anomalies["negative_ticket_count"] - stats["mean"]) / std
+        return anomalies[anomalies["z_score"] > z_threshold][columns].reset_index(drop=True)
+
+    def _apply(self, deltas: pd.DataFrame, stats):
+        """
+        Add per-customer (ticket_count, negative_count) deltas to the stored
+        counts and update the running statistics: each changed customer's old
+        value is removed from and its new value added to the Welford state.
+        """
+        if deltas.empty:
+            self._write_stats(stats["n"], stats["mean"], stats["m2"], stats["window_start"])
+            return
+
+        _, new, (n, mean, m2) = self._updated(deltas, stats)
+        active = new[new["ticket_count"] > 0]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO anomaly_customer_counts (customer_id, ticket_count, negative_count) VALUES (?, ?, ?)",
+            ((int(i), int(r.ticket_count), int(r.negative_count)) for i, r in zip(active.index, active.itertuples())),
+        )
+        self.conn.executemany(
+            "DELETE FROM anomaly_customer_counts WHERE customer_id = ?",
+            ((int(i),) for i in new.index[new["ticket_count"] <= 0]),
+        )
+        self._write_stats(n, mean, m2, stats["window_start"])
+
+    def _updated(self, deltas: pd.DataFrame, stats):
+        """
+        (old, new, (n, mean, m2)): the stored counts of the customers in
+        `deltas`, those counts with the deltas added, and the running
+        statistics after replacing the old values with the new ones.
+        """
+        old = read_sql_in(
+            self.conn,
+            "SELECT customer_id, ticket_count, negative_count FROM anomaly_customer_counts WHERE customer_id IN ({ids})",
+            deltas.index.tolist(),
+        ).set_index("customer_id")
+        old = old.reindex(deltas.index, fill_value=0)
+        new = old + deltas
+
+        n, mean, m2 = stats["n"], stats["mean"], stats["m2"]
+        for old_row, new_row in zip(old.itertuples(index=False), new.itertuples(index=False)):
+            if old_row.ticket_count > 0:
+                n, mean, m2 = _welford_remove(n, mean, m2, old_row.negative_count)
+            if new_row.ticket_count > 0:
+                n, mean, m2 = _welford_add(n, mean, m2, new_row.negative_count)
+        return old, new, (n, mean, m2)
+
+    def _expired(self, window_start):
+        """
+        Per-customer (ticket_count, negative_count) deltas that remove the
+        daily buckets from before `window_start`.
+        """
+        expired = pd.read_sql(
+            "SELECT customer_id, ticket_count, negative_count FROM anomaly_daily_counts WHERE day < ?",
+            self.conn,
+            params=[window_start],
+        )
+        return -expired.groupby("customer_id")[["ticket_count", "negative_count"]].sum()
+
+    def _daily_counts(self, tickets):
+        """
+        Ticket and negative-ticket counts per (day, customer).
+        """
+        tickets = tickets.assign(
+            day=tickets["creation_date"].astype(str).str[:10],
+            negative=(tickets["sentiment_score"] < NEGATIVE_SENTIMENT).astype(int),
+        )
+        return (
+            tickets.groupby(["day", "customer_id"])
+            .agg(ticket_count=("negative", "size"), negative_count=("negative", "sum"))
+            .reset_index()
+        )
+
+    def _window_start(self, today: date = None):
+        if self.window_days is None:
+            return None
+        today = today or date.today()
+        return (today - timedelta(days=self.window_days - 1)).isoformat()
+
+    def _read_stats(self):
+        row = self.conn.execute("SELECT n, mean, m2, window_days, window_start FROM anomaly_stats").fetchone()
+        if row is None:
+            return None
+        return dict(zip(["n", "mean", "m2", "window_days", "window_start"], row))
+
+    def _write_stats(self, n, mean, m2, window_start):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO anomaly_stats (id, n, mean, m2, window_days, window_start) VALUES (1, ?, ?, ?, ?, ?)",
+            (n, mean, max(m2, 0.0), self.window_days, window_start),
+        )
+
+
+def _welford_add(n, mean, m2, x):
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    m2 += delta * (x - mean)
+    return n, mean, m2
+
+
+def _welford_remove(n, mean, m2, x):
+    if n <= 1:
+        return 0, 0.0, 0.0
+    n -= 1
+    delta = x - mean
+    mean -= delta / n
+    m2 -= delta * (x - mean)
+    return n, mean, m2
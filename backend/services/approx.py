@@ -0,0 +1,139 @@
+from config import config
+import math
+import sqlite3
+import numpy as np
+import pandas as pd
+from .daterange import ALL_TIME
+
+# Two-sided confidence of the reported error bounds
+CONFIDENCE = 0.95
+Z_SCORE = 1.96
+
+SCHEMA = [
+    # Ticket count and sentiment sums per creation day
+    """CREATE TABLE IF NOT EXISTS approx_daily_sentiment (
+           day TEXT PRIMARY KEY,
+           tickets INTEGER NOT NULL,
+           scored INTEGER NOT NULL,
+           sentiment_sum REAL NOT NULL
+       )""",
+    # Customers with the smallest id hashes: a uniform sample fixed at ingest
+    """CREATE TABLE IF NOT EXISTS approx_customer_sample (
+           customer_id INTEGER PRIMARY KEY
+       )""",
+]
+
+
+def hash64(values):
+    """
+    SplitMix64 finalizer: well-mixed 64-bit hashes of integer ids.
+    """
+    x = np.asarray(values, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class ApproxStore:
+    """
+    Sketches and samples behind the approximate query mode: per-day
+    sentiment sums and a hash-selected customer sample. Built at ingest and
+    updated as tickets are appended.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def ensure(self):
+        """
+        Build the sketches if the database was ingested before they existed.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'approx_customer_sample'"
+        ).fetchone()
+        if not exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Recompute all sketches from customers and support_tickets.
+        """
+        # approx_daily_customers held per-day HyperLogLog sketches in older databases
+        for table in ["approx_daily_customers", "approx_daily_sentiment", "approx_customer_sample"]:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+
+        customer_ids = pd.read_sql("SELECT customer_id FROM customers", self.conn)["customer_id"].to_numpy()
+        size = max(math.ceil(len(customer_ids) * config.APPROX_SAMPLE_RATE), min(len(customer_ids), config.APPROX_MIN_SAMPLE))
+        sample = customer_ids[np.argsort(hash64(customer_ids), kind="stable")[:size]]
+        self.conn.executemany(
+            "INSERT INTO approx_customer_sample (customer_id) VALUES (?)", ((int(c),) for c in sample)
+        )
+
+        self.add_tickets(pd.read_sql("SELECT creation_date, sentiment_score FROM support_tickets", self.conn))
+        self.conn.commit()
+
+    def add_tickets(self, tickets: pd.DataFrame):
+        """
+        Add appended tickets to the per-day sentiment sums. Does not commit.
+        """
+        daily = (
+            tickets.assign(day=tickets["creation_date"].astype(str).str[:10])
+            .groupby("day")["sentiment_score"]
+            .agg(["size", "count", "sum"])
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO approx_daily_sentiment (day, tickets, scored, sentiment_sum) VALUES (?, ?, ?, ?)
+            ON CONFLICT (day) DO UPDATE SET
+                tickets = tickets + excluded.tickets,
+                scored = scored + excluded.scored,
+                sentiment_sum = sentiment_sum + excluded.sentiment_sum
+            """,
+            ((day, int(r[0]), int(r[1]), float(r[2])) for day, r in zip(daily.index, daily.itertuples(index=False))),
+        )
+
+    def monthly_sentiment(self, date_range=ALL_TIME):
+        """
+        Tickets, scored tickets and sentiment sum per creation month. Sums
+        are exact, so the means derived from them carry no sampling error.
+        """
+        condition, params = date_range.condition("day")
+        return pd.read_sql(
+            f"""
+            SELECT substr(day, 1, 7) AS month, SUM(tickets) AS tickets,
+                   SUM(scored) AS scored, SUM(sentiment_sum) AS sentiment_sum
+            FROM approx_daily_sentiment
+            WHERE {condition}
+            GROUP BY month
+            ORDER BY month
+            """,
+            self.conn,
+            params=params,
+        ).astype({"tickets": "int64", "scored": "int64", "sentiment_sum": "float64"})
+
+    def sample_quantile(self, values: pd.Series, q):
+        """
+        Quantile of a per-customer value over the sampled customers, with
+        distribution-free bounds: by the Dvoretzky-Kiefer-Wolfowitz
+        inequality the population quantile lies between the sample quantiles
+        at q -/+ epsilon with probability CONFIDENCE.
+        """
+        n = len(values)
+        if n == 0:
+            return float("nan"), {"method": "customer sample", "sample_size": 0}
+        (population,) = self.conn.execute("SELECT COUNT(*) FROM customers").fetchone()
+        (sampled,) = self.conn.execute("SELECT COUNT(*) FROM approx_customer_sample").fetchone()
+        # A sample of every customer is the exact answer
+        epsilon = 0.0 if sampled >= population else math.sqrt(math.log(2 / (1 - CONFIDENCE)) / (2 * n))
+        return float(values.quantile(q)), {
+            "method": "customer sample",
+            "confidence": CONFIDENCE,
+            "sample_size": n,
+            "lower": float(values.quantile(max(q - epsilon, 0.0))),
+            "upper": float(values.quantile(min(q + epsilon, 1.0))),
+        }
+
+    def sampled_customers(self):
+        return [row[0] for row in self.conn.execute("SELECT customer_id FROM approx_customer_sample")]
@@ -0,0 +1,63 @@
+import numpy as np
+from .loader import month_column
+
+# Chart granularity -> pandas period frequency
+GRANULARITIES = {"day": "D", "week": "W", "month": "M", "quarter": "Q"}
+
+
+def period_labels(dates, granularity="month"):
+    """
+    Label each date with the chart bucket it falls in:
+    day "2024-01-05", week (start date) "2024-01-01", month "2024-01", quarter "2024Q1".
+    Months come back as the categorical of loader.month_column.
+    """
+    if granularity == "month":
+        return month_column(dates)
+    periods = dates.dt.to_period(GRANULARITIES[granularity])
+    if granularity == "week":
+        return periods.dt.start_time.dt.strftime("%Y-%m-%d")
+    return periods.astype(str)
+
+
+def lttb_indices(y, max_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a series of y values at
+    evenly spaced x positions. Returns the sorted indices of at most
+    `max_points` points; the first and last points are always kept and each
+    bucket keeps the point forming the largest triangle with its neighbours,
+    so peaks and troughs survive. Work inside each bucket is vectorized.
+    """
+    n = len(y)
+    if max_points is None or n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    # Interior points are split into max_points - 2 buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        areas = np.abs((x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(df, value_column, max_points=None):
+    """
+    Reduce a chart series DataFrame to at most `max_points` rows with LTTB
+    on `value_column`.
+    """
+    if max_points is None or len(df) <= max_points:
+        return df
+    return df.iloc[lttb_indices(df[value_column].values, max_points)].reset_index(drop=True)
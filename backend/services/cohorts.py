@@ -0,0 +1,223 @@
+import sqlite3
+import pandas as pd
+import numpy as np
+from db import connect
+from .utils import read_sql_in
+from .serialization import to_python
+
+# Dimension value of the rows that aggregate over every region / industry
+ALL = "ALL"
+
+SCHEMA = [
+    # Months in which each customer bought anything (purchases before joining
+    # count in the join month): makes "active customers" an exact distinct
+    # count that can be updated one new (customer, month) at a time
+    """CREATE TABLE IF NOT EXISTS cohort_activity (
+           customer_id INTEGER NOT NULL,
+           activity_month TEXT NOT NULL,
+           PRIMARY KEY (customer_id, activity_month)
+       )""",
+    """CREATE TABLE IF NOT EXISTS cohort_sizes (
+           region TEXT NOT NULL,
+           industry TEXT NOT NULL,
+           cohort_month TEXT NOT NULL,
+           customers INTEGER NOT NULL,
+           PRIMARY KEY (region, industry, cohort_month)
+       )""",
+    """CREATE TABLE IF NOT EXISTS cohort_retention (
+           region TEXT NOT NULL,
+           industry TEXT NOT NULL,
+           cohort_month TEXT NOT NULL,
+           months_since_join INTEGER NOT NULL,
+           active_customers INTEGER NOT NULL,
+           revenue REAL NOT NULL,
+           PRIMARY KEY (region, industry, cohort_month, months_since_join)
+       )""",
+]
+
+
+class CohortCube:
+    """
+    Materialized join-month cohort x months-since-join cube of active
+    customers and revenue. Every (region, industry) rollup is stored,
+    including the ALL/ALL total, so any slice is a single primary-key range
+    read. Appended transactions update it in place.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def ensure(self):
+        """
+        Build the cube if the database was ingested before it existed.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cohort_retention'"
+        ).fetchone()
+        if not exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Recompute the whole cube from customers and sales_transactions.
+        """
+        for table in ["cohort_activity", "cohort_sizes", "cohort_retention"]:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+
+        customers = self._customers()
+        sales = pd.read_sql("SELECT customer_id, transaction_date, sale_amount FROM sales_transactions", self.conn)
+        activity, cells = self._cells(sales, customers)
+
+        activity.to_sql("cohort_activity", self.conn, if_exists="append", index=False)
+        sizes = _rollup(customers, ["cohort_month"], customers=("customer_id", "size"))
+        sizes.to_sql("cohort_sizes", self.conn, if_exists="append", index=False)
+
+        # Distinct active customers per cell come from the deduplicated activity
+        active = cells.drop_duplicates(["customer_id", "activity_month"])
+        retention = _rollup(
+            active, ["cohort_month", "months_since_join"], active_customers=("customer_id", "size")
+        ).merge(
+            _rollup(cells, ["cohort_month", "months_since_join"], revenue=("sale_amount", "sum")),
+            on=["region", "industry", "cohort_month", "months_since_join"],
+        )
+        retention.to_sql("cohort_retention", self.conn, if_exists="append", index=False)
+        self.conn.commit()
+
+    def add_transactions(self, sales: pd.DataFrame):
+        """
+        Fold newly appended transactions (customer_id, transaction_date,
+        sale_amount) into the cube. Revenue is added to every rollup of the
+        customer's cell; the active count only grows for (customer, month)
+        pairs not seen before. Does not commit.
+        """
+        customers = self._customers(sales["customer_id"].unique().tolist())
+        _, cells = self._cells(sales, customers)
+        if cells.empty:
+            return
+
+        new_pairs = []
+        for customer_id, month in cells[["customer_id", "activity_month"]].drop_duplicates().itertuples(index=False):
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO cohort_activity (customer_id, activity_month) VALUES (?, ?)",
+                (int(customer_id), month),
+            ).rowcount
+            if inserted:
+                new_pairs.append((customer_id, month))
+
+        cells = cells.assign(
+            is_new=pd.MultiIndex.from_frame(cells[["customer_id", "activity_month"]]).isin(new_pairs)
+        )
+        # Count each new pair once, even if several of the new transactions fall in it
+        cells["is_new"] &= ~cells.duplicated(["customer_id", "activity_month"])
+        deltas = _rollup(
+            cells,
+            ["cohort_month", "months_since_join"],
+            active_customers=("is_new", "sum"),
+            revenue=("sale_amount", "sum"),
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO cohort_retention
+                (region, industry, cohort_month, months_since_join, active_customers, revenue)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (region, industry, cohort_month, months_since_join) DO UPDATE SET
+                active_customers = active_customers + excluded.active_customers,
+                revenue = revenue + excluded.revenue
+            """,
+            (
+                (r.region, r.industry, r.cohort_month, int(r.months_since_join), int(r.active_customers), float(r.revenue))
+                for r in deltas.itertuples(index=False)
+            ),
+        )
+
+    def slice(self, region=ALL, industry=ALL):
+        """
+        The cohort x months-since-join grid of one region/industry rollup,
+        with cohort sizes and retention rates.
+        """
+        return pd.read_sql(
+            """
+            SELECT r.cohort_month, s.customers AS cohort_size, r.months_since_join,
+                   r.active_customers, ROUND(1.0 * r.active_customers / s.customers, 4) AS retention,
+                   ROUND(r.revenue, 2) AS revenue
+            FROM cohort_retention r
+            JOIN cohort_sizes s
+              ON s.region = r.region AND s.industry = r.industry AND s.cohort_month = r.cohort_month
+            WHERE r.region = ? AND r.industry = ?
+            ORDER BY r.cohort_month, r.months_since_join
+            """,
+            self.conn,
+            params=[region, industry],
+        )
+
+    def _customers(self, customer_ids=None):
+        """
+        Customers with their cohort (join month), region and industry.
+        """
+        query = "SELECT customer_id, join_date, region, industry FROM customers"
+        if customer_ids is None:
+            customers = pd.read_sql(query, self.conn)
+        else:
+            customers = read_sql_in(self.conn, query + " WHERE customer_id IN ({ids})", customer_ids)
+        customers["cohort_month"] = customers["join_date"].str[:7]
+        return customers.drop(columns="join_date")
+
+    def _cells(self, sales, customers):
+        """
+        Attach each transaction to its customer's cohort cell. Returns the
+        distinct (customer_id, activity_month) pairs and the per-transaction cells.
+        """
+        sales = sales.assign(activity_month=sales["transaction_date"].astype(str).str[:7])
+        cells = sales.merge(customers, on="customer_id")
+        # Activity before the join month (if any) counts as activity in the
+        # join month, so a customer is active at most once in month 0
+        cells["activity_month"] = cells["activity_month"].where(
+            cells["activity_month"] >= cells["cohort_month"], cells["cohort_month"]
+        )
+        join = pd.PeriodIndex(cells["cohort_month"], freq="M")
+        active = pd.PeriodIndex(cells["activity_month"], freq="M")
+        cells["months_since_join"] = np.asarray((active.year - join.year) * 12 + (active.month - join.month))
+        activity = cells[["customer_id", "activity_month"]].drop_duplicates()
+        return activity, cells
+
+
+def _rollup(df, keys, **aggregations):
+    """
+    Aggregate `df` by `keys` for every region/industry rollup:
+    (region, industry), (region, ALL), (ALL, industry) and (ALL, ALL).
+    """
+    frames = []
+    for region_all in (False, True):
+        for industry_all in (False, True):
+            rolled = df.assign(
+                region=ALL if region_all else df["region"],
+                industry=ALL if industry_all else df["industry"],
+            )
+            frames.append(rolled.groupby(["region", "industry"] + keys).agg(**aggregations).reset_index())
+    return pd.concat(frames, ignore_index=True)
+
+
+class CohortService:
+    def __init__(self):
+        pass
+
+    def get_cohort_retention(self, region=None, industry=None):
+        """
+        Cohort retention (active customers, retention rate and revenue per
+        join-month cohort and months since joining), optionally for one
+        region and/or industry.
+        """
+        return to_python(self.get_cohort_retention_frames(region, industry))
+
+    def get_cohort_retention_frames(self, region=None, industry=None):
+        """
+        Same as get_cohort_retention, but the grid is left as a DataFrame.
+        """
+        conn = connect()
+        try:
+            cohorts = CohortCube(conn).slice(region or ALL, industry or ALL)
+        finally:
+            conn.close()
+        return {"region": region or ALL, "industry": industry or ALL, "cohorts": cohorts}
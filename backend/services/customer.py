@@ -1,7 +1,23 @@
+from collections import OrderedDict
 from config import config
-import sqlite3
+from datetime import date
+import threading
 import pandas as pd
-import numpy as np
+from db import get_data_version, connect
+from deadline import check_deadline
+from .utils import read_sql_in
+from .serialization import to_python, to_records
+from .charts import period_labels, downsample
+from .daterange import ALL_TIME
+from .aggregates import SalesAggregator
+from .approx import ApproxStore
+from .loader import compact, read_frame, month_column, normalize_categories
+from .profile_cache import customer_profiles
+
+# LTV thresholds per (data version, date range, approx): every profile needs one
+LTV_THRESHOLD_CACHE_SIZE = 32
+_ltv_thresholds = OrderedDict()
+_ltv_thresholds_lock = threading.Lock()
 
 
 class CustomerService:
@@ -14,7 +30,7 @@ class CustomerService:
         Fetch a list of customers from the database.
         Optionally filter by a search term matching customer_name, region, or industry.
         """
-        conn = sqlite3.connect(config.DB_PATH)
+        conn = connect()
         query = """
         SELECT * FROM customers
         WHERE (customer_name LIKE ? OR region LIKE ? OR industry LIKE ?)
@@ -27,36 +43,336 @@ class CustomerService:
         conn.close()
         return df.to_dict(orient="records")
 
-    def get_customer_profile(self, customer_id: str):
+    def get_customer_profile(self, customer_id: str, granularity="month", max_points=None, date_range=ALL_TIME, approx=None):
         """
         Fetch detailed profile information for a specific customer.
         Includes customer details, sales summary, support summary, charts, and AI insights.
+        Time series are bucketed by `granularity` (day/week/month/quarter) and
+        downsampled to at most `max_points` points. A DateRange restricts the
+        transactions and tickets considered, including the LTV threshold.
+        In approximate mode the threshold is estimated from the customer
+        sample and its bounds are returned under "approximation".
+        """
+        return to_python(self.get_customer_profile_frames(customer_id, granularity, max_points, date_range, approx))
+
+    def get_customer_profile_frames(self, customer_id: str, granularity="month", max_points=None, date_range=ALL_TIME, approx=None):
+        """
+        Same as get_customer_profile, but chart series are left as DataFrames
+        so they can be serialized to JSON or to a columnar format.
+        Profiles are served from the profile cache in both modes; on a hit
+        only the LTV score is renormalized against the current threshold.
+        """
+        approx = config.APPROX_MODE if approx is None else approx
+        if approx:
+            max_ltv, max_ltv_bounds = self.approximate_ltv_threshold(date_range)
+        else:
+            max_ltv = self.generate_max_ltv_threshold(date_range, approx=False)
+
+        if not config.PROFILE_CACHE_SIZE:
+            cached = self._compute_profile_frames(customer_id, granularity, max_points, date_range, max_ltv)
+        else:
+            # The churn insight looks back from today
+            key = (str(customer_id), granularity, max_points, date_range.key(), date.today())
+            conn = connect()
+            try:
+                version, cached = customer_profiles.get(conn, key)
+            finally:
+                conn.close()
+            if cached is None:
+                cached = self._compute_profile_frames(customer_id, granularity, max_points, date_range, max_ltv)
+                customer_profiles.put(version, customer_id, key, cached)
+
+        profile = cached["profile"]
+        if cached["max_ltv"] != max_ltv:
+            sales_summary = {**profile["sales_summary"], "ltv_score": self._normalize_ltv(cached["ltv"], max_ltv)}
+            profile = {**profile, "sales_summary": sales_summary}
+        if approx:
+            profile = {**profile, "approximation": {"max_ltv": max_ltv_bounds}}
+        return profile
+
+    def _compute_profile_frames(self, customer_id, granularity, max_points, date_range, max_ltv):
+        """
+        Compute the profile for get_customer_profile_frames, normalizing the
+        LTV score against `max_ltv`. Returned as {"profile", "ltv", "max_ltv"}:
+        with the customer's raw LTV and the threshold, so a cached copy can be
+        renormalized.
         """
-        conn = sqlite3.connect(config.DB_PATH)
+        conn = connect()
 
         # Fetch data from various sources
         customer = self._fetch_customer_details(conn, customer_id)
-        sales = self._fetch_sales_data(conn, customer_id)
-        tickets = self._fetch_support_tickets(conn, customer_id)
-        max_ltv = self.generate_max_ltv_threshold(conn)
+        sales = self._fetch_sales_data(conn, customer_id, date_range)
+        tickets = self._fetch_support_tickets(conn, customer_id, date_range)
 
         # Process data into summaries and insights
+        check_deadline()
         sales_summary = self._calculate_sales_summary(sales, max_ltv)
         support_summary = self._calculate_support_summary(tickets)
-        charts = self._generate_charts(sales, tickets)
+        charts = self._generate_charts(sales, tickets, granularity, max_points)
+        check_deadline()
         top_category = self._determine_top_category(conn, sales)
         ai_insights = self._generate_ai_insights(sales, tickets, sales_summary, support_summary, top_category)
 
         conn.close()
 
         # Return the aggregated customer profile
-        return {
+        profile = {
             "customer": customer,
             "sales_summary": sales_summary,
             "support_summary": support_summary,
             "ai_insights": ai_insights,
             "charts": charts,
         }
+        return {"profile": profile, "ltv": self._customer_ltv(sales), "max_ltv": max_ltv}
+
+    def get_similar_customers(self, customer_id: int, k=10, metric="cosine"):
+        """
+        Customers whose purchases look most like this customer's, by cosine or
+        Jaccard similarity over the customer x product purchase matrix.
+        Returns None for an unknown customer.
+        """
+        frame = self.get_similar_customers_frame(customer_id, k, metric)
+        return None if frame is None else to_records(frame)
+
+    def get_similar_customers_frame(self, customer_id: int, k=10, metric="cosine"):
+        """
+        DataFrame version of get_similar_customers.
+        """
+        # scipy.sparse is only loaded by the endpoints that need the matrix
+        from .similarity import similarity_index
+
+        columns = ["customer_id", "customer_name", "similarity"]
+        conn = connect()
+        try:
+            if not self._customer_exists(conn, customer_id):
+                return None
+            matrix = similarity_index.matrix(conn)
+            i = matrix.row(customer_id)
+            if i is None:
+                return pd.DataFrame(columns=columns)
+
+            def compute():
+                ids, scores = matrix.similar_customers(i, k, metric)
+                similar = pd.DataFrame({"customer_id": ids, "similarity": scores.astype(float).round(4)})
+                names = read_sql_in(
+                    conn,
+                    "SELECT customer_id, customer_name FROM customers WHERE customer_id IN ({ids})",
+                    ids.tolist(),
+                )
+                return similar.merge(names, on="customer_id", how="left")[columns]
+
+            return similarity_index.cached((matrix.version, "similar", customer_id, k, metric), compute)
+        finally:
+            conn.close()
+
+    def get_recommendations(self, customer_id: int, k=5):
+        """
+        Products this customer has not bought yet, ranked by what the most
+        similar customers buy. Returns None for an unknown customer.
+        """
+        frame = self.get_recommendations_frame(customer_id, k)
+        return None if frame is None else to_records(frame)
+
+    def get_recommendations_frame(self, customer_id: int, k=5):
+        """
+        DataFrame version of get_recommendations.
+        """
+        from .similarity import similarity_index
+
+        columns = ["product_id", "product_name", "category", "sales_price", "score"]
+        conn = connect()
+        try:
+            if not self._customer_exists(conn, customer_id):
+                return None
+            matrix = similarity_index.matrix(conn)
+            i = matrix.row(customer_id)
+            if i is None:
+                return pd.DataFrame(columns=columns)
+
+            def compute():
+                ids, scores = matrix.recommend_products(i, k)
+                recommended = pd.DataFrame({"product_id": ids, "score": scores.astype(float).round(4)})
+                details = read_sql_in(
+                    conn,
+                    "SELECT product_id, product_name, category, sales_price FROM products WHERE product_id IN ({ids})",
+                    ids.tolist(),
+                )
+                return recommended.merge(details, on="product_id", how="left")[columns]
+
+            return similarity_index.cached((matrix.version, "recommendations", customer_id, k), compute)
+        finally:
+            conn.close()
+
+    def _customer_exists(self, conn, customer_id):
+        return conn.execute("SELECT 1 FROM customers WHERE customer_id = ?", (customer_id,)).fetchone() is not None
+
+    def get_customer_profiles(self, customer_ids, date_range=ALL_TIME):
+        """
+        Fetch profiles for many customers in one pass.
+        Rows for all requested customers are read with one query per table, summaries
+        and charts are computed with grouped aggregations, and the LTV threshold is
+        computed once. Profiles are yielded one at a time in the requested order.
+        """
+        customer_ids = list(dict.fromkeys(customer_ids))
+        sales_condition, sales_params = date_range.condition("transaction_date")
+        tickets_condition, tickets_params = date_range.condition("creation_date")
+        conn = connect()
+        try:
+            customers = compact(read_sql_in(conn, "SELECT * FROM customers WHERE customer_id IN ({ids})", customer_ids))
+            sales = compact(read_sql_in(
+                conn,
+                f"""
+                SELECT customer_id, transaction_date, sale_amount, product_id
+                FROM sales_transactions
+                WHERE customer_id IN ({{ids}}) AND {sales_condition}
+                """,
+                customer_ids,
+                sales_params,
+            ))
+            tickets = compact(read_sql_in(
+                conn,
+                f"""
+                SELECT customer_id, creation_date, sentiment_score, status
+                FROM support_tickets
+                WHERE customer_id IN ({{ids}}) AND {tickets_condition}
+                """,
+                customer_ids,
+                tickets_params,
+            ))
+            products = compact(read_sql_in(
+                conn,
+                """
+                SELECT product_id, category, sales_price, cost_price
+                FROM products
+                WHERE product_id IN ({ids})
+                """,
+                sales["product_id"].unique().tolist(),
+            ))
+            max_ltv = self.generate_max_ltv_threshold(date_range)
+        finally:
+            conn.close()
+
+        sales = self._prepare_sales(sales)
+        tickets = self._prepare_tickets(tickets)
+
+        # Grouped summaries and charts for all customers at once
+        sales_summaries = self._calculate_sales_summaries(sales, max_ltv)
+        support_summaries = self._calculate_support_summaries(tickets)
+        top_categories = self._determine_top_categories(sales, products)
+        charts = self._generate_grouped_charts(sales, tickets)
+
+        customers = customers.set_index("customer_id", drop=False)
+        sales_by_customer = dict(tuple(sales.groupby("customer_id")))
+        tickets_by_customer = dict(tuple(tickets.groupby("customer_id")))
+        empty_charts = {"sales_over_time": [], "sentiment_over_time": [], "support_status_breakdown": []}
+
+        for customer_id in customer_ids:
+            if customer_id not in customers.index:
+                yield {"customer_id": customer_id, "error": "Customer not found"}
+                continue
+
+            customer_sales = sales_by_customer.get(customer_id, sales.iloc[0:0])
+            customer_tickets = tickets_by_customer.get(customer_id, tickets.iloc[0:0])
+            sales_summary = sales_summaries.get(customer_id) or self._calculate_sales_summary(customer_sales, max_ltv)
+            support_summary = support_summaries.get(customer_id) or self._calculate_support_summary(customer_tickets)
+            top_category = top_categories.get(customer_id)
+
+            yield {
+                "customer": {
+                    k: v.item() if hasattr(v, "item") else v
+                    for k, v in customers.loc[customer_id].to_dict().items()
+                },
+                "sales_summary": sales_summary,
+                "support_summary": support_summary,
+                "ai_insights": self._generate_ai_insights(
+                    customer_sales, customer_tickets, sales_summary, support_summary, top_category
+                ),
+                "charts": {**empty_charts, **charts.get(customer_id, {})},
+            }
+
+    def _calculate_sales_summaries(self, sales, max_ltv):
+        """
+        Grouped version of _calculate_sales_summary: one summary per customer_id.
+        """
+        stats = self._aggregate_sales(sales)
+        stats["ltv_score"] = (self._compute_ltv(stats) / max(max_ltv, 1)).clip(upper=1.0)
+        return {
+            row.Index: {
+                "total_purchases": int(row.total_purchases),
+                "total_spent": float(row.total_spent),
+                "avg_order_value": float(round(row.avg_order_value, 2)) if row.avg_order_value else None,
+                "ltv_score": float(round(row.ltv_score, 2)),
+            }
+            for row in stats.itertuples()
+        }
+
+    def _calculate_support_summaries(self, tickets):
+        """
+        Grouped version of _calculate_support_summary: one summary per customer_id.
+        """
+        stats = tickets.groupby("customer_id").agg(
+            total_tickets=("sentiment_score", "size"),
+            avg_sentiment=("sentiment_score", "mean"),
+        )
+        stats["open_issues"] = (tickets["status"] == "open").groupby(tickets["customer_id"]).sum()
+        return {
+            row.Index: {
+                "total_tickets": int(row.total_tickets),
+                "avg_sentiment": float(round(row.avg_sentiment, 2)) if row.avg_sentiment else None,
+                "open_issues": int(row.open_issues),
+            }
+            for row in stats.itertuples()
+        }
+
+    def _determine_top_categories(self, sales, products):
+        """
+        Grouped version of _determine_top_category: the most frequent high-margin
+        category among each customer's purchased products.
+        """
+        products = products.assign(margin=products["sales_price"] - products["cost_price"])
+        high_margin = products[products["margin"] > 500][["product_id", "category"]]
+        purchased = sales[["customer_id", "product_id"]].drop_duplicates().merge(high_margin, on="product_id")
+        if purchased.empty:
+            return {}
+        counts = (
+            purchased.groupby(["customer_id", "category"], observed=True)
+            .size()
+            .reset_index(name="count")
+            .sort_values(["customer_id", "count", "category"], ascending=[True, False, True], kind="stable")
+            .drop_duplicates("customer_id")
+        )
+        return dict(zip(counts["customer_id"], counts["category"]))
+
+    def _generate_grouped_charts(self, sales, tickets):
+        """
+        Grouped version of _generate_charts: chart series for every customer_id,
+        computed with one groupby per chart.
+        """
+        series = {
+            "sales_over_time": (
+                sales.groupby(["customer_id", "month"], observed=True)["sale_amount"]
+                .sum()
+                .reset_index()
+                .rename(columns={"month": "date", "sale_amount": "amount"})
+            ),
+            "sentiment_over_time": (
+                tickets.groupby(["customer_id", "month"], observed=True)["sentiment_score"]
+                .mean()
+                .reset_index()
+                .rename(columns={"month": "date", "sentiment_score": "score"})
+            ),
+            "support_status_breakdown": (
+                tickets.groupby(["customer_id", "status"], observed=True)
+                .size()
+                .reset_index(name="count")
+                .sort_values(["customer_id", "count", "status"], ascending=[True, False, True], kind="stable")
+            ),
+        }
+        charts = {}
+        for name, frame in series.items():
+            for customer_id, group in frame.groupby("customer_id"):
+                charts.setdefault(customer_id, {})[name] = to_records(group.drop(columns="customer_id"))
+        return charts
 
     def _fetch_customer_details(self, conn, customer_id):
         """
@@ -72,42 +388,54 @@ class CustomerService:
             for k, v in customer.iloc[0].to_dict().items()
         }
 
-    def _fetch_sales_data(self, conn, customer_id):
+    def _fetch_sales_data(self, conn, customer_id, date_range=ALL_TIME):
         """
         Fetch sales transaction data for a specific customer.
         """
-        sales = pd.read_sql(
-            """
+        condition, params = date_range.condition("transaction_date")
+        sales = read_frame(
+            conn,
+            f"""
             SELECT transaction_date, sale_amount, product_id
             FROM sales_transactions
-            WHERE customer_id = ?
+            WHERE customer_id = ? AND {condition}
             """,
-            conn,
-            params=(str(customer_id),),
+            params=[str(customer_id)] + params,
         )
-        # Convert transaction_date to datetime and extract month
+        return self._prepare_sales(sales)
+
+    def _prepare_sales(self, sales):
+        """
+        Convert transaction_date to datetime and extract the month.
+        """
         sales["transaction_date"] = pd.to_datetime(sales["transaction_date"])
-        sales["month"] = sales["transaction_date"].dt.to_period("M").astype(str)
+        sales["month"] = month_column(sales["transaction_date"])
         return sales
 
-    def _fetch_support_tickets(self, conn, customer_id):
+    def _fetch_support_tickets(self, conn, customer_id, date_range=ALL_TIME):
         """
         Fetch support ticket data for a specific customer.
         """
-        tickets = pd.read_sql(
-            """
+        condition, params = date_range.condition("creation_date")
+        tickets = read_frame(
+            conn,
+            f"""
             SELECT creation_date, sentiment_score, status
             FROM support_tickets
-            WHERE customer_id = ?
+            WHERE customer_id = ? AND {condition}
             """,
-            conn,
-            params=(str(customer_id),),
+            params=[str(customer_id)] + params,
         )
-        # Convert creation_date to datetime and extract month
+        return self._prepare_tickets(tickets)
+
+    def _prepare_tickets(self, tickets):
+        """
+        Convert creation_date to datetime, extract the month and normalize the status.
+        """
         tickets["creation_date"] = pd.to_datetime(tickets["creation_date"])
-        tickets["month"] = tickets["creation_date"].dt.to_period("M").astype(str)
+        tickets["month"] = month_column(tickets["creation_date"])
         # Normalize the status column
-        tickets["status"] = tickets["status"].str.strip().str.lower()
+        tickets["status"] = normalize_categories(tickets["status"], lambda s: s.str.strip().str.lower())
         return tickets
 
     def _calculate_sales_summary(self, sales, max_ltv):
@@ -119,6 +447,20 @@ class CustomerService:
         total_spent = sales["sale_amount"].sum()
         avg_order_value = sales["sale_amount"].mean() if total_purchases else 0
 
+        return {
+            "total_purchases": int(total_purchases),
+            "total_spent": float(total_spent),
+            "avg_order_value": float(round(avg_order_value, 2)) if avg_order_value else None,
+            "ltv_score": self._normalize_ltv(self._customer_ltv(sales), max_ltv),
+        }
+
+    def _customer_ltv(self, sales):
+        """
+        Unnormalized LTV of one customer's sales.
+        """
+        total_purchases = len(sales)
+        avg_order_value = sales["sale_amount"].mean() if total_purchases else 0
+
         # Calculate purchase frequency and customer lifespan
         if total_purchases > 1:
             first_purchase = sales["transaction_date"].min()
@@ -130,20 +472,15 @@ class CustomerService:
             purchase_frequency = total_purchases
 
         # Calculate LTV using the formula
-        ltv_score = avg_order_value * purchase_frequency * customer_lifespan_in_years
+        return avg_order_value * purchase_frequency * customer_lifespan_in_years
 
+    def _normalize_ltv(self, ltv_score, max_ltv):
+        """
+        LTV score between 0 and 1, relative to the threshold.
+        """
         # Ensure max_ltv is valid
         max_ltv = max(max_ltv, 1)  # Avoid division by zero or invalid max_ltv
-
-        # Normalize LTV score between 0 and 1
-        normalized_ltv_score = min(1.0, ltv_score / max_ltv)
-
-        return {
-            "total_purchases": int(total_purchases),
-            "total_spent": float(total_spent),
-            "avg_order_value": float(round(avg_order_value, 2)) if avg_order_value else None,
-            "ltv_score": float(round(normalized_ltv_score, 2)),
-        }
+        return float(round(min(1.0, ltv_score / max_ltv), 2))
 
     def _calculate_support_summary(self, tickets):
         """
@@ -159,26 +496,27 @@ class CustomerService:
             "open_issues": int(open_issues),
         }
 
-    def _generate_charts(self, sales, tickets):
+    def _generate_charts(self, sales, tickets, granularity="month", max_points=None):
         """
         Generate data for charts such as sales over time, sentiment over time,
         and support ticket status breakdown.
         """
+        sales_period = sales["month"] if granularity == "month" else period_labels(sales["transaction_date"], granularity)
+        tickets_period = tickets["month"] if granularity == "month" else period_labels(tickets["creation_date"], granularity)
+
         # Sales over time chart
         sales_over_time = (
-            sales.groupby("month")["sale_amount"]
+            sales.groupby(sales_period.rename("date"), observed=True)["sale_amount"]
             .sum()
             .reset_index()
-            .rename(columns={"month": "date", "sale_amount": "amount"})
-            .to_dict(orient="records")
+            .rename(columns={"sale_amount": "amount"})
         )
         # Sentiment over time chart
         sentiment_over_time = (
-            tickets.groupby("month")["sentiment_score"]
+            tickets.groupby(tickets_period.rename("date"), observed=True)["sentiment_score"]
             .mean()
             .reset_index()
-            .rename(columns={"month": "date", "sentiment_score": "score"})
-            .to_dict(orient="records")
+            .rename(columns={"sentiment_score": "score"})
         )
         # Support ticket status breakdown chart
         support_status_breakdown = (
@@ -186,21 +524,11 @@ class CustomerService:
             .value_counts()
             .reset_index()
             .rename(columns={"index": "status", "status": "count"})
-            .to_dict(orient="records")
         )
         return {
-            "sales_over_time": [
-                {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-                for d in sales_over_time
-            ],
-            "sentiment_over_time": [
-                {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-                for d in sentiment_over_time
-            ],
-            "support_status_breakdown": [
-                {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-                for d in support_status_breakdown
-            ],
+            "sales_over_time": downsample(sales_over_time, "amount", max_points),
+            "sentiment_over_time": downsample(sentiment_over_time, "score", max_points),
+            "support_status_breakdown": support_status_breakdown,
         }
 
     def _determine_top_category(self, conn, sales):
@@ -242,43 +570,96 @@ class CustomerService:
         if top_category:
             ai_insights.append(f"Frequently purchases high-margin products in '{top_category}'.")
         return ai_insights
-    def generate_max_ltv_threshold(self, conn):
+
+    def generate_max_ltv_threshold(self, date_range=ALL_TIME, approx=None):
         """
         Compute the 95th percentile of LTV scores across all customers
-        to use as the normalization threshold.
+        to use as the normalization threshold. In approximate mode (default:
+        config.APPROX_MODE) it is estimated from the customer sample.
+        Exact thresholds are kept per data version and date range.
         """
+        if config.APPROX_MODE if approx is None else approx:
+            return self.approximate_ltv_threshold(date_range)[0]
+        return self._cached_threshold(date_range, False, self._exact_ltv_threshold)
 
-        # Fetch full sales data
-        sales_df = pd.read_sql(
-            """
-            SELECT customer_id, transaction_date, sale_amount
-            FROM sales_transactions
-            """,
-            conn,
-        )
-
-        # Preprocess dates
-        sales_df["transaction_date"] = pd.to_datetime(sales_df["transaction_date"])
-
-        # Compute LTV per customer using the same logic as in your per-customer method
-        def compute_ltv(group):
-            total_purchases = len(group)
-            avg_order_value = group["sale_amount"].mean()
+    def approximate_ltv_threshold(self, date_range=ALL_TIME):
+        """
+        95th percentile of LTV over the customer sample kept at ingest, and
+        its error bounds. Kept per data version and date range, like the
+        exact threshold.
+        """
+        return self._cached_threshold(date_range, True, self._sample_ltv_threshold)
 
-            if total_purchases > 1:
-                first = group["transaction_date"].min()
-                last = group["transaction_date"].max()
-                lifespan = max((last - first).days / 365, 1)
-                freq = total_purchases / lifespan
-            else:
-                lifespan = 1
-                freq = total_purchases
+    def _cached_threshold(self, date_range, approx, compute):
+        """
+        compute(date_range), kept in _ltv_thresholds per data version, date
+        range and mode.
+        """
+        conn = connect()
+        try:
+            key = (get_data_version(conn), date_range.key(), approx)
+        finally:
+            conn.close()
+        with _ltv_thresholds_lock:
+            if key in _ltv_thresholds:
+                return _ltv_thresholds[key]
+        threshold = compute(date_range)
+        with _ltv_thresholds_lock:
+            _ltv_thresholds[key] = threshold
+            if len(_ltv_thresholds) > LTV_THRESHOLD_CACHE_SIZE:
+                _ltv_thresholds.popitem(last=False)
+        return threshold
 
-            return avg_order_value * freq * lifespan
+    def _exact_ltv_threshold(self, date_range):
+        # Per-customer LTV inputs from the sharded map-reduce aggregates
+        stats = SalesAggregator().aggregate(date_range)["customers"]
 
-        # Group by customer and compute LTV
-        ltv_per_customer = sales_df.groupby("customer_id").apply(compute_ltv)
+        # Compute LTV per customer using the same logic as in the per-customer method
+        ltv_per_customer = self._compute_ltv(stats)
 
         # Return the 95th percentile (or any other quantile you want)
         return ltv_per_customer.quantile(0.95)
 
+    def _sample_ltv_threshold(self, date_range):
+        condition, params = date_range.condition("transaction_date")
+        conn = connect()
+        try:
+            store = ApproxStore(conn)
+            sales = read_sql_in(
+                conn,
+                f"""
+                SELECT customer_id, transaction_date, sale_amount
+                FROM sales_transactions
+                WHERE customer_id IN ({{ids}}) AND {condition}
+                """,
+                store.sampled_customers(),
+                params,
+            )
+            sales["transaction_date"] = pd.to_datetime(sales["transaction_date"])
+            return store.sample_quantile(self._compute_ltv(self._aggregate_sales(sales)), 0.95)
+        finally:
+            conn.close()
+
+    def _aggregate_sales(self, sales):
+        """
+        Aggregate sales per customer into the inputs of the LTV formula:
+        purchase count, total spent, average order value and first/last purchase dates.
+        """
+        return sales.groupby("customer_id").agg(
+            total_purchases=("sale_amount", "size"),
+            total_spent=("sale_amount", "sum"),
+            avg_order_value=("sale_amount", "mean"),
+            first_purchase=("transaction_date", "min"),
+            last_purchase=("transaction_date", "max"),
+        )
+
+    def _compute_ltv(self, stats):
+        """
+        Vectorized version of the LTV formula used in _calculate_sales_summary,
+        applied to the per-customer aggregates from _aggregate_sales.
+        """
+        multiple = stats["total_purchases"] > 1
+        lifespan = ((stats["last_purchase"] - stats["first_purchase"]).dt.days / 365).clip(lower=1)
+        lifespan = lifespan.where(multiple, 1)
+        purchase_frequency = stats["total_purchases"] / lifespan
+        return stats["avg_order_value"] * purchase_frequency * lifespan
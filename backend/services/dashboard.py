@@ -0,0 +1,46 @@
+from .serialization import to_python
+from .daterange import ALL_TIME
+from .overview import OverViewService
+from .insights import InsightService
+from .shared import SharedData
+
+# Sections a dashboard can be composed of, in response order
+SECTIONS = ["overview", "anomalies", "trends"]
+
+
+class DashboardService:
+    """
+    Several dashboard sections in one response. The sections of a request
+    share one SharedData, so sales are aggregated and tickets read once
+    however many sections need them.
+    """
+
+    def __init__(self):
+        pass
+
+    def get_dashboard(self, sections=None, date_range=ALL_TIME, approx=None):
+        """
+        The requested sections (default: all) under their names:
+        - overview: as returned by /overview
+        - anomalies: as returned by /insights/anomalies
+        - trends: as returned by /insights/trends
+        """
+        return to_python(self.get_dashboard_frames(sections, date_range, approx))
+
+    def get_dashboard_frames(self, sections=None, date_range=ALL_TIME, approx=None):
+        """
+        Same as get_dashboard, but trend and list fields are left as DataFrames.
+        Raises ValueError for an unknown section.
+        """
+        sections = sections or SECTIONS
+        unknown = [section for section in sections if section not in SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown sections: {', '.join(unknown)}. Choose from {', '.join(SECTIONS)}")
+
+        builders = {
+            "overview": lambda data: OverViewService().get_overview_frames(date_range, approx, data),
+            "anomalies": lambda data: InsightService().detect_anomalous_customers_frame(date_range=date_range, data=data),
+            "trends": lambda data: InsightService().highlight_trending_products_frames(date_range=date_range, data=data),
+        }
+        with SharedData(date_range) as data:
+            return {section: builders[section](data) for section in SECTIONS if section in sections}
@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+import re
+
+# Relative windows such as "90d", "12w", "6m", "1y"
+LAST_PATTERN = re.compile(r"^(\d+)([dwmy])$")
+UNIT_DAYS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+
+class DateRange:
+    """
+    An optional inclusive date range used to restrict analytics to part of
+    the history. Dates are stored as ISO strings, so the range is applied in
+    SQL as string comparisons that can use the date-leading indexes.
+    """
+
+    def __init__(self, start: date = None, end: date = None):
+        if start and end and start > end:
+            raise ValueError("'from' must not be after 'to'")
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_params(cls, date_from: date = None, date_to: date = None, last: str = None, today: date = None):
+        """
+        Build a range from explicit from/to dates or a relative `last` window
+        ending today (e.g. last=90d). `last` cannot be combined with `from`.
+        """
+        if last:
+            match = LAST_PATTERN.match(last.strip().lower())
+            if not match:
+                raise ValueError("'last' must look like 90d, 12w, 6m or 1y")
+            if date_from:
+                raise ValueError("'last' cannot be combined with 'from'")
+            date_to = date_to or today or date.today()
+            date_from = date_to - timedelta(days=int(match.group(1)) * UNIT_DAYS[match.group(2)] - 1)
+        return cls(date_from, date_to)
+
+    def __bool__(self):
+        return self.start is not None or self.end is not None
+
+    def condition(self, column):
+        """
+        SQL condition and parameters restricting `column` to the range.
+        Returns an always-true condition when the range is open on both ends.
+        """
+        conditions, params = [], []
+        if self.start:
+            conditions.append(f"{column} >= ?")
+            params.append(self.start.isoformat())
+        if self.end:
+            # Exclusive upper bound on the next day also covers timestamps on the end date
+            conditions.append(f"{column} < ?")
+            params.append((self.end + timedelta(days=1)).isoformat())
+        return (" AND ".join(conditions) or "1 = 1"), params
+
+    def key(self):
+        """
+        Hashable representation, e.g. for cache keys.
+        """
+        return (self.start.isoformat() if self.start else None, self.end.isoformat() if self.end else None)
+
+
+ALL_TIME = DateRange()
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import zlib
+from db import connect
+from .daterange import ALL_TIME
+
+
+class ExportService:
+    # Export name -> (table, date column used for range filtering)
+    TABLES = {
+        "transactions": ("sales_transactions", "transaction_date"),
+        "tickets": ("support_tickets", "creation_date"),
+    }
+    MEDIA_TYPES = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+    }
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def export_rows(self, name, fmt="ndjson", customer_id=None, product_id=None,
+                    date_range=ALL_TIME, compress=False):
+        """
+        Stream raw rows of an exportable table as NDJSON or CSV byte chunks.
+        Rows are pulled from a SQLite cursor `batch_size` at a time, so memory use is
+        bounded by one batch regardless of the result size. The generator is only
+        advanced when the previous chunk has been sent, which gives backpressure when
+        it is consumed by a StreamingResponse. Optionally gzip-compresses on the fly.
+        """
+        table, date_column = self.TABLES[name]
+        query, params = self._build_query(table, date_column, customer_id, product_id, date_range)
+        compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+
+        conn = connect()
+        try:
+            cursor = conn.execute(query, params)
+            columns = [c[0] for c in cursor.description]
+            if fmt == "csv":
+                chunk = self._encode_csv([columns])
+                yield compressor.compress(chunk) if compressor else chunk
+
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    chunk = self._encode_csv(rows)
+                else:
+                    chunk = "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows).encode()
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+
+            if compressor:
+                yield compressor.flush()
+        finally:
+            conn.close()
+
+    def _build_query(self, table, date_column, customer_id, product_id, date_range):
+        """
+        Build the filtered SELECT for an export.
+        """
+        condition, params = date_range.condition(date_column)
+        conditions = [condition]
+        if customer_id is not None:
+            conditions.append("customer_id = ?")
+            params.append(customer_id)
+        if product_id is not None:
+            conditions.append("product_id = ?")
+            params.append(product_id)
+        return f"SELECT * FROM {table} WHERE " + " AND ".join(conditions), params
+
+    def _encode_csv(self, rows):
+        """
+        Encode a batch of rows as CSV bytes.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
@@ -0,0 +1,166 @@
+from config import config
+import sqlite3
+import pandas as pd
+from db import (
+    add_customer_product_purchases,
+    append_to_sales_shards,
+    bump_data_version,
+    ensure_customer_product_purchases,
+    ensure_sales_shards,
+    get_data_version,
+    insert_rows,
+)
+from .anomalies import AnomalyEngine
+from .cohorts import CohortCube
+from .sla import SlaHistograms
+from .suppliers import SupplierMetrics
+from .approx import ApproxStore
+from .profile_cache import ProfileTouches
+from .leaderboards import Leaderboards
+from .snapshot import snapshots
+
+
+class IngestService:
+    """
+    Append new rows to the fact tables and keep the incrementally maintained
+    analytics state in step, in the same transaction as the insert.
+    """
+
+    def __init__(self):
+        pass
+
+    def append_tickets(self, tickets: pd.DataFrame, today=None):
+        """
+        Append support tickets and update the anomaly engine, SLA
+        histograms, supplier metrics, sentiment sketches, the product issue
+        leaderboard and the record of touched profiles. Tickets without a
+        ticket_id are numbered after the current maximum. Returns the new data version.
+        """
+        return self.append(tickets=tickets, today=today)
+
+    def append_transactions(self, sales: pd.DataFrame):
+        """
+        Append sales transactions and update the month shards, the
+        customer x product purchase counts, the cohort cube, the supplier
+        metrics, the leaderboards and the record of touched profiles. Transactions without a transaction_id are numbered after the current maximum.
+        Returns the new data version.
+        """
+        return self.append(sales=sales)
+
+    def append(self, sales: pd.DataFrame = None, tickets: pd.DataFrame = None, today=None, conn=None):
+        """
+        Append transactions and/or tickets (see append_transactions and
+        append_tickets) in one transaction that bumps the data version once.
+        Runs on `conn` when given, which is left open. Returns the new data version.
+
+        Every worker process has its own writer, so the transaction takes the
+        database write lock before numbering rows: concurrent appends wait for
+        it (up to INGEST_BUSY_TIMEOUT_SECONDS) instead of reading the same maximum id.
+        """
+        own = conn is None
+        if own:
+            conn = sqlite3.connect(config.DB_PATH)
+        conn.execute(f"PRAGMA busy_timeout = {int(config.INGEST_BUSY_TIMEOUT_SECONDS * 1000)}")
+        has_sales = sales is not None and len(sales) > 0
+        has_tickets = tickets is not None and len(tickets) > 0
+        try:
+            # Derived tables the database predates are built (and committed)
+            # from the fact tables before the lock is taken
+            derived = self._ensure_derived(conn, has_sales, has_tickets, today)
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            if has_sales:
+                self._add_transactions(conn, derived, self._normalize_dates(sales, ["transaction_date"]))
+            if has_tickets:
+                self._add_tickets(
+                    conn, derived, self._normalize_dates(tickets, ["creation_date", "resolution_date"]), today
+                )
+            version = bump_data_version(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if own:
+                conn.close()
+        self._publish_snapshot(version)
+        return version
+
+    def _ensure_derived(self, conn, has_sales, has_tickets, today=None):
+        """
+        The incrementally maintained tables the appended rows update, each
+        built first if it is missing.
+        """
+        derived = {}
+        if has_sales:
+            ensure_sales_shards(conn)
+            ensure_customer_product_purchases(conn)
+            derived["cube"] = CohortCube(conn)
+        if has_tickets:
+            derived["sla"] = SlaHistograms(conn)
+            derived["sketches"] = ApproxStore(conn)
+        if has_sales or has_tickets:
+            derived["suppliers"] = SupplierMetrics(conn)
+            derived["touches"] = ProfileTouches(conn)
+            derived["leaderboards"] = Leaderboards(conn)
+        for table in derived.values():
+            table.ensure()
+        if has_tickets:
+            derived["engine"] = AnomalyEngine(conn, config.ANOMALY_WINDOW_DAYS)
+            derived["engine"].ensure(today)
+        return derived
+
+    def _add_tickets(self, conn, derived, tickets, today=None):
+        tickets = self._number(conn, tickets, "ticket_id", "support_tickets")
+        insert_rows(conn, "support_tickets", tickets)
+        derived["engine"].add_tickets(tickets, today)
+        for name in ["sla", "suppliers", "sketches", "touches", "leaderboards"]:
+            derived[name].add_tickets(tickets)
+
+    def _add_transactions(self, conn, derived, sales):
+        sales = self._number(conn, sales, "transaction_id", "sales_transactions")
+        append_to_sales_shards(conn, sales)
+        add_customer_product_purchases(conn, sales)
+        for name in ["cube", "suppliers", "touches", "leaderboards"]:
+            derived[name].add_transactions(sales)
+        insert_rows(conn, "sales_transactions", sales)
+
+    def _number(self, conn, rows, id_column, table):
+        """
+        Give rows without an id (missing column or null) the ids after the table's current maximum.
+        """
+        if id_column not in rows.columns:
+            rows = rows.assign(**{id_column: pd.NA})
+        missing = rows[id_column].isna()
+        if missing.any():
+            (max_id,) = conn.execute(f"SELECT COALESCE(MAX({id_column}), 0) FROM {table}").fetchone()
+            rows = rows.copy()
+            rows.loc[missing, id_column] = range(max_id + 1, max_id + 1 + int(missing.sum()))
+        return rows.astype({id_column: "int64"})
+
+    def _publish_snapshot(self, version):
+        """
+        Replace the shared snapshot of multi-worker deployments with one of
+        the new data version. Skipped once another writer has committed a
+        newer version, which it publishes itself.
+        """
+        if not snapshots.enabled():
+            return
+        conn = sqlite3.connect(config.DB_PATH)
+        try:
+            current = get_data_version(conn)
+        finally:
+            conn.close()
+        if current == version:
+            snapshots.publish()
+
+    def _normalize_dates(self, df, columns):
+        """
+        Store dates as ISO strings, like the initial ingest does.
+        """
+        df = df.copy()
+        for column in columns:
+            if column in df.columns:
+                df[column] = pd.to_datetime(df[column], dayfirst=True).dt.strftime("%Y-%m-%d")
+        return df
@@ -1,26 +1,46 @@
 from config import config
-import sqlite3
 import pandas as pd
 import numpy as np
-from scipy.stats import zscore
+from db import connect
+from deadline import check_deadline
+from .serialization import to_python, to_records
+from .daterange import ALL_TIME
+from .anomalies import AnomalyEngine
+from .risk import CustomerRiskScorer
+from .shared import SharedData
+from .utils import read_sql_in
 
 
 class InsightService:
     def __init__(self):
         pass
 
-    def detect_anomalous_customers(self, z_threshold: float = 2.0):
+    def detect_anomalous_customers(self, z_threshold: float = 2.0, date_range=ALL_TIME):
         """
         Detect customers with anomalous behavior based on negative sentiment tickets.
         """
-        conn = sqlite3.connect(config.DB_PATH)
+        return to_records(self.detect_anomalous_customers_frame(z_threshold, date_range))
 
-        # Fetch support tickets with sentiment scores
-        tickets = self._fetch_support_tickets_with_sentiment(conn)
-        conn.close()
+    def detect_anomalous_customers_frame(self, z_threshold: float = 2.0, date_range=ALL_TIME, data=None):
+        """
+        DataFrame version of detect_anomalous_customers. Without a DateRange the
+        incrementally maintained AnomalyEngine answers from its running statistics
+        (built at startup and updated at ingest; requests only read them);
+        an explicit range is recomputed from the tickets, read through `data`
+        (a SharedData over the same range) when given.
+        """
+        if data is None:
+            with SharedData(date_range) as data:
+                return self.detect_anomalous_customers_frame(z_threshold, date_range, data)
+
+        if not date_range:
+            return AnomalyEngine(data.conn, config.ANOMALY_WINDOW_DAYS).anomalies(z_threshold)
+
+        # Support tickets with sentiment scores
+        tickets = self._support_tickets_with_sentiment(data.tickets, data.customers)
 
         if tickets.empty:
-            return []
+            return pd.DataFrame(columns=["customer_id", "customer_name", "negative_ticket_count", "z_score"])
 
         # Process and detect anomalies
         tickets = self._label_negative_sentiment(tickets)
@@ -29,19 +49,14 @@ class InsightService:
 
         return anomalies
 
-    def _fetch_support_tickets_with_sentiment(self, conn):
+    def _support_tickets_with_sentiment(self, tickets, customers):
         """
-        Fetch support tickets with sentiment scores from the database.
+        Tickets with a sentiment score, with the name of their customer.
         """
-        return pd.read_sql(
-            """
-            SELECT st.customer_id, c.customer_name, st.sentiment_score
-            FROM support_tickets st
-            JOIN customers c ON st.customer_id = c.customer_id
-            WHERE st.sentiment_score IS NOT NULL
-            """,
-            conn,
-        )
+        scored = tickets.loc[tickets["sentiment_score"].notna(), ["customer_id", "sentiment_score"]]
+        return scored.merge(customers[["customer_id", "customer_name"]], on="customer_id")[
+            ["customer_id", "customer_name", "sentiment_score"]
+        ]
 
     def _label_negative_sentiment(self, tickets):
         """
@@ -65,132 +80,129 @@ class InsightService:
         """
         Compute Z-scores for negative ticket counts and filter anomalous customers.
         """
+        # scipy.stats takes most of a second to import, so only when needed
+        from scipy.stats import zscore
+
         negative_counts["z_score"] = zscore(negative_counts["negative_ticket_count"])
         anomalies = negative_counts[negative_counts["z_score"] > z_threshold]
-        return anomalies.sort_values("z_score", ascending=False).to_dict(orient="records")
+        return anomalies.sort_values("z_score", ascending=False)
+
+    def score_customer_risk(self, weights=None, top_n: int = 20, date_range=ALL_TIME):
+        """
+        Rank customers by a weighted risk score combining spend drop, ticket
+        spike, sentiment decline and open-issue backlog.
+        """
+        return to_records(self.score_customer_risk_frame(weights, top_n, date_range))
 
-    def highlight_trending_products(self, threshold: float = 0.6):
+    def score_customer_risk_frame(self, weights=None, top_n: int = 20, date_range=ALL_TIME):
+        """
+        DataFrame version of score_customer_risk. `weights` override the
+        configured RISK_WEIGHTS per signal.
+        """
+        conn = connect()
+        try:
+            scorer = CustomerRiskScorer(conn, block_size=config.RISK_BLOCK_SIZE)
+            risk = scorer.score({**config.RISK_WEIGHTS, **(weights or {})}, top_n, date_range)
+            names = read_sql_in(
+                conn,
+                "SELECT customer_id, customer_name FROM customers WHERE customer_id IN ({ids})",
+                risk["customer_id"].tolist(),
+            )
+        finally:
+            conn.close()
+
+        names = names.set_index("customer_id")["customer_name"]
+        risk.insert(1, "customer_name", risk["customer_id"].map(names))
+        return risk
+
+    def highlight_trending_products(self, threshold: float = 0.6, date_range=ALL_TIME):
         """
         Highlight products with rapidly increasing or decreasing sales trends.
+        With a DateRange, the latest month of the range is compared with the three before it.
         """
-        conn = sqlite3.connect(config.DB_PATH)
+        return to_python(self.highlight_trending_products_frames(threshold, date_range))
 
-        # Fetch sales and product data
-        sales = self._fetch_sales_data(conn)
-        products = self._fetch_product_data(conn)
-        conn.close()
+    def highlight_trending_products_frames(self, threshold: float = 0.6, date_range=ALL_TIME, data=None):
+        """
+        Same as highlight_trending_products, but the trend lists are DataFrames.
+        Inputs are read through `data` (a SharedData over the same range) when given.
+        """
+        if data is None:
+            with SharedData(date_range) as data:
+                return self.highlight_trending_products_frames(threshold, date_range, data)
 
-        if sales.empty:
-            return {"rising_trends": [], "falling_trends": []}
+        # Per-product monthly sales from the sharded map-reduce aggregates
+        monthly_sales = data.aggregates["product_months"]
+        products = data.products[["product_id", "product_name"]]
 
-        # Process and calculate trends
-        sales = self._prepare_sales_data(sales)
-        monthly_sales = self._group_sales_by_product_and_month(sales)
+        if monthly_sales.empty:
+            empty = pd.DataFrame(columns=["product_id", "trend", "change", "product_name"])
+            return {"rising_trends": empty, "falling_trends": empty}
+
+        # Calculate trends
+        check_deadline()
+        monthly_sales = monthly_sales[["product_id", "month", "sale_amount"]]
         trends = self._calculate_trends(monthly_sales, threshold)
 
         # Add product names to trends
         trends = self._add_product_names_to_trends(trends, products)
 
         # Separate rising and falling trends
-        rising = sorted(
-            [t for t in trends if t["trend"] == "increasing"],
-            key=lambda x: x["change"],
-            reverse=True,  # Sort descending by change
+        rising = (
+            trends[trends["trend"] == "increasing"]
+            .sort_values("change", ascending=False, kind="stable")  # Sort descending by change
+            .reset_index(drop=True)
         )
-        falling = sorted(
-            [t for t in trends if t["trend"] == "decreasing"],
-            key=lambda x: x["change"],  # Sort ascending by change
+        falling = (
+            trends[trends["trend"] == "decreasing"]
+            .sort_values("change", kind="stable")  # Sort ascending by change
+            .reset_index(drop=True)
         )
 
         return {"rising_trends": rising, "falling_trends": falling}
 
-    def _fetch_sales_data(self, conn):
-        """
-        Fetch sales data with product_id and transaction_date from the database.
-        """
-        return pd.read_sql(
-            """
-            SELECT product_id, transaction_date, sale_amount
-            FROM sales_transactions
-            """,
-            conn,
-        )
-
-    def _fetch_product_data(self, conn):
-        """
-        Fetch product details from the database.
-        """
-        return pd.read_sql(
-            """
-            SELECT product_id, product_name
-            FROM products
-            """,
-            conn,
-        )
-
-    def _prepare_sales_data(self, sales):
-        """
-        Convert transaction_date to datetime and extract the month.
-        """
-        sales["transaction_date"] = pd.to_datetime(sales["transaction_date"])
-        sales["month"] = sales["transaction_date"].dt.to_period("M").astype(str)
-        return sales
-
-    def _group_sales_by_product_and_month(self, sales):
-        """
-        Group sales data by product and month, summing up sale amounts.
-        """
-        return sales.groupby(["product_id", "month"])["sale_amount"].sum().reset_index()
-
     def _calculate_trends(self, monthly_sales, threshold):
         """
         Calculate sales trends (increasing or decreasing) for each product.
+        Compares each product's latest-month sales with its average over the
+        previous three months, for all products at once.
         """
-        latest_month = monthly_sales["month"].max()
-        prev_months = [(pd.Period(latest_month) - i).strftime("%Y-%m") for i in range(1, 4)]
-        recent_month = pd.Period(latest_month).strftime("%Y-%m")
+        latest_month = pd.Period(monthly_sales["month"].max())
+        prev_months = [(latest_month - i).strftime("%Y-%m") for i in range(1, 4)]
+        recent_month = latest_month.strftime("%Y-%m")
 
-        trends = []
+        recent = (
+            monthly_sales[monthly_sales["month"] == recent_month]
+            .set_index("product_id")["sale_amount"]
+        )
+        past_avg = (
+            monthly_sales[monthly_sales["month"].isin(prev_months)]
+            .groupby("product_id")["sale_amount"]
+            .mean()
+        )
 
-        for product_id, group in monthly_sales.groupby("product_id"):
-            group = group.set_index("month")
-            recent = group.loc[recent_month]["sale_amount"] if recent_month in group.index else 0
-            past_avg = (
-                group.loc[group.index.isin(prev_months)]["sale_amount"].mean()
-                if any(m in group.index for m in prev_months)
-                else 0
-            )
+        # Products without sales in the previous months are skipped (avoids division by zero)
+        past_avg = past_avg[past_avg != 0]
+        recent = recent.reindex(past_avg.index, fill_value=0)
+        pct_change = (recent - past_avg) / past_avg
 
-            # Avoid division by zero
-            if past_avg == 0:
-                continue
-
-            pct_change = (recent - past_avg) / past_avg
-
-            if pct_change >= threshold:
-                trends.append(
-                    {
-                        "product_id": product_id,
-                        "trend": "increasing",
-                        "change": round(pct_change, 2),
-                    }
-                )
-            elif pct_change <= -threshold:
-                trends.append(
-                    {
-                        "product_id": product_id,
-                        "trend": "decreasing",
-                        "change": round(pct_change, 2),
-                    }
-                )
-
-        return trends
+        trend = np.select(
+            [pct_change >= threshold, pct_change <= -threshold],
+            ["increasing", "decreasing"],
+            default="",
+        )
+        trends = pd.DataFrame(
+            {
+                "product_id": past_avg.index,
+                "trend": trend,
+                "change": pct_change.round(2).values,
+            }
+        )
+        return trends[trends["trend"] != ""]
 
     def _add_product_names_to_trends(self, trends, products):
         """
         Add product names to the trends based on product_id.
         """
-        product_names = products.set_index("product_id")["product_name"].to_dict()
-        for trend in trends:
-            trend["product_name"] = product_names.get(trend["product_id"], "Unknown")
-        return trends
+        product_names = products.set_index("product_id")["product_name"]
+        return trends.assign(product_name=trends["product_id"].map(product_names).fillna("Unknown"))
@@ -0,0 +1,217 @@
+from config import config
+import sqlite3
+import pandas as pd
+from db import PURCHASES_TABLE, connect
+from .utils import read_sql_in
+
+LEADERBOARD_TABLE = "leaderboards"
+
+# Board -> (ranked entity, what it is scored by, the scopes it is also kept per)
+BOARDS = {
+    "customers": ("customer_id", "spend", ["region", "month"]),
+    "products": ("product_id", "revenue", ["category", "month"]),
+    "product_issues": ("product_id", "tickets", ["category", "month"]),
+}
+
+# Ranked entity -> (table it is listed in, its name column)
+ENTITIES = {
+    "customer_id": ("customers", "customer_name"),
+    "product_id": ("products", "product_name"),
+}
+
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {LEADERBOARD_TABLE} (
+           board TEXT NOT NULL,
+           scope TEXT NOT NULL,
+           entity_id INTEGER NOT NULL,
+           score REAL NOT NULL,
+           count INTEGER NOT NULL,
+           PRIMARY KEY (board, scope, entity_id)
+       )""",
+    # Top-N of a board is a walk down this index
+    f"""CREATE INDEX IF NOT EXISTS idx_{LEADERBOARD_TABLE}_rank
+       ON {LEADERBOARD_TABLE} (board, scope, score DESC, entity_id)""",
+]
+
+
+def scope_key(region=None, category=None, month=None):
+    """
+    The scope a leaderboard variant is stored under: "" for the whole
+    history, else e.g. "region:North" or "month:2024-05". At most one of the
+    arguments may be given.
+    """
+    given = [(name, value) for name, value in [("region", region), ("category", category), ("month", month)] if value]
+    if len(given) > 1:
+        raise ValueError("Only one of region, category and month can be given")
+    return f"{given[0][0]}:{given[0][1]}" if given else ""
+
+
+class Leaderboards:
+    """
+    Running totals per entity behind the top-N lists: customers by spend,
+    products by revenue and products by ticket count, for the whole history
+    and per region or category and per month. Built at ingest and updated
+    as transactions and tickets are appended, so a top-N query reads N index
+    entries instead of grouping the fact tables. The per-product top buyers
+    come from the customer x product purchase counts, which are kept the
+    same way.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def ensure(self):
+        """
+        Build the leaderboards if the database was ingested before they existed.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LEADERBOARD_TABLE,)
+        ).fetchone()
+        if not exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Recompute all leaderboards from sales_transactions and support_tickets.
+        """
+        self.conn.execute(f"DROP TABLE IF EXISTS {LEADERBOARD_TABLE}")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.add_transactions(
+            pd.read_sql("SELECT customer_id, product_id, sale_amount, transaction_date FROM sales_transactions", self.conn)
+        )
+        self.add_tickets(pd.read_sql("SELECT product_id, creation_date FROM support_tickets", self.conn))
+        self.conn.commit()
+
+    def add_transactions(self, sales: pd.DataFrame):
+        """
+        Add appended transactions to the customer and product boards. Does not commit.
+        """
+        sales = sales.assign(
+            month=sales["transaction_date"].astype(str).str[:7],
+            region=sales["customer_id"].map(self._lookup("customers", "customer_id", "region", sales["customer_id"])),
+            category=sales["product_id"].map(self._lookup("products", "product_id", "category", sales["product_id"])),
+        )
+        self._add("customers", sales, sales["sale_amount"])
+        self._add("products", sales, sales["sale_amount"])
+
+    def add_tickets(self, tickets: pd.DataFrame):
+        """
+        Add appended tickets to the product issue board. Does not commit.
+        """
+        tickets = tickets.assign(
+            month=tickets["creation_date"].astype(str).str[:7],
+            category=tickets["product_id"].map(self._lookup("products", "product_id", "category", tickets["product_id"])),
+        )
+        self._add("product_issues", tickets, pd.Series(1, index=tickets.index))
+
+    def top(self, board, n=None, scope=""):
+        """
+        entity_id, score and count of the `n` (default: LEADERBOARD_SIZE)
+        highest scoring entities of a board, best first; ties by entity id.
+        Ids missing from the customers / products table are skipped, so
+        they do not take places in the list.
+        """
+        if board not in BOARDS:
+            raise ValueError(f"Unknown leaderboard: {board}")
+        entity = BOARDS[board][0]
+        table, _ = ENTITIES[entity]
+        return pd.read_sql(
+            f"""
+            SELECT l.entity_id, l.score, l.count FROM {LEADERBOARD_TABLE} l
+            JOIN {table} e ON e.{entity} = l.entity_id
+            WHERE l.board = ? AND l.scope = ?
+            ORDER BY l.score DESC, l.entity_id
+            LIMIT ?
+            """,
+            self.conn,
+            params=[board, scope, n or config.LEADERBOARD_SIZE],
+        )
+
+    def top_buyers(self, product_id, n=None, min_purchases=2):
+        """
+        customer_id, customer_name and purchase_count of the customers who
+        bought a product most often (at least `min_purchases` times), best first.
+        """
+        return pd.read_sql(
+            f"""
+            SELECT p.customer_id, c.customer_name, p.purchase_count
+            FROM {PURCHASES_TABLE} p
+            JOIN customers c ON p.customer_id = c.customer_id
+            WHERE p.product_id = ? AND p.purchase_count >= ?
+            ORDER BY p.purchase_count DESC, p.customer_id
+            LIMIT ?
+            """,
+            self.conn,
+            params=[product_id, min_purchases, n or config.LEADERBOARD_SIZE],
+        )
+
+    def _add(self, board, rows, values):
+        entity, _, scopes = BOARDS[board]
+        rows = rows.assign(value=values)
+        totals = []
+        for scope in [None] + scopes:
+            keys = [entity] if scope is None else [scope, entity]
+            grouped = rows.dropna(subset=keys).groupby(keys)["value"].agg(["sum", "size"]).reset_index()
+            labels = [""] * len(grouped) if scope is None else (f"{scope}:" + grouped[scope].astype(str)).tolist()
+            totals.extend(
+                (board, label, int(entity_id), float(score), int(count))
+                for label, entity_id, score, count in zip(labels, grouped[entity], grouped["sum"], grouped["size"])
+            )
+        self.conn.executemany(
+            f"""
+            INSERT INTO {LEADERBOARD_TABLE} (board, scope, entity_id, score, count) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (board, scope, entity_id) DO UPDATE SET
+                score = score + excluded.score,
+                count = count + excluded.count
+            """,
+            totals,
+        )
+
+    def _lookup(self, table, key, column, ids):
+        """
+        {id: column} of the rows of `table` with the given ids.
+        """
+        found = read_sql_in(
+            self.conn, f"SELECT {key}, {column} FROM {table} WHERE {key} IN ({{ids}})", ids.dropna().astype(int).unique().tolist()
+        )
+        return dict(zip(found[key], found[column]))
+
+
+class LeaderboardService:
+    """
+    Named top-N lists read from the Leaderboards.
+    """
+
+    def __init__(self):
+        pass
+
+    def get_leaderboard_frame(self, board, n=None, region=None, category=None, month=None):
+        """
+        The top `n` entities of a board, optionally of one region (customer
+        board), category (product boards) or "YYYY-MM" month, with their
+        names, score and count. Raises ValueError for an unknown board or a
+        scope the board is not kept per.
+        """
+        if board not in BOARDS:
+            raise ValueError(f"Unknown leaderboard: {board}")
+        entity, score, scopes = BOARDS[board]
+        scope = scope_key(region, category, month)
+        if scope and scope.split(":", 1)[0] not in scopes:
+            raise ValueError(f"The {board} leaderboard is kept per {' and '.join(scopes)} only")
+
+        table, name = ENTITIES[entity]
+        conn = connect()
+        try:
+            top = Leaderboards(conn).top(board, n, scope)
+            names = read_sql_in(conn, f"SELECT {entity}, {name} FROM {table} WHERE {entity} IN ({{ids}})", top["entity_id"].tolist())
+        finally:
+            conn.close()
+        if board == "product_issues":
+            top["score"] = top["score"].astype("int64")
+        return (
+            top.rename(columns={"entity_id": entity, "score": score})
+            .merge(names, on=entity, how="left")
+            [[entity, name, score, "count"]]
+            .assign(rank=lambda frame: range(1, len(frame) + 1))
+        )
@@ -0,0 +1,94 @@
+from config import config
+import numpy as np
+import pandas as pd
+
+# Compact dtypes per table. Ids fit in int32 and low-cardinality strings become
+# categoricals. Amounts and prices stay float64 because they are summed, and so
+# do sentiment scores: their means are rounded to two decimals, and float32
+# shifts means that sit on a rounding boundary. Scores that are only read back
+# (supplier reliability) are float32.
+DTYPES = {
+    "customers": {"customer_id": "int32", "region": "category", "industry": "category"},
+    "products": {"product_id": "int32", "category": "category"},
+    "sales_transactions": {
+        "transaction_id": "int32",
+        "customer_id": "int32",
+        "product_id": "int32",
+        "quantity": "int32",
+    },
+    "support_tickets": {
+        "ticket_id": "int32",
+        "customer_id": "int32",
+        "product_id": "int32",
+        "issue_type": "category",
+        "status": "category",
+    },
+    "supplier_data": {
+        "supplier_id": "int32",
+        "product_id": "int32",
+        "lead_time_days": "int32",
+        "reliability_score": "float32",
+    },
+}
+# Column names mean the same thing in every table, so one map covers joins too
+COLUMN_DTYPES = {column: dtype for table in DTYPES.values() for column, dtype in table.items()}
+
+
+def compact(df, dtypes=None):
+    """
+    Cast the columns of `df` found in the dtype map (default: every table's
+    columns). Integer columns holding NULLs keep their float dtype.
+    Does nothing when config.COMPACT_DTYPES is off.
+    """
+    if not config.COMPACT_DTYPES:
+        return df
+    casts = {}
+    for column, dtype in (dtypes or COLUMN_DTYPES).items():
+        if column not in df.columns or str(df[column].dtype) == dtype:
+            continue
+        if dtype.startswith("int") and df[column].isna().any():
+            continue
+        casts[column] = dtype
+    return df.astype(casts) if casts else df
+
+
+def read_frame(conn, query, params=None, dtypes=None):
+    """
+    pd.read_sql followed by compact().
+    """
+    return compact(pd.read_sql(query, conn, params=params), dtypes)
+
+
+def month_column(dates):
+    """
+    Calendar month of each date as an ordered categorical of "YYYY-MM"
+    labels. The codes are integer month keys counted from the first month,
+    so each row costs a small integer instead of a Python string.
+    Group by it with observed=True so empty months are not added.
+    """
+    if not config.COMPACT_DTYPES:
+        return pd.to_datetime(dates).dt.to_period("M").astype(str)
+    dates = pd.to_datetime(dates)
+    keys = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=float)
+    valid = ~np.isnan(keys)
+    if not valid.any():
+        return pd.Series(pd.Categorical([None] * len(dates), categories=[], ordered=True), index=dates.index)
+    first, last = int(keys[valid].min()), int(keys[valid].max())
+    labels = [f"{key // 12:04d}-{key % 12 + 1:02d}" for key in range(first, last + 1)]
+    codes = np.where(valid, np.nan_to_num(keys, nan=first) - first, -1).astype(np.int32)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels, ordered=True), index=dates.index)
+
+
+def normalize_categories(series, normalize):
+    """
+    Apply a Series -> Series string normalization (e.g. strip + lower) to a column. For
+    categoricals only the categories are normalized and merged, not every row.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return normalize(series)
+    normalized = normalize(series.cat.categories.to_series())
+    categories = pd.Index(normalized.unique())
+    mapping = categories.get_indexer(normalized)
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, mapping[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=series.index, name=series.name)
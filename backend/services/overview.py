@@ -1,61 +1,86 @@
 from config import config
-import sqlite3
 import pandas as pd
-import numpy as np
+from .serialization import to_python
+from .daterange import ALL_TIME
+from .approx import ApproxStore
+from .loader import month_column
+from .shared import SharedData
+from .leaderboards import Leaderboards
 
 
 class OverViewService:
     def __init__(self):
         pass
 
-    def get_overview(self):
+    def get_overview(self, date_range=ALL_TIME, approx=None):
         """
-        Fetch an overview of sales, customers, products, and support data.
+        Fetch an overview of sales, customers, products, and support data,
+        optionally restricted to a DateRange of transactions and tickets.
+        In approximate mode (default: config.APPROX_MODE) the support figures
+        come from the daily sentiment rollup kept at ingest instead of a
+        ticket scan, as noted under "approximation". Sales and customer
+        figures are always exact: they come from the aggregates either way.
         """
-        conn = sqlite3.connect(config.DB_PATH)
+        return to_python(self.get_overview_frames(date_range, approx))
 
-        # Fetch and process data for each section
-        sales_overview = self._get_sales_overview(conn)
-        customer_overview = self._get_customer_overview(conn)
-        product_overview = self._get_product_overview(conn)
-        support_overview = self._get_support_overview(conn)
-
-        conn.close()
+    def get_overview_frames(self, date_range=ALL_TIME, approx=None, data=None):
+        """
+        Same as get_overview, but trend and list fields are left as DataFrames
+        so they can be serialized to JSON or to a columnar format.
+        Inputs are read through `data` (a SharedData over the same range)
+        when the caller shares them with other sections.
+        """
+        if data is None:
+            with SharedData(date_range) as data:
+                return self.get_overview_frames(date_range, approx, data)
+
+        approx = config.APPROX_MODE if approx is None else approx
+        # Sales sections are built from the sharded map-reduce aggregates
+        aggregates = data.aggregates
+
+        # Fetch and process data for each section; top-N lists over the whole
+        # history come from the leaderboards maintained at ingest
+        leaderboards = None if date_range else Leaderboards(data.conn)
+        sales_overview = self._get_sales_overview(aggregates)
+        customer_overview = self._get_customer_overview(data.customers, aggregates, leaderboards)
+        product_overview = self._get_product_overview(data.conn, aggregates, data.products, date_range, leaderboards)
+        # The aggregates are needed for the sales figures anyway, so the exact
+        # count of active customers costs nothing and is never estimated
+        customer_overview["active_customers"] = int(len(aggregates["customers"]))
+        if approx:
+            support_overview = self._get_support_overview_approx(data.conn, ApproxStore(data.conn), date_range)
+        else:
+            support_overview = self._get_support_overview(data.tickets)
 
         # Combine all sections into the final JSON response
-        return {
+        overview = {
             "sales_overview": sales_overview,
             "customer_overview": customer_overview,
             "product_overview": product_overview,
             "support_overview": support_overview,
         }
+        if approx:
+            overview["approximation"] = {"support_overview": {"method": "daily rollup", "exact": True}}
+        return overview
 
-    def _get_sales_overview(self, conn):
+    def _get_sales_overview(self, aggregates):
         """
-        Fetch and process sales data for the overview.
+        Process the monthly sales aggregates for the overview.
         """
-        sales = pd.read_sql("SELECT sale_amount, transaction_date FROM sales_transactions", conn)
-        sales["transaction_date"] = pd.to_datetime(sales["transaction_date"])
-        sales["month"] = sales["transaction_date"].dt.to_period("M").astype(str)
+        monthly = aggregates["monthly"]
 
-        total_sales = len(sales)
-        total_revenue = float(sales["sale_amount"].sum())
-        avg_sale_value = float(sales["sale_amount"].mean()) if total_sales else 0.0
+        total_sales = int(monthly["count"].sum())
+        total_revenue = float(monthly["amount"].sum())
+        avg_sale_value = total_revenue / total_sales if total_sales else 0.0
 
         # Sales trend (last 6 months)
         sales_trend = (
-            sales.groupby("month")["sale_amount"]
-            .sum()
+            monthly["amount"]
             .reset_index()
-            .rename(columns={"month": "date", "sale_amount": "amount"})
-            .sort_values("date")
+            .rename(columns={"month": "date"})
             .tail(6)
-            .to_dict(orient="records")
+            .reset_index(drop=True)
         )
-        sales_trend = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in sales_trend
-        ]
 
         return {
             "total_sales": total_sales,
@@ -64,31 +89,36 @@ class OverViewService:
             "sales_trend": sales_trend,
         }
 
-    def _get_customer_overview(self, conn):
+    def _get_customer_overview(self, customers, aggregates, leaderboards=None):
         """
-        Fetch and process customer data for the overview.
+        Process customer data for the overview. `leaderboards` (for the whole
+        history only) supplies the top customers without ranking the aggregates.
         """
-        customers = pd.read_sql("SELECT customer_id, join_date FROM customers", conn)
+        names = customers[["customer_id", "customer_name"]]
+        customers = customers[["customer_id", "join_date"]].copy()
         customers["join_date"] = pd.to_datetime(customers["join_date"])
-        customers["join_month"] = customers["join_date"].dt.to_period("M").astype(str)
+        customers["join_month"] = month_column(customers["join_date"])
 
         total_customers = len(customers)
         current_month = str(pd.Timestamp.now().to_period("M"))
         new_customers_this_month = int((customers["join_month"] == current_month).sum())
 
-        # Top 5 customers by purchase volume
-        top_customers_query = """
-            SELECT st.customer_id, c.customer_name, COUNT(*) AS purchase_count, SUM(st.sale_amount) AS total_spent
-            FROM sales_transactions st
-            JOIN customers c ON st.customer_id = c.customer_id
-            GROUP BY st.customer_id, c.customer_name
-            ORDER BY total_spent DESC
-            LIMIT 5
-        """
-        top_customers = pd.read_sql(top_customers_query, conn).to_dict(orient="records")
-        top_customers = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in top_customers
+        # Top customers by spend: over the whole history they are kept ranked at ingest
+        if leaderboards is not None:
+            ranked = leaderboards.top("customers").rename(
+                columns={"entity_id": "customer_id", "count": "purchase_count", "score": "total_spent"}
+            )
+        else:
+            ranked = aggregates["customers"][["total_purchases", "total_spent"]].reset_index()
+            # Only listed customers are ranked, so unnamed ids take no places
+            ranked = (
+                ranked[ranked["customer_id"].isin(names["customer_id"])]
+                .rename(columns={"total_purchases": "purchase_count"})
+                .sort_values(["total_spent", "customer_id"], ascending=[False, True])
+                .head(config.LEADERBOARD_SIZE)
+            )
+        top_customers = ranked.merge(names, on="customer_id").reset_index(drop=True)[
+            ["customer_id", "customer_name", "purchase_count", "total_spent"]
         ]
 
         return {
@@ -97,43 +127,53 @@ class OverViewService:
             "top_customers": top_customers,
         }
 
-    def _get_product_overview(self, conn):
+    def _get_product_overview(self, conn, aggregates, products, date_range=ALL_TIME, leaderboards=None):
         """
-        Fetch and process product data for the overview.
+        Fetch and process product data for the overview. With `leaderboards`
+        (whole history only) the best-selling and most problematic products
+        are read from them instead of grouping the sales and tickets.
         """
-        products = pd.read_sql("SELECT * FROM products", conn)
         total_products = int(len(products))
         avg_product_price = float(products["sales_price"].mean()) if total_products else 0.0
 
-        # Best-selling product
-        top_products_query = """
-            SELECT p.product_id, p.product_name, COUNT(*) AS sales_count, SUM(st.sale_amount) AS revenue
-            FROM sales_transactions st
-            JOIN products p ON st.product_id = p.product_id
-            GROUP BY p.product_id, p.product_name
-            ORDER BY revenue DESC
-            LIMIT 1
-        """
-        best_selling_product = pd.read_sql(top_products_query, conn).to_dict(orient="records")
-        best_selling_product = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in best_selling_product
-        ]
-
-        # Most problematic product
-        most_issues_query = """
-            SELECT p.product_id, p.product_name, COUNT(*) AS issue_count
-            FROM support_tickets st
-            JOIN products p ON st.product_id = p.product_id
-            GROUP BY p.product_id, p.product_name
-            ORDER BY issue_count DESC
-            LIMIT 1
-        """
-        most_problematic_product = pd.read_sql(most_issues_query, conn).to_dict(orient="records")
-        most_problematic_product = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in most_problematic_product
-        ]
+        names = products[["product_id", "product_name"]]
+        if leaderboards is not None:
+            best_selling_product = (
+                leaderboards.top("products", 1)
+                .rename(columns={"entity_id": "product_id", "count": "sales_count", "score": "revenue"})
+                .merge(names, on="product_id")
+            )[["product_id", "product_name", "sales_count", "revenue"]]
+            most_problematic_product = (
+                leaderboards.top("product_issues", 1)
+                .rename(columns={"entity_id": "product_id", "count": "issue_count"})
+                .merge(names, on="product_id")
+            )[["product_id", "product_name", "issue_count"]]
+        else:
+            # Best-selling product
+            best_selling_product = (
+                aggregates["product_months"]
+                .groupby("product_id")[["sales_count", "sale_amount"]]
+                .sum()
+                .reset_index()
+                .merge(names, on="product_id")
+                .rename(columns={"sale_amount": "revenue"})
+                .sort_values("revenue", ascending=False)
+                .head(1)
+                .reset_index(drop=True)
+            )[["product_id", "product_name", "sales_count", "revenue"]]
+
+            # Most problematic product
+            condition, params = date_range.condition("st.creation_date")
+            most_issues_query = f"""
+                SELECT p.product_id, p.product_name, COUNT(*) AS issue_count
+                FROM support_tickets st
+                JOIN products p ON st.product_id = p.product_id
+                WHERE {condition}
+                GROUP BY p.product_id, p.product_name
+                ORDER BY issue_count DESC
+                LIMIT 1
+            """
+            most_problematic_product = pd.read_sql(most_issues_query, conn, params=params)
 
         return {
             "total_products": total_products,
@@ -142,39 +182,67 @@ class OverViewService:
             "most_problematic_product": most_problematic_product,
         }
 
-    def _get_support_overview(self, conn):
+    def _get_support_overview(self, tickets):
         """
-        Fetch and process support ticket data for the overview.
+        Process the support tickets of the range for the overview.
         """
-        support = pd.read_sql("SELECT sentiment_score, status, creation_date FROM support_tickets", conn)
+        support = tickets[["sentiment_score", "status", "creation_date"]].copy()
         total_tickets = int(len(support))
         avg_sentiment = float(support["sentiment_score"].mean()) if total_tickets else None
 
         # Support ticket status breakdown
         support_status_counts = support["status"].value_counts().reset_index()
         support_status_counts.columns = ["status", "count"]
-        support_status_breakdown = support_status_counts.to_dict(orient="records")
-        support_status_breakdown = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in support_status_breakdown
-        ]
+        support_status_breakdown = support_status_counts
 
         # Sentiment trend over last 6 months
         support["creation_date"] = pd.to_datetime(support["creation_date"])
-        support["month"] = support["creation_date"].dt.to_period("M").astype(str)
+        support["month"] = month_column(support["creation_date"])
         sentiment_trend = (
-            support.groupby("month")["sentiment_score"]
+            support.groupby("month", observed=True)["sentiment_score"]
             .mean()
             .reset_index()
             .rename(columns={"month": "date", "sentiment_score": "score"})
             .sort_values("date")
             .tail(6)
-            .to_dict(orient="records")
+            .reset_index(drop=True)
+        )
+
+        return {
+            "total_tickets": total_tickets,
+            "avg_sentiment": round(avg_sentiment, 2) if avg_sentiment is not None else None,
+            "support_status_breakdown": support_status_breakdown,
+            "sentiment_trend": sentiment_trend,
+        }
+
+    def _get_support_overview_approx(self, conn, store, date_range=ALL_TIME):
+        """
+        Support overview from the per-day sentiment sums instead of a ticket scan.
+        """
+        monthly = store.monthly_sentiment(date_range)
+        total_tickets = int(monthly["tickets"].sum())
+        scored = int(monthly["scored"].sum())
+        avg_sentiment = float(monthly["sentiment_sum"].sum() / scored) if scored else None
+
+        condition, params = date_range.condition("creation_date")
+        support_status_breakdown = pd.read_sql(
+            f"""
+            SELECT status, COUNT(*) AS count FROM support_tickets
+            WHERE {condition}
+            GROUP BY status
+            ORDER BY count DESC
+            """,
+            conn,
+            params=params,
+        )
+
+        sentiment_trend = (
+            monthly[monthly["scored"] > 0]
+            .assign(score=lambda m: m["sentiment_sum"] / m["scored"])
+            .rename(columns={"month": "date"})[["date", "score"]]
+            .tail(6)
+            .reset_index(drop=True)
         )
-        sentiment_trend = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in sentiment_trend
-        ]
 
         return {
             "total_tickets": total_tickets,
@@ -0,0 +1,158 @@
+from config import config
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+# Once over PAYLOAD_CACHE_MB, least recently used entries are evicted down to this share of it
+EVICT_TO = 0.75
+
+_DIRECTORY = re.compile(r"v(\d+)(?:-([0-9a-f]+))?$")
+
+
+def payload_cache_dir(db_path=None):
+    """
+    Directory the cached responses of a database are kept in.
+    """
+    return config.PAYLOAD_CACHE_DIR or f"{db_path or config.DB_PATH}.cache"
+
+
+def code_fingerprint():
+    """
+    Short hash of the config and the backend's Python sources: responses
+    cached by other code or settings are not served after a deploy.
+    """
+    digest = hashlib.sha256(config.model_dump_json().encode())
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for directory, subdirectories, files in os.walk(backend):
+        subdirectories[:] = sorted(d for d in subdirectories if d not in ("__pycache__", "benchmarks", "tests"))
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, backend).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class PayloadCache:
+    """
+    Computed response bodies on disk, one directory per data version and
+    code_fingerprint(). The files outlive the process, so a restarted server
+    answers repeated requests without recomputing them, and all workers
+    share one cache. Directories of older data versions or other code are
+    removed when a new one is first written to. The current directory is
+    kept under PAYLOAD_CACHE_MB by evicting the least recently used files
+    (reads refresh their modification time).
+    """
+
+    def __init__(self, root=None, fingerprint=None):
+        self._root = root
+        self._fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._bytes = {}  # directory -> estimated size of its files
+
+    @property
+    def root(self):
+        return self._root or payload_cache_dir()
+
+    def get(self, version, key):
+        """
+        The body cached for `key` at this data version, or None.
+        """
+        path = self._path(version, key)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return body
+
+    def put(self, version, key, body):
+        """
+        Store a body; the file is written aside and renamed into place.
+        """
+        directory = self._directory(version)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            self._prune(version)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp, self._path(version, key))
+        with self._lock:
+            if directory not in self._bytes:
+                self._bytes = {directory: self._size(directory)}
+            else:
+                self._bytes[directory] += len(body)
+            if self._bytes[directory] > config.PAYLOAD_CACHE_MB * 2**20:
+                self._bytes[directory] = self._evict(directory, EVICT_TO * config.PAYLOAD_CACHE_MB * 2**20)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        with self._lock:
+            self._bytes = {}
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = code_fingerprint()
+        return self._fingerprint
+
+    def _directory(self, version):
+        return os.path.join(self.root, f"v{version}-{self.fingerprint}")
+
+    def _path(self, version, key):
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self._directory(version), name)
+
+    def _prune(self, version):
+        """
+        Remove the directories of older data versions and of other code at this one.
+        """
+        for entry in os.listdir(self.root):
+            match = _DIRECTORY.match(entry)
+            if match and (int(match[1]) < version or (int(match[1]) == version and match[2] != self.fingerprint)):
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+    def _entries(self, directory):
+        """
+        (modification time, size, path) of the cached files in a directory.
+        Files written aside (".*.tmp") are not entries yet.
+        """
+        entries = []
+        for entry in os.scandir(directory):
+            if not entry.name.startswith("."):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _size(self, directory):
+        return sum(size for _, size, _ in self._entries(directory))
+
+    def _evict(self, directory, target):
+        """
+        Remove the least recently used files until the directory holds at
+        most `target` bytes; returns its new size. Other workers write to
+        the same directory, so the size is recounted rather than trusted.
+        """
+        entries = sorted(self._entries(directory))
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        return size
+
+
+payload_cache = PayloadCache()
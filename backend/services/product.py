@@ -1,7 +1,26 @@
 from config import config
-import sqlite3
 import pandas as pd
 import numpy as np
+from db import connect
+from deadline import check_deadline
+from .utils import read_sql_in
+from .serialization import to_python, to_records
+from .charts import period_labels, downsample
+from .daterange import ALL_TIME
+from .loader import compact, read_frame, month_column
+from .profile_cache import product_profiles
+from .leaderboards import Leaderboards
+
+# Charts and lists of a product profile, filled per product by the batch path
+PROFILE_LISTS = [
+    "sales_over_time",
+    "sentiment_over_time",
+    "support_status_breakdown",
+    "top_customers",
+    "frequently_bought_together",
+    "suppliers",
+]
+
 
 class ProductService:
     def __init__(self):
@@ -12,7 +31,7 @@ class ProductService:
         Fetch a list of products from the database.
         Optionally filter by a search term matching product_name or category.
         """
-        conn = sqlite3.connect(config.DB_PATH)
+        conn = connect()
         query = """
         SELECT * FROM products
         WHERE (product_name LIKE ? OR category LIKE ?)
@@ -23,33 +42,216 @@ class ProductService:
         conn.close()
         return df.to_dict(orient="records")
 
-    def get_product_profile(self, product_id: str):
+    def get_product_profile(self, product_id: str, granularity="month", max_points=None, date_range=ALL_TIME):
         """
         Fetch detailed profile information for a specific product.
         Includes product details, sales summary, support summary, charts, and related data.
+        Time series are bucketed by `granularity` (day/week/month/quarter) and
+        downsampled to at most `max_points` points. A DateRange restricts the
+        transactions and tickets considered.
+        """
+        return to_python(self.get_product_profile_frames(product_id, granularity, max_points, date_range))
+
+    def get_product_profile_frames(self, product_id: str, granularity="month", max_points=None, date_range=ALL_TIME):
+        """
+        Same as get_product_profile, but chart and list fields are left as
+        DataFrames so they can be serialized to JSON or to a columnar format.
+        Profiles are served from the profile cache when it has them.
         """
-        with sqlite3.connect(config.DB_PATH) as conn:
+        if not config.PROFILE_CACHE_SIZE:
+            return self._compute_profile_frames(product_id, granularity, max_points, date_range)
+
+        key = (str(product_id), granularity, max_points, date_range.key())
+        conn = connect()
+        try:
+            version, profile = product_profiles.get(conn, key)
+        finally:
+            conn.close()
+        if profile is None:
+            profile = self._compute_profile_frames(product_id, granularity, max_points, date_range)
+            if "error" not in profile:
+                product_profiles.put(version, product_id, key, profile)
+        return profile
+
+    def _compute_profile_frames(self, product_id, granularity, max_points, date_range):
+        with connect() as conn:
             product_info = self._fetch_product_details(conn, product_id)
             if not product_info:
                 return {"error": "Product not found"}
 
-            sales_summary, sales_over_time = self._fetch_sales_data(conn, product_id)
-            top_customers = self._fetch_top_customers(conn, product_id)
-            support_summary, sentiment_over_time, support_status_breakdown = self._fetch_support_data(conn, product_id)
-            frequently_bought_together = self.get_frequently_bought_together(product_id)
-
-            return {
-                "product": product_info,
-                "sales_summary": sales_summary,
-                "support_summary": support_summary,
-                "charts": {
-                    "sales_over_time": sales_over_time,
-                    "sentiment_over_time": sentiment_over_time,
-                    "support_status_breakdown": support_status_breakdown,
+            sales_summary, sales_over_time = self._fetch_sales_data(
+                conn, product_id, granularity, max_points, date_range
+            )
+            check_deadline()
+            top_customers = self._fetch_top_customers(conn, product_id, date_range)
+            support_summary, sentiment_over_time, support_status_breakdown = self._fetch_support_data(
+                conn, product_id, granularity, max_points, date_range
+            )
+            check_deadline()
+            frequently_bought_together = self._frequently_bought_together(product_id, date_range=date_range)
+            suppliers = pd.read_sql(
+                "SELECT * FROM supplier_metrics WHERE product_id = ?", conn, params=[product_id]
+            )
+
+            return self._profile(
+                product_info,
+                sales_summary,
+                support_summary,
+                sales_over_time=sales_over_time,
+                sentiment_over_time=sentiment_over_time,
+                support_status_breakdown=support_status_breakdown,
+                top_customers=top_customers,
+                frequently_bought_together=frequently_bought_together,
+                suppliers=suppliers,
+            )
+
+    def get_product_profiles(self, product_ids, top_n=5, date_range=ALL_TIME):
+        """
+        Fetch profiles for many products in one pass.
+        Rows for all requested products are read with one query per table, summaries
+        and charts are computed with grouped aggregations, and profiles are yielded
+        one at a time in the requested order.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        sales_condition, sales_params = date_range.condition("transaction_date")
+        support_condition, support_params = date_range.condition("creation_date")
+        top_customers_condition, _ = date_range.condition("st.transaction_date")
+        conn = connect()
+        try:
+            products = read_sql_in(conn, "SELECT * FROM products WHERE product_id IN ({ids})", product_ids)
+            sales = compact(read_sql_in(
+                conn,
+                f"""
+                SELECT product_id, sale_amount, transaction_date, customer_id
+                FROM sales_transactions
+                WHERE product_id IN ({{ids}}) AND {sales_condition}
+                """,
+                product_ids,
+                sales_params,
+            ))
+            support = compact(read_sql_in(
+                conn,
+                f"""
+                SELECT product_id, sentiment_score, status, creation_date
+                FROM support_tickets
+                WHERE product_id IN ({{ids}}) AND {support_condition}
+                """,
+                product_ids,
+                support_params,
+            ))
+            top_customers = read_sql_in(
+                conn,
+                f"""
+                SELECT st.product_id, st.customer_id, c.customer_name, COUNT(*) AS purchase_count
+                FROM sales_transactions st
+                JOIN customers c ON st.customer_id = c.customer_id
+                WHERE st.product_id IN ({{ids}}) AND {top_customers_condition}
+                GROUP BY st.product_id, st.customer_id, c.customer_name
+                HAVING COUNT(*) > 1
+                """,
+                product_ids,
+                sales_params,
+            )
+            frequently_bought_together = self._get_frequently_bought_together_grouped(
+                conn, sales, top_n, date_range
+            )
+            suppliers = read_sql_in(conn, "SELECT * FROM supplier_metrics WHERE product_id IN ({ids})", product_ids)
+        finally:
+            conn.close()
+
+        sales["transaction_date"] = pd.to_datetime(sales["transaction_date"], errors="coerce")
+        sales["month"] = month_column(sales["transaction_date"])
+        support["creation_date"] = pd.to_datetime(support["creation_date"], errors="coerce")
+        support["month"] = month_column(support["creation_date"])
+
+        # Grouped summaries
+        sales_stats = sales.groupby("product_id")["sale_amount"].agg(["size", "sum", "mean"])
+        support_stats = support.groupby("product_id")["sentiment_score"].agg(["size", "mean"])
+        support_stats["open_issues"] = (support["status"].str.lower() == "open").groupby(support["product_id"]).sum()
+
+        # Grouped chart and list series
+        series = {
+            "sales_over_time": (
+                sales.groupby(["product_id", "month"], observed=True)["sale_amount"]
+                .sum()
+                .reset_index()
+                .rename(columns={"month": "date", "sale_amount": "amount"})
+            ),
+            "sentiment_over_time": (
+                support.groupby(["product_id", "month"], observed=True)["sentiment_score"]
+                .mean()
+                .reset_index()
+                .rename(columns={"month": "date", "sentiment_score": "score"})
+            ),
+            "support_status_breakdown": (
+                support.groupby(["product_id", "status"], observed=True)
+                .size()
+                .reset_index(name="count")
+                .sort_values(["product_id", "count", "status"], ascending=[True, False, True], kind="stable")
+            ),
+            "top_customers": (
+                top_customers.sort_values(
+                    ["product_id", "purchase_count", "customer_id"], ascending=[True, False, True], kind="stable"
+                )
+                .groupby("product_id")
+                .head(config.LEADERBOARD_SIZE)
+            ),
+            "frequently_bought_together": frequently_bought_together,
+        }
+        grouped = {}
+        for name, frame in series.items():
+            for product_id, group in frame.groupby("product_id"):
+                grouped.setdefault(product_id, {})[name] = to_records(
+                    group.drop(columns="product_id").rename(columns={"recommended_id": "product_id"})
+                )
+        # A product's suppliers keep their product_id column, as in the single profile
+        for product_id, group in suppliers.groupby("product_id"):
+            grouped.setdefault(product_id, {})["suppliers"] = to_records(group)
+
+        products = products.set_index("product_id", drop=False)
+        for product_id in product_ids:
+            if product_id not in products.index:
+                yield {"product_id": product_id, "error": "Product not found"}
+                continue
+
+            lists = grouped.get(product_id, {})
+            total_sales = sales_stats["size"].get(product_id, 0)
+            total_issues = support_stats["size"].get(product_id, 0)
+            avg_sentiment = support_stats["mean"].get(product_id) if total_issues else None
+
+            yield self._profile(
+                products.loc[product_id].apply(lambda x: x.item() if isinstance(x, np.generic) else x).to_dict(),
+                {
+                    "total_sales": int(total_sales),
+                    "total_revenue": round(float(sales_stats["sum"].get(product_id, 0)), 2),
+                    "avg_sale_value": round(float(sales_stats["mean"].get(product_id, 0)), 2),
                 },
-                "top_customers": top_customers,
-                "frequently_bought_together": frequently_bought_together,
-            }
+                {
+                    "total_issues": int(total_issues),
+                    "avg_sentiment": round(float(avg_sentiment), 2) if avg_sentiment is not None else None,
+                    "open_issues": int(support_stats["open_issues"].get(product_id, 0)),
+                },
+                **{name: lists.get(name, []) for name in PROFILE_LISTS},
+            )
+
+    def _profile(self, product, sales_summary, support_summary, **lists):
+        """
+        Assemble a product profile, for the single and the batch path alike.
+        `lists` holds the charts and lists named in PROFILE_LISTS.
+        """
+        return {
+            "product": product,
+            "sales_summary": sales_summary,
+            "support_summary": support_summary,
+            "charts": {
+                "sales_over_time": lists["sales_over_time"],
+                "sentiment_over_time": lists["sentiment_over_time"],
+                "support_status_breakdown": lists["support_status_breakdown"],
+            },
+            "top_customers": lists["top_customers"],
+            "frequently_bought_together": lists["frequently_bought_together"],
+            "suppliers": lists["suppliers"],
+        }
 
     def _fetch_product_details(self, conn, product_id):
         """
@@ -66,37 +268,34 @@ class ProductService:
             lambda x: x.item() if isinstance(x, np.generic) else x
         ).to_dict()
 
-    def _fetch_sales_data(self, conn, product_id):
+    def _fetch_sales_data(self, conn, product_id, granularity="month", max_points=None, date_range=ALL_TIME):
         """
         Fetch sales data for a specific product and calculate sales summary.
         """
-        sales = pd.read_sql(
-            """
+        condition, params = date_range.condition("transaction_date")
+        sales = read_frame(
+            conn,
+            f"""
             SELECT sale_amount, transaction_date, customer_id
             FROM sales_transactions
-            WHERE product_id = ?
+            WHERE product_id = ? AND {condition}
             """,
-            conn,
-            params=(product_id,),
+            params=[product_id] + params,
         )
         sales["transaction_date"] = pd.to_datetime(sales["transaction_date"], errors="coerce")
-        sales["month"] = sales["transaction_date"].dt.to_period("M").astype(str)
+        sales["month"] = period_labels(sales["transaction_date"], granularity)
 
         total_sales = len(sales)
         total_revenue = sales["sale_amount"].sum() if total_sales else 0
         avg_sale_value = sales["sale_amount"].mean() if total_sales else 0
 
         sales_over_time = (
-            sales.groupby("month")["sale_amount"]
+            sales.groupby("month", observed=True)["sale_amount"]
             .sum()
             .reset_index()
             .rename(columns={"month": "date", "sale_amount": "amount"})
-            .to_dict(orient="records")
         )
-        sales_over_time = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in sales_over_time
-        ]
+        sales_over_time = downsample(sales_over_time, "amount", max_points)
 
         return {
             "total_sales": int(total_sales),
@@ -104,69 +303,63 @@ class ProductService:
             "avg_sale_value": round(float(avg_sale_value), 2),
         }, sales_over_time
 
-    def _fetch_top_customers(self, conn, product_id):
+    def _fetch_top_customers(self, conn, product_id, date_range=ALL_TIME):
         """
         Fetch the top customers for a specific product based on purchase count.
         """
-        top_customers_query = """
+        if not date_range:
+            # Over the whole history the purchase counts are kept ranked per product
+            return Leaderboards(conn).top_buyers(product_id)
+        condition, params = date_range.condition("st.transaction_date")
+        top_customers_query = f"""
         SELECT st.customer_id, c.customer_name, COUNT(*) AS purchase_count
         FROM sales_transactions st
         JOIN customers c ON st.customer_id = c.customer_id
-        WHERE st.product_id = ?
+        WHERE st.product_id = ? AND {condition}
         GROUP BY st.customer_id, c.customer_name
         HAVING COUNT(*) > 1
-        ORDER BY purchase_count DESC
-        LIMIT 5
+        ORDER BY purchase_count DESC, st.customer_id
+        LIMIT ?
         """
-        top_customers = pd.read_sql(top_customers_query, conn, params=(product_id,))
-        return [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in top_customers.to_dict(orient="records")
-        ]
+        return pd.read_sql(top_customers_query, conn, params=[product_id] + params + [config.LEADERBOARD_SIZE])
 
-    def _fetch_support_data(self, conn, product_id):
+    def _fetch_support_data(self, conn, product_id, granularity="month", max_points=None, date_range=ALL_TIME):
         """
         Fetch support ticket data for a specific product and calculate support summary.
         """
-        support = pd.read_sql(
-            """
+        condition, params = date_range.condition("creation_date")
+        support = read_frame(
+            conn,
+            f"""
             SELECT sentiment_score, status, creation_date
             FROM support_tickets
-            WHERE product_id = ?
+            WHERE product_id = ? AND {condition}
             """,
-            conn,
-            params=(product_id,),
+            params=[product_id] + params,
         )
         support["creation_date"] = pd.to_datetime(support["creation_date"], errors="coerce")
-        support["month"] = support["creation_date"].dt.to_period("M").astype(str)
+        support["month"] = period_labels(support["creation_date"], granularity)
 
         total_issues = len(support)
         avg_sentiment = support["sentiment_score"].mean() if total_issues else None
         open_issues = (support["status"].str.lower() == "open").sum()  # Fix: Ensure case-insensitive comparison
 
         sentiment_over_time = (
-            support.groupby("month")["sentiment_score"]
+            support.groupby("month", observed=True)["sentiment_score"]
             .mean()
             .reset_index()
             .rename(columns={"month": "date", "sentiment_score": "score"})
-            .to_dict(orient="records")
         )
-        sentiment_over_time = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in sentiment_over_time
-        ]
+        sentiment_over_time = downsample(sentiment_over_time, "score", max_points)
 
         support_status_breakdown = (
             support["status"]
             .value_counts()
-            .reset_index()
-            .rename(columns={"index": "status", "status": "count"})
-            .to_dict(orient="records")
+            .rename_axis("status")
+            .reset_index(name="count")
+            .sort_values(["count", "status"], ascending=[False, True], kind="stable")
+            .reset_index(drop=True)
         )
-        support_status_breakdown = [
-            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
-            for d in support_status_breakdown
-        ]
 
         return {
             "total_issues": int(total_issues),
@@ -174,70 +367,85 @@ class ProductService:
             "open_issues": int(open_issues),  # Corrected open_issues calculation
         }, sentiment_over_time, support_status_breakdown
 
-    def get_frequently_bought_together(self, product_id: str, top_n=5):
+    def get_frequently_bought_together(self, product_id: str, top_n=5, date_range=ALL_TIME):
         """
         Fetch products frequently bought together with a specific product.
         """
-        conn = sqlite3.connect(config.DB_PATH)
-
-        # Step 1: Find customers who bought this product
-        customers = pd.read_sql(
-            """
-            SELECT DISTINCT customer_id
-            FROM sales_transactions
-            WHERE product_id = ?
-            """,
-            conn,
-            params=(product_id,),
-        )
+        return to_records(self._frequently_bought_together(product_id, top_n, date_range))
 
-        if customers.empty:
+    def _frequently_bought_together(self, product_id: str, top_n=5, date_range=ALL_TIME):
+        """
+        DataFrame version of get_frequently_bought_together.
+        """
+        columns = ["product_id", "purchase_count", "product_name", "category", "sales_price"]
+        condition, params = date_range.condition("transaction_date")
+        conn = connect()
+        try:
+            buyers = pd.read_sql(
+                f"""
+                SELECT DISTINCT product_id, customer_id
+                FROM sales_transactions
+                WHERE product_id = ? AND {condition}
+                """,
+                conn,
+                params=[product_id] + params,
+            )
+            # Same ranking as the batch profiles, and the buyers' ids are read in chunks
+            recommended = self._get_frequently_bought_together_grouped(conn, buyers, top_n, date_range)
+        finally:
             conn.close()
-            return []
+        return (
+            recommended.drop(columns="product_id")
+            .rename(columns={"recommended_id": "product_id"})
+            .reset_index(drop=True)[columns]
+        )
 
-        customer_ids = customers["customer_id"].tolist()
+    def _get_frequently_bought_together_grouped(self, conn, sales, top_n=5, date_range=ALL_TIME):
+        """
+        Grouped version of get_frequently_bought_together for every product in `sales`.
+        Returns one row per (product_id, recommended_id) with the recommended product's details.
+        """
+        buyers = sales[["product_id", "customer_id"]].drop_duplicates()
+        columns = ["product_id", "recommended_id", "purchase_count", "product_name", "category", "sales_price"]
+        if buyers.empty:
+            return pd.DataFrame(columns=columns)
 
-        # Step 2: Get other products they bought
-        placeholders = ",".join("?" * len(customer_ids))
-        co_purchases = pd.read_sql(
+        # All purchases made by anyone who bought one of the requested products
+        condition, params = date_range.condition("transaction_date")
+        purchases = read_sql_in(
+            conn,
             f"""
-            SELECT product_id
+            SELECT customer_id, product_id AS recommended_id
             FROM sales_transactions
-            WHERE customer_id IN ({placeholders})
-            AND product_id != ?
+            WHERE customer_id IN ({{ids}}) AND {condition}
             """,
-            conn,
-            params=customer_ids + [product_id],
+            buyers["customer_id"].unique().tolist(),
+            params,
         )
-
+        co_purchases = buyers.merge(purchases, on="customer_id")
+        co_purchases = co_purchases[co_purchases["recommended_id"] != co_purchases["product_id"]]
         if co_purchases.empty:
-            conn.close()
-            return []
+            return pd.DataFrame(columns=columns)
 
-        # Step 3: Count and rank
         recommended = (
-            co_purchases["product_id"]
-            .value_counts()
+            co_purchases.groupby(["product_id", "recommended_id"])
+            .size()
+            .reset_index(name="purchase_count")
+            .sort_values(
+                ["product_id", "purchase_count", "recommended_id"], ascending=[True, False, True], kind="stable"
+            )
+            .groupby("product_id")
             .head(top_n)
-            .reset_index()
-            .rename(columns={"index": "product_id", "product_id": "purchase_count"})
         )
-
-        # Step 4: Get product details
-        placeholders = ",".join("?" * len(recommended["product_id"]))
-        product_details = pd.read_sql(
-            f"""
-            SELECT product_id, product_name, category, sales_price
+        product_details = read_sql_in(
+            conn,
+            """
+            SELECT product_id AS recommended_id, product_name, category, sales_price
             FROM products
-            WHERE product_id IN ({placeholders})
+            WHERE product_id IN ({ids})
             """,
-            conn,
-            params=recommended["product_id"].tolist(),
+            recommended["recommended_id"].unique().tolist(),
+        )
+        return recommended.merge(product_details, on="recommended_id").sort_values(
+            ["product_id", "purchase_count", "recommended_id"], ascending=[True, False, True], kind="stable"
         )
-
-        conn.close()
-
-        # Merge counts with product details
-        result = pd.merge(recommended, product_details, on="product_id")
-
-        return result.to_dict(orient="records")
\ No newline at end of file
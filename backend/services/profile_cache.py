@@ -0,0 +1,220 @@
+from collections import OrderedDict
+from config import config
+import sqlite3
+import sys
+import threading
+import pandas as pd
+from db import PURCHASES_TABLE, get_data_version
+from profiling import current_session
+from .utils import read_sql_in
+
+TOUCHES_TABLE = "profile_touches"
+# Data versions whose touched ids are kept; caches further behind are cleared
+KEEP_VERSIONS = 1000
+
+
+class ProfileTouches:
+    """
+    Ids of the customers and products whose profiles each data version
+    changed, written by ingest in the same transaction as the new rows.
+    Profile caches in any process read it to drop only those entries when
+    the data version moves. A full rebuild records that every profile changed.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def ensure(self):
+        """
+        Create the table if it is missing (nothing to backfill: caches that
+        predate it start from the current version).
+        """
+        self.conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {TOUCHES_TABLE} (
+                data_version INTEGER NOT NULL,
+                entity TEXT NOT NULL,
+                entity_id INTEGER NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{TOUCHES_TABLE}_version ON {TOUCHES_TABLE} (data_version)"
+        )
+
+    def rebuild(self):
+        """
+        Forget all recorded touches and record that the next version changes every profile.
+        """
+        self.ensure()
+        self.conn.execute(f"DELETE FROM {TOUCHES_TABLE}")
+        self._record("all", [0])
+        self.conn.commit()
+
+    def add_transactions(self, sales: pd.DataFrame):
+        """
+        Record the buyers and products of new sales, plus every product the
+        buyers bought before: their frequently-bought-together lists change.
+        Does not commit.
+        """
+        customer_ids = sales["customer_id"].dropna().astype(int).unique().tolist()
+        bought = read_sql_in(
+            self.conn,
+            f"SELECT DISTINCT product_id FROM {PURCHASES_TABLE} WHERE customer_id IN ({{ids}})",
+            customer_ids,
+        )
+        product_ids = set(sales["product_id"].dropna().astype(int)) | set(bought["product_id"].astype(int))
+        self._record("customer", customer_ids)
+        self._record("product", sorted(product_ids))
+
+    def add_tickets(self, tickets: pd.DataFrame):
+        """
+        Record the customers and products of new support tickets. Does not commit.
+        """
+        self._record("customer", tickets["customer_id"].dropna().astype(int).unique().tolist())
+        self._record("product", tickets["product_id"].dropna().astype(int).unique().tolist())
+
+    def since(self, version, current):
+        """
+        {entity: set of ids} touched after `version` up to `current`, or None
+        when that is unknown (versions pruned or written without touches) and
+        every profile must be treated as changed.
+        """
+        rows = self.conn.execute(
+            f"SELECT data_version, entity, entity_id FROM {TOUCHES_TABLE} WHERE data_version > ? AND data_version <= ?",
+            (version, current),
+        ).fetchall()
+        if {row[0] for row in rows} != set(range(version + 1, current + 1)):
+            return None
+        touched = {}
+        for _, entity, entity_id in rows:
+            if entity == "all":
+                return None
+            touched.setdefault(entity, set()).add(str(entity_id))
+        return touched
+
+    def _record(self, entity, ids):
+        # Written before the caller bumps the data version, so they belong to the next one
+        version = get_data_version(self.conn) + 1
+        self.conn.executemany(
+            f"INSERT INTO {TOUCHES_TABLE} (data_version, entity, entity_id) VALUES (?, ?, ?)",
+            [(version, entity, int(entity_id)) for entity_id in ids],
+        )
+        self.conn.execute(f"DELETE FROM {TOUCHES_TABLE} WHERE data_version <= ?", (version - KEEP_VERSIONS,))
+
+
+def _size(value):
+    """
+    Rough memory footprint of a cached profile in bytes.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(k) + _size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ProfileCache:
+    """
+    Process-wide LRU of computed profiles of one entity kind ("customer" or
+    "product"), bounded by entry count and by estimated memory. When the
+    data version moves, only the entries of entities that ProfileTouches
+    recorded as touched are dropped; everything else survives the ingest.
+    """
+
+    def __init__(self, entity, max_entries=None, max_bytes=None):
+        self.entity = entity
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (entity_id, value, size)
+        self._version = None
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def max_entries(self):
+        return config.PROFILE_CACHE_SIZE if self._max_entries is None else self._max_entries
+
+    @property
+    def max_bytes(self):
+        return config.PROFILE_CACHE_MB * 1024 * 1024 if self._max_bytes is None else self._max_bytes
+
+    def get(self, conn: sqlite3.Connection, key):
+        """
+        (version, cached value or None) for `key`, after catching up with the
+        data version. Pass the version on to put(). Profiled requests always miss.
+        """
+        version = get_data_version(conn)
+        with self._lock:
+            if version != self._version:
+                self._sync(conn, version)
+            if current_session() is not None:
+                # A profiled request is computed, so its profile shows the work
+                return version, None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return version, self._entries[key][1]
+            self._stats["misses"] += 1
+            return version, None
+
+    def put(self, version, entity_id, key, value):
+        """
+        Cache a value computed at `version`, unless the cache has moved on since.
+        """
+        size = _size(value)
+        with self._lock:
+            if version != self._version or size > self.max_bytes:
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (str(entity_id), value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "data_version": self._version,
+            }
+
+    def _sync(self, conn, version):
+        if self._version is not None:
+            touched = None
+            if version > self._version:
+                try:
+                    touched = ProfileTouches(conn).since(self._version, version)
+                except sqlite3.OperationalError:  # table missing
+                    touched = None
+            if touched is None:
+                self._stats["invalidations"] += len(self._entries)
+                self._clear()
+            else:
+                ids = touched.get(self.entity, set())
+                stale = [key for key, (entity_id, _, _) in self._entries.items() if entity_id in ids]
+                for key in stale:
+                    self._bytes -= self._entries.pop(key)[2]
+                self._stats["invalidations"] += len(stale)
+        self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+customer_profiles = ProfileCache("customer")
+product_profiles = ProfileCache("product")
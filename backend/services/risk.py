@@ -0,0 +1,216 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from datetime import timedelta
+from db import next_month
+from .daterange import ALL_TIME
+
+SIGNALS = ["spend_drop", "ticket_spike", "sentiment_decline", "open_backlog"]
+DEFAULT_WEIGHTS = {"spend_drop": 0.35, "ticket_spike": 0.25, "sentiment_decline": 0.25, "open_backlog": 0.15}
+
+
+class CustomerRiskScorer:
+    """
+    Scores every customer on several churn/escalation signals at once.
+
+    For a block of customers, monthly spend, ticket counts and sentiment sums
+    are laid out as customer x month matrices covering the last
+    `trailing_months + recent_months` months. Each of the recent months is
+    compared with the average of the `trailing_months` before it, using
+    strided (zero-copy) sliding windows, so there is no per-customer Python
+    loop. Customers are processed in blocks of `block_size`, which bounds
+    memory, and only the running top-n candidates are kept between blocks.
+
+    Signals, each scaled to [0, 1]:
+    - spend_drop: average fraction of the trailing spend lost in the recent months
+    - ticket_spike: largest recent monthly ticket count above its trailing mean, in trailing std units
+    - sentiment_decline: average drop of monthly sentiment below its trailing mean
+    - open_backlog: currently open tickets, saturating (3 open tickets -> 0.5)
+    """
+
+    # Scale turning raw signal values into [0, 1]
+    SPIKE_SCALE = 3.0
+    SENTIMENT_SCALE = 0.5
+    BACKLOG_HALF = 3.0
+
+    def __init__(self, conn: sqlite3.Connection, trailing_months=6, recent_months=3, block_size=50000):
+        self.conn = conn
+        self.trailing_months = trailing_months
+        self.recent_months = recent_months
+        self.block_size = block_size
+
+    def score(self, weights=None, top_n=20, date_range=ALL_TIME):
+        """
+        Return the `top_n` customers with the highest weighted risk score and
+        their individual signals, as of the last month of the date range (or
+        of the data). Sales and tickets outside the range are left out, so
+        months of the window before its start count as empty. Ties are
+        ranked by customer_id.
+        """
+        weights = self._normalize_weights(weights)
+        months = self._months(date_range)
+        if not months:
+            return pd.DataFrame(columns=["customer_id", "risk_score"] + SIGNALS)
+
+        customer_ids = pd.read_sql("SELECT customer_id FROM customers ORDER BY customer_id", self.conn)[
+            "customer_id"
+        ].to_numpy()
+        best = None
+        for start in range(0, len(customer_ids), self.block_size):
+            block = self._score_block(customer_ids[start:start + self.block_size], months, weights, date_range)
+            candidates = block if best is None else pd.concat([best, block], ignore_index=True)
+            best = self._top(candidates, top_n)
+
+        return best.sort_values(["risk_score", "customer_id"], ascending=[False, True]).reset_index(drop=True)
+
+    def _score_block(self, ids, months, weights, date_range=ALL_TIME):
+        """
+        Signals and weighted score for one block of (sorted) customer ids.
+        """
+        spend, tickets, sentiment, backlog = self._load_block(ids, months, date_range)
+        w = self.trailing_months
+
+        # windows[:, i, :] are the w months before month i + w, i.e. before each recent month
+        def trailing(matrix):
+            return sliding_window_view(matrix[:, :-1], w, axis=1)
+
+        recent = slice(w, None)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spend_avg = trailing(spend).mean(axis=2)
+            drop = np.where(spend_avg > 0, (spend_avg - spend[:, recent]) / spend_avg, 0.0)
+            spend_drop = np.clip(drop, 0, 1).mean(axis=1)
+
+            ticket_windows = trailing(tickets)
+            ticket_z = (tickets[:, recent] - ticket_windows.mean(axis=2)) / (ticket_windows.std(axis=2) + 1)
+            ticket_spike = np.clip(ticket_z.max(axis=1) / self.SPIKE_SCALE, 0, 1)
+
+            trailing_sentiment = trailing(sentiment).sum(axis=2) / ticket_windows.sum(axis=2)
+            monthly_sentiment = sentiment[:, recent] / tickets[:, recent]
+            decline = np.clip((trailing_sentiment - monthly_sentiment) / self.SENTIMENT_SCALE, 0, 1)
+            # Months without tickets (or without trailing tickets) carry no sentiment signal
+            decline = np.where(np.isnan(decline), 0.0, decline)
+            sentiment_decline = decline.mean(axis=1)
+
+        open_backlog = backlog / (backlog + self.BACKLOG_HALF)
+
+        signals = np.column_stack([spend_drop, ticket_spike, sentiment_decline, open_backlog])
+        scores = signals @ np.array([weights[name] for name in SIGNALS])
+        frame = pd.DataFrame(signals.round(4), columns=SIGNALS)
+        frame.insert(0, "risk_score", scores.round(4))
+        frame.insert(0, "customer_id", ids)
+        return frame
+
+    def _load_block(self, ids, months, date_range=ALL_TIME):
+        """
+        Customer x month matrices (spend, ticket count, sentiment sum) and the
+        open-ticket backlog vector for a block of customers.
+        """
+        lo, hi = int(ids[0]), int(ids[-1])
+        first, end = months[0] + "-01", next_month(months[-1]) + "-01"
+        # Dates are ISO strings, so the range clips the window as string bounds
+        if date_range.start:
+            first = max(first, date_range.start.isoformat())
+        if date_range.end:
+            end = min(end, (date_range.end + timedelta(days=1)).isoformat())
+        shape = (len(ids), len(months))
+        spend = np.zeros(shape)
+        tickets = np.zeros(shape)
+        sentiment = np.zeros(shape)
+
+        sales = pd.read_sql(
+            """
+            SELECT customer_id, substr(transaction_date, 1, 7) AS month, SUM(sale_amount) AS amount
+            FROM sales_transactions
+            WHERE customer_id BETWEEN ? AND ? AND transaction_date >= ? AND transaction_date < ?
+            GROUP BY customer_id, month
+            """,
+            self.conn,
+            params=[lo, hi, first, end],
+        )
+        rows, cols, known = self._positions(ids, months, sales)
+        spend[rows, cols] = sales["amount"].to_numpy()[known]
+
+        monthly_tickets = pd.read_sql(
+            """
+            SELECT customer_id, substr(creation_date, 1, 7) AS month,
+                   COUNT(*) AS ticket_count, SUM(COALESCE(sentiment_score, 0.5)) AS sentiment
+            FROM support_tickets
+            WHERE customer_id BETWEEN ? AND ? AND creation_date >= ? AND creation_date < ?
+            GROUP BY customer_id, month
+            """,
+            self.conn,
+            params=[lo, hi, first, end],
+        )
+        rows, cols, known = self._positions(ids, months, monthly_tickets)
+        tickets[rows, cols] = monthly_tickets["ticket_count"].to_numpy()[known]
+        sentiment[rows, cols] = monthly_tickets["sentiment"].to_numpy()[known]
+
+        open_tickets = pd.read_sql(
+            """
+            SELECT customer_id, COUNT(*) AS open_count
+            FROM support_tickets
+            WHERE customer_id BETWEEN ? AND ? AND creation_date >= ? AND creation_date < ?
+                  AND lower(trim(status)) = 'open'
+            GROUP BY customer_id
+            """,
+            self.conn,
+            params=[lo, hi, date_range.start.isoformat() if date_range.start else "", end],
+        )
+        backlog = np.zeros(len(ids))
+        rows, _, known = self._positions(ids, None, open_tickets)
+        backlog[rows] = open_tickets["open_count"].to_numpy()[known]
+        return spend, tickets, sentiment, backlog
+
+    def _positions(self, ids, months, df):
+        """
+        Matrix row and month column of each (customer_id, month) row of `df`,
+        plus the mask of rows whose customer is in `ids` (the others are dropped).
+        """
+        customer_ids = df["customer_id"].to_numpy()
+        rows = np.minimum(np.searchsorted(ids, customer_ids), len(ids) - 1)
+        known = ids[rows] == customer_ids
+        cols = np.searchsorted(np.array(months), df["month"].to_numpy()) if months else None
+        return rows[known], (cols[known] if months else None), known
+
+    def _months(self, date_range):
+        """
+        The trailing + recent months ending at the reference month, as "YYYY-MM".
+        """
+        if date_range.end:
+            last = date_range.end.strftime("%Y-%m")
+        else:
+            (last,) = self.conn.execute(
+                """
+                SELECT MAX(month) FROM (
+                    SELECT substr(MAX(transaction_date), 1, 7) AS month FROM sales_transactions
+                    UNION ALL
+                    SELECT substr(MAX(creation_date), 1, 7) FROM support_tickets
+                )
+                """
+            ).fetchone()
+            if last is None:
+                return []
+        periods = pd.period_range(end=last, periods=self.trailing_months + self.recent_months, freq="M")
+        return [str(p) for p in periods]
+
+    def _normalize_weights(self, weights):
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        unknown = set(weights) - set(SIGNALS)
+        if unknown:
+            raise ValueError(f"Unknown risk signals: {sorted(unknown)}")
+        if any(value < 0 for value in weights.values()):
+            raise ValueError("Risk weights must not be negative")
+        total = sum(weights.values())
+        if total == 0:
+            raise ValueError("At least one risk weight must be positive")
+        return {name: value / total for name, value in weights.items()}
+
+    def _top(self, frame, top_n):
+        """
+        The `top_n` rows by risk score, ties broken by customer_id, so the
+        result does not depend on the block size.
+        """
+        order = np.lexsort((frame["customer_id"].to_numpy(), -frame["risk_score"].to_numpy()))
+        return frame.iloc[order[:top_n]]
+
@@ -0,0 +1,102 @@
+import io
+import pandas as pd
+import numpy as np
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+def to_records(df):
+    """
+    Convert a DataFrame to a list of dicts with native Python scalars.
+    """
+    return [
+        {k: (v.item() if isinstance(v, np.generic) else v) for k, v in d.items()}
+        for d in df.to_dict(orient="records")
+    ]
+
+
+def to_columns(df):
+    """
+    Convert a DataFrame to a dict of column lists with native Python scalars,
+    e.g. {"date": [...], "amount": [...]}.
+    """
+    return {column: df[column].tolist() for column in df.columns}
+
+
+def to_python(payload, layout="records"):
+    """
+    Convert a service payload whose tabular fields are DataFrames into a
+    JSON-ready structure. DataFrames become lists of records, or dicts of
+    column lists with layout="columnar".
+    """
+    if isinstance(payload, pd.DataFrame):
+        return to_columns(payload) if layout == "columnar" else to_records(payload)
+    if isinstance(payload, dict):
+        return {k: to_python(v, layout) for k, v in payload.items()}
+    if isinstance(payload, list):
+        return [to_python(v, layout) for v in payload]
+    return payload
+
+
+def find_tables(payload, prefix=""):
+    """
+    Collect the DataFrames of a payload keyed by their dotted path,
+    e.g. "sales_overview.sales_trend" or "charts.sales_over_time".
+    """
+    tables = {}
+    if isinstance(payload, pd.DataFrame):
+        tables[prefix] = payload
+    elif isinstance(payload, dict):
+        for k, v in payload.items():
+            tables.update(find_tables(v, f"{prefix}.{k}" if prefix else k))
+    return tables
+
+
+def select_table(tables, name=None):
+    """
+    Pick one table from find_tables() by full dotted path or by its last
+    segment when that is unambiguous. With no name, the payload must contain
+    exactly one table. Raises KeyError listing the available names otherwise.
+    """
+    if name is None and len(tables) == 1:
+        return next(iter(tables.values()))
+    if name in tables:
+        return tables[name]
+    matches = [path for path in tables if path.rsplit(".", 1)[-1] == name]
+    if len(matches) == 1:
+        return tables[matches[0]]
+    raise KeyError(sorted(tables))
+
+
+def to_arrow_table(df):
+    """
+    Build an Arrow table straight from a DataFrame's columns.
+    """
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def to_arrow_ipc(df):
+    """
+    Serialize a DataFrame as an Arrow IPC stream of record batches.
+    """
+    import pyarrow as pa
+
+    table = to_arrow_table(df)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def to_parquet(df):
+    """
+    Serialize a DataFrame as a Parquet file.
+    """
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    pq.write_table(to_arrow_table(df), sink)
+    return sink.getvalue()
@@ -0,0 +1,63 @@
+from functools import cached_property
+import pandas as pd
+from db import connect
+from .daterange import ALL_TIME
+from .aggregates import SalesAggregator
+from .loader import read_frame
+from .snapshot import snapshots
+
+
+class SharedData:
+    """
+    The inputs several analytics sections are built from, for one request
+    and DateRange: each is read or aggregated on first use and then shared,
+    over a single connection. Sections computed from the same SharedData
+    scan sales and tickets once between them.
+    """
+
+    def __init__(self, date_range=ALL_TIME):
+        self.date_range = date_range
+        self.conn = connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    @cached_property
+    def aggregates(self):
+        """
+        SalesAggregator.aggregate() over the range.
+        """
+        return SalesAggregator().aggregate(self.date_range)
+
+    @cached_property
+    def products(self):
+        """
+        The products table, from the shared snapshot when a current one is published.
+        """
+        snapshot = snapshots.current()
+        return snapshot.products() if snapshot is not None else pd.read_sql("SELECT * FROM products", self.conn)
+
+    @cached_property
+    def customers(self):
+        """
+        customer_id, customer_name and join_date of every customer.
+        """
+        return pd.read_sql("SELECT customer_id, customer_name, join_date FROM customers", self.conn)
+
+    @cached_property
+    def tickets(self):
+        """
+        customer_id, sentiment_score, status and creation_date of the tickets in the range.
+        """
+        condition, params = self.date_range.condition("creation_date")
+        return read_frame(
+            self.conn,
+            f"SELECT customer_id, sentiment_score, status, creation_date FROM support_tickets WHERE {condition}",
+            params=params,
+        )
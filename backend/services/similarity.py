@@ -0,0 +1,141 @@
+from collections import OrderedDict
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from db import PURCHASES_TABLE, get_data_version
+
+# Neighbours whose purchases are blended into product recommendations
+RECOMMENDATION_NEIGHBOURS = 20
+# Per-entity results kept per data version
+RESULT_CACHE_SIZE = 4096
+
+
+class PurchaseMatrix:
+    """
+    Sparse customer x product matrix of purchase counts, with the row
+    normalizations needed for cosine and Jaccard similarity precomputed.
+    Similarities for one customer are a sparse matrix-vector product over
+    all customers; the top k are picked with argpartition.
+    """
+
+    def __init__(self, purchases: pd.DataFrame):
+        self.customer_ids = np.sort(purchases["customer_id"].unique())
+        self.product_ids = np.sort(purchases["product_id"].unique())
+        rows = np.searchsorted(self.customer_ids, purchases["customer_id"].to_numpy())
+        cols = np.searchsorted(self.product_ids, purchases["product_id"].to_numpy())
+        shape = (len(self.customer_ids), len(self.product_ids))
+
+        self.counts = sparse.csr_matrix(
+            (purchases["purchase_count"].to_numpy(dtype=np.float32), (rows, cols)), shape=shape
+        )
+        self.binary = self.counts.copy()
+        self.binary.data[:] = 1.0
+        self.products_bought = np.asarray(self.binary.sum(axis=1)).ravel()
+
+        norms = np.sqrt(np.asarray(self.counts.multiply(self.counts).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.normalized = sparse.csr_matrix(sparse.diags(1.0 / norms) @ self.counts)
+
+    def row(self, customer_id):
+        """
+        Matrix row of a customer, or None if they never bought anything.
+        """
+        i = np.searchsorted(self.customer_ids, customer_id)
+        if i < len(self.customer_ids) and self.customer_ids[i] == customer_id:
+            return int(i)
+        return None
+
+    def similarities(self, i, metric="cosine"):
+        """
+        Similarity of customer row `i` with every customer.
+        """
+        if metric == "jaccard":
+            shared = np.asarray((self.binary @ self.binary[i].T).todense()).ravel()
+            union = self.products_bought + self.products_bought[i] - shared
+            return np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        return np.asarray((self.normalized @ self.normalized[i].T).todense()).ravel()
+
+    def similar_customers(self, i, k=10, metric="cosine"):
+        """
+        (customer_ids, scores) of the k customers most similar to row `i`, best first.
+        """
+        scores = self.similarities(i, metric)
+        scores[i] = -np.inf  # never recommend the customer to themselves
+        top = _top_k(scores, k)
+        top = top[np.isfinite(scores[top]) & (scores[top] > 0)]
+        return self.customer_ids[top], scores[top]
+
+    def recommend_products(self, i, k=5, neighbours=RECOMMENDATION_NEIGHBOURS):
+        """
+        (product_ids, scores) of up to k products row `i` has not bought yet,
+        scored by the similarity-weighted purchases of their nearest neighbours.
+        """
+        scores = self.similarities(i)
+        scores[i] = 0.0
+        nearest = _top_k(scores, neighbours)
+        weights = sparse.csr_matrix(
+            (scores[nearest], (np.zeros(len(nearest), dtype=int), nearest)), shape=(1, len(self.customer_ids))
+        )
+        product_scores = np.asarray((weights @ self.normalized).todense()).ravel()
+        product_scores[self.binary[i].indices] = 0.0  # already bought
+        top = _top_k(product_scores, k)
+        top = top[product_scores[top] > 0]
+        return self.product_ids[top], product_scores[top]
+
+
+def _top_k(scores, k):
+    """
+    Indices of the k largest scores, sorted descending.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class SimilarityIndex:
+    """
+    Process-wide PurchaseMatrix and per-entity result cache, both tied to the
+    data version so they are rebuilt after an ingest.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._matrix = None
+        self._results = OrderedDict()
+
+    def matrix(self, conn: sqlite3.Connection) -> PurchaseMatrix:
+        version = get_data_version(conn)
+        with self._lock:
+            if self._matrix is None or version != self._version:
+                purchases = pd.read_sql(
+                    f"SELECT customer_id, product_id, purchase_count FROM {PURCHASES_TABLE}", conn
+                )
+                self._matrix = PurchaseMatrix(purchases)
+                self._matrix.version = version
+                self._version = version
+                self._results.clear()
+            return self._matrix
+
+    def cached(self, key, compute):
+        """
+        Return the cached result for `key` or compute it. Keys include the
+        data version of the matrix they were computed from.
+        """
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return result
+
+
+similarity_index = SimilarityIndex()
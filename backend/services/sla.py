@@ -0,0 +1,215 @@
+from config import config
+from datetime import date
+import sqlite3
+import numpy as np
+import pandas as pd
+from db import connect
+from .serialization import to_python
+
+# Breakdowns the histograms are kept for; "all" has the single key "all"
+DIMENSIONS = {"all": None, "product": "product_id", "customer": "customer_id", "issue_type": "issue_type"}
+# Resolution times are bucketed per day; anything slower lands in the last bucket
+MAX_RESOLUTION_DAYS = 365
+PERCENTILES = {"p50_days": 0.5, "p90_days": 0.9, "p95_days": 0.95}
+# Backlog age buckets: (label, lower bound in days, upper bound in days)
+BACKLOG_AGE_BUCKETS = [("0-7", 0, 7), ("8-30", 8, 30), ("31-90", 31, 90), ("90+", 91, None)]
+
+SCHEMA = [
+    # Resolved tickets per whole day of resolution time
+    """CREATE TABLE IF NOT EXISTS sla_resolution_histogram (
+           dimension TEXT NOT NULL,
+           key TEXT NOT NULL,
+           days INTEGER NOT NULL,
+           tickets INTEGER NOT NULL,
+           PRIMARY KEY (dimension, key, days)
+       )""",
+    # Unresolved tickets per creation day, aged against the request date
+    """CREATE TABLE IF NOT EXISTS sla_open_tickets (
+           dimension TEXT NOT NULL,
+           key TEXT NOT NULL,
+           creation_date TEXT NOT NULL,
+           tickets INTEGER NOT NULL,
+           PRIMARY KEY (dimension, key, creation_date)
+       )""",
+]
+
+
+class SlaHistograms:
+    """
+    Per-day histograms of ticket resolution times and of open-ticket creation
+    dates, for all tickets and per product, customer and issue type. They are
+    built at ingest and incremented as tickets are appended; percentiles,
+    breach rates and backlog ages are read off the histograms.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def ensure(self):
+        """
+        Build the histograms if the database was ingested before they existed.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sla_resolution_histogram'"
+        ).fetchone()
+        if not exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Recompute both histograms from support_tickets.
+        """
+        for table in ["sla_resolution_histogram", "sla_open_tickets"]:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        resolved, open_tickets = self._histograms(self._fetch_tickets())
+        resolved.to_sql("sla_resolution_histogram", self.conn, if_exists="append", index=False)
+        open_tickets.to_sql("sla_open_tickets", self.conn, if_exists="append", index=False)
+        self.conn.commit()
+
+    def add_tickets(self, tickets: pd.DataFrame):
+        """
+        Add newly appended tickets to the histograms. Does not commit.
+        """
+        resolved, open_tickets = self._histograms(tickets)
+        for table, column, frame in [
+            ("sla_resolution_histogram", "days", resolved),
+            ("sla_open_tickets", "creation_date", open_tickets),
+        ]:
+            self.conn.executemany(
+                f"""
+                INSERT INTO {table} (dimension, key, {column}, tickets) VALUES (?, ?, ?, ?)
+                ON CONFLICT (dimension, key, {column}) DO UPDATE SET tickets = tickets + excluded.tickets
+                """,
+                (
+                    (r[0], r[1], r[2].item() if isinstance(r[2], np.generic) else r[2], int(r[3]))
+                    for r in frame.itertuples(index=False)
+                ),
+            )
+
+    def metrics(self, dimension="all", key=None, as_of: date = None, sla_days=None):
+        """
+        Resolution-time percentiles, SLA breach rate and backlog-age
+        distribution for every key of a dimension (or a single key).
+        """
+        sla_days = config.SLA_DAYS if sla_days is None else sla_days
+        as_of = as_of or date.today()
+        condition, params = "dimension = ?", [dimension]
+        if key is not None:
+            condition += " AND key = ?"
+            params.append(str(key))
+
+        resolved = pd.read_sql(
+            f"SELECT key, days, tickets FROM sla_resolution_histogram WHERE {condition} ORDER BY key, days",
+            self.conn,
+            params=params,
+        ).astype({"days": "int64", "tickets": "int64"})
+        open_tickets = pd.read_sql(
+            f"SELECT key, creation_date, tickets FROM sla_open_tickets WHERE {condition}",
+            self.conn,
+            params=params,
+        ).astype({"tickets": "int64"})
+        return self._resolution_metrics(resolved, sla_days).join(
+            self._backlog_metrics(open_tickets, as_of), how="outer"
+        ).pipe(self._finalize, dimension)
+
+    def _resolution_metrics(self, resolved, sla_days):
+        """
+        Percentiles (nearest rank over whole days) and breach rate per key.
+        """
+        groups = resolved.groupby("key")["tickets"]
+        resolved = resolved.assign(cumulative=groups.cumsum(), total=groups.transform("sum"))
+        metrics = pd.DataFrame({"resolved_tickets": groups.sum()})
+        for name, q in PERCENTILES.items():
+            reached = resolved[resolved["cumulative"] >= q * resolved["total"]]
+            metrics[name] = reached.groupby("key")["days"].first()
+        breached = resolved[resolved["days"] > sla_days].groupby("key")["tickets"].sum()
+        metrics["breach_rate"] = (breached.reindex(metrics.index, fill_value=0) / metrics["resolved_tickets"]).round(4)
+        metrics["avg_days"] = (
+            (resolved["days"] * resolved["tickets"]).groupby(resolved["key"]).sum() / metrics["resolved_tickets"]
+        ).round(2)
+        return metrics
+
+    def _backlog_metrics(self, open_tickets, as_of):
+        """
+        Open tickets per key, bucketed by age in days at `as_of`.
+        """
+        age = (pd.Timestamp(as_of) - pd.to_datetime(open_tickets["creation_date"])).dt.days.clip(lower=0)
+        metrics = pd.DataFrame({"open_tickets": open_tickets.groupby("key")["tickets"].sum()})
+        for label, low, high in BACKLOG_AGE_BUCKETS:
+            in_bucket = (age >= low) & ((age <= high) if high is not None else True)
+            counts = open_tickets["tickets"].where(in_bucket, 0).groupby(open_tickets["key"]).sum()
+            metrics[f"backlog_{label}_days"] = counts
+        metrics["oldest_open_days"] = age.groupby(open_tickets["key"]).max()
+        return metrics
+
+    def _finalize(self, metrics, dimension):
+        counts = ["resolved_tickets", "open_tickets"] + [f"backlog_{label}_days" for label, _, _ in BACKLOG_AGE_BUCKETS]
+        metrics[counts] = metrics.reindex(columns=counts).fillna(0).astype(int)
+        metrics = metrics.reset_index()
+        column = DIMENSIONS[dimension]
+        if column in ("product_id", "customer_id"):
+            metrics["key"] = metrics["key"].astype(int)
+            metrics = metrics.sort_values("key")
+        # NaN (no resolved or no open tickets) is sent as null
+        metrics = metrics.astype(object).where(metrics.notna(), None)
+        return metrics.rename(columns={"key": column or "scope"}).reset_index(drop=True)
+
+    def _fetch_tickets(self):
+        return pd.read_sql(
+            "SELECT customer_id, product_id, issue_type, creation_date, resolution_date FROM support_tickets",
+            self.conn,
+        )
+
+    def _histograms(self, tickets):
+        """
+        Resolution-days and open-ticket histograms of a ticket frame, for every dimension.
+        """
+        created = pd.to_datetime(tickets["creation_date"])
+        resolved_at = pd.to_datetime(tickets["resolution_date"])
+        is_resolved = resolved_at.notna()
+        days = (resolved_at - created).dt.days.clip(lower=0, upper=MAX_RESOLUTION_DAYS)
+
+        resolved_frames, open_frames = [], []
+        for dimension, column in DIMENSIONS.items():
+            keys = pd.Series("all", index=tickets.index) if column is None else tickets[column].astype(str)
+            resolved_frames.append(
+                pd.DataFrame({"dimension": dimension, "key": keys[is_resolved], "days": days[is_resolved].astype(int)})
+                .groupby(["dimension", "key", "days"]).size().rename("tickets").reset_index()
+            )
+            open_frames.append(
+                pd.DataFrame(
+                    {
+                        "dimension": dimension,
+                        "key": keys[~is_resolved],
+                        "creation_date": tickets.loc[~is_resolved, "creation_date"].astype(str).str[:10],
+                    }
+                )
+                .groupby(["dimension", "key", "creation_date"]).size().rename("tickets").reset_index()
+            )
+        return pd.concat(resolved_frames, ignore_index=True), pd.concat(open_frames, ignore_index=True)
+
+
+class SlaService:
+    def __init__(self):
+        pass
+
+    def get_sla(self, by="all", key=None, as_of: date = None):
+        """
+        Support SLA analytics: time-to-resolution percentiles, breach rate
+        against SLA_DAYS and backlog-age distribution, overall or per
+        product, customer or issue type.
+        """
+        return to_python(self.get_sla_frames(by, key, as_of))
+
+    def get_sla_frames(self, by="all", key=None, as_of: date = None):
+        """
+        Same as get_sla, but the per-key metrics are a DataFrame.
+        """
+        conn = connect()
+        try:
+            metrics = SlaHistograms(conn).metrics(by, key, as_of)
+        finally:
+            conn.close()
+        return {"sla_days": config.SLA_DAYS, "as_of": (as_of or date.today()).isoformat(), "by": by, "metrics": metrics}
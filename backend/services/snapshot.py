@@ -0,0 +1,213 @@
+from config import config
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from db import get_data_version
+
+MANIFEST = "manifest.json"
+# Published snapshot directories kept besides the current one, for readers
+# that mapped an older snapshot just before a publish
+KEEP_VERSIONS = 2
+
+
+def snapshot_dir(db_path=None):
+    """
+    Directory the snapshots of a database are published in.
+    """
+    return config.SNAPSHOT_DIR or f"{db_path or config.DB_PATH}.snapshot"
+
+
+class Snapshot:
+    """
+    One published, read-only snapshot: every array is a memory-mapped .npy
+    file, so all processes that map it share the same physical pages.
+    """
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.version = manifest["data_version"]
+        self.arrays = {
+            name: np.load(os.path.join(path, spec["file"]), mmap_mode="r")
+            for name, spec in manifest["arrays"].items()
+        }
+
+    def aggregates(self):
+        """
+        The all-time result of SalesAggregator.aggregate().
+        """
+        a = self.arrays
+        monthly = pd.DataFrame(
+            {"count": a["monthly.count"], "amount": a["monthly.amount"]},
+            index=pd.Index(a["monthly.month"].astype(object), name="month"),
+        )
+        customers = pd.DataFrame(
+            {
+                "total_purchases": a["customers.total_purchases"],
+                "total_spent": a["customers.total_spent"],
+                "first_purchase": a["customers.first_purchase"],
+                "last_purchase": a["customers.last_purchase"],
+                "avg_order_value": a["customers.avg_order_value"],
+            },
+            index=pd.Index(a["customers.customer_id"], name="customer_id"),
+        )
+        product_months = pd.DataFrame(
+            {
+                "product_id": a["product_months.product_id"],
+                "month": a["product_months.month"].astype(object),
+                "sales_count": a["product_months.sales_count"],
+                "sale_amount": a["product_months.sale_amount"],
+            }
+        )
+        return {"monthly": monthly, "customers": customers, "product_months": product_months}
+
+    def products(self):
+        """
+        The products table.
+        """
+        columns = [name.split(".", 1)[1] for name in self.arrays if name.startswith("products.")]
+        return pd.DataFrame(
+            {
+                column: (
+                    self.arrays[f"products.{column}"].astype(object)
+                    if self.arrays[f"products.{column}"].dtype.kind == "U"
+                    else self.arrays[f"products.{column}"]
+                )
+                for column in columns
+            }
+        )
+
+
+class SnapshotStore:
+    """
+    Versioned snapshots of the hot read-only data (all-time sales aggregates
+    with the LTV inputs, and the products table) for multi-worker serving.
+    A loader process publishes a snapshot after startup and after every
+    ingest; workers map it zero-copy and only use it while its data version
+    matches the database's.
+
+    Publishing writes the arrays to a temporary directory, renames it into
+    place and then atomically replaces the manifest, so readers never see a
+    half-written snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manifest_stamp = {}
+        self._snapshots = {}
+
+    def publish(self, db_path=None):
+        """
+        Build and publish a snapshot of the database's current data version. Returns the version.
+        """
+        from .aggregates import SalesAggregator
+
+        db_path = db_path or config.DB_PATH
+        root = snapshot_dir(db_path)
+        os.makedirs(root, exist_ok=True)
+
+        conn = sqlite3.connect(db_path)
+        try:
+            version = get_data_version(conn)
+            products = pd.read_sql("SELECT * FROM products", conn)
+        finally:
+            conn.close()
+        aggregates = SalesAggregator(db_path=db_path).aggregate(use_snapshot=False)
+
+        arrays = {}
+        monthly = aggregates["monthly"]
+        arrays["monthly.month"] = monthly.index.to_numpy(dtype=str)
+        arrays["monthly.count"] = monthly["count"].to_numpy()
+        arrays["monthly.amount"] = monthly["amount"].to_numpy()
+        customers = aggregates["customers"]
+        arrays["customers.customer_id"] = customers.index.to_numpy()
+        for column in ["total_purchases", "total_spent", "first_purchase", "last_purchase", "avg_order_value"]:
+            arrays[f"customers.{column}"] = customers[column].to_numpy()
+        product_months = aggregates["product_months"]
+        for column in ["product_id", "month", "sales_count", "sale_amount"]:
+            values = product_months[column]
+            arrays[f"product_months.{column}"] = values.to_numpy(dtype=str) if values.dtype == object else values.to_numpy()
+        for column in products.columns:
+            values = products[column]
+            arrays[f"products.{column}"] = values.to_numpy(dtype=str) if values.dtype == object else values.to_numpy()
+
+        name = f"v{version}"
+        staging = os.path.join(root, f".{name}.{os.getpid()}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        manifest = {"data_version": version, "path": name, "arrays": {}}
+        for array_name, values in arrays.items():
+            file = f"{array_name}.npy"
+            np.save(os.path.join(staging, file), values, allow_pickle=False)
+            manifest["arrays"][array_name] = {"file": file, "dtype": values.dtype.str, "shape": list(values.shape)}
+
+        target = os.path.join(root, name)
+        if os.path.exists(target):
+            # Same version published again: swap the directory out first
+            shutil.rmtree(target, ignore_errors=True)
+        os.rename(staging, target)
+        if self._published_version(root) > version:
+            # A writer in another worker published a newer version meanwhile
+            return version
+        manifest_tmp = os.path.join(root, f".{MANIFEST}.{os.getpid()}.tmp")
+        with open(manifest_tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(manifest_tmp, os.path.join(root, MANIFEST))
+        self._prune(root, version)
+        return version
+
+    def current(self, db_path=None, version=None):
+        """
+        The published snapshot if it matches the database's data version
+        (read from the database unless given), else None.
+        """
+        db_path = db_path or config.DB_PATH
+        root = snapshot_dir(db_path)
+        manifest_path = os.path.join(root, MANIFEST)
+        try:
+            stat = os.stat(manifest_path)
+        except FileNotFoundError:
+            return None
+        if version is None:
+            conn = sqlite3.connect(db_path)
+            try:
+                version = get_data_version(conn)
+            finally:
+                conn.close()
+
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._manifest_stamp.get(root) != stamp:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                self._snapshots[root] = Snapshot(os.path.join(root, manifest["path"]), manifest)
+                self._manifest_stamp[root] = stamp
+            snapshot = self._snapshots[root]
+        return snapshot if snapshot.version == version else None
+
+    def enabled(self, db_path=None):
+        """
+        Whether snapshots are published for this database.
+        """
+        return os.path.exists(os.path.join(snapshot_dir(db_path), MANIFEST))
+
+    def _published_version(self, root):
+        try:
+            with open(os.path.join(root, MANIFEST)) as f:
+                return json.load(f)["data_version"]
+        except FileNotFoundError:
+            return -1
+
+    def _prune(self, root, version):
+        versions = sorted(
+            int(entry[1:]) for entry in os.listdir(root) if entry.startswith("v") and entry[1:].isdigit()
+        )
+        for old in versions:
+            if old < version and old not in versions[-KEEP_VERSIONS - 1:]:
+                shutil.rmtree(os.path.join(root, f"v{old}"), ignore_errors=True)
+
+
+snapshots = SnapshotStore()
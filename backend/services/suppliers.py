@@ -0,0 +1,224 @@
+import sqlite3
+import pandas as pd
+from db import connect
+from .serialization import to_records
+
+# Ticket types that point at the supply chain rather than the product itself
+SUPPLY_ISSUE_TYPES = ("Damaged Product", "Delivery Delay")
+# Lead time at which the lead-time component of the risk index saturates
+MAX_LEAD_TIME_DAYS = 30
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS supplier_metrics (
+           supplier_id INTEGER PRIMARY KEY,
+           supplier_name TEXT,
+           product_id INTEGER,
+           product_name TEXT,
+           category TEXT,
+           lead_time_days INTEGER,
+           reliability_score REAL,
+           sales_count INTEGER NOT NULL DEFAULT 0,
+           units_sold INTEGER NOT NULL DEFAULT 0,
+           revenue REAL NOT NULL DEFAULT 0,
+           first_sale TEXT,
+           last_sale TEXT,
+           tickets INTEGER NOT NULL DEFAULT 0,
+           supply_issues INTEGER NOT NULL DEFAULT 0,
+           units_per_month REAL,
+           revenue_per_month REAL,
+           issue_rate REAL,
+           supply_issue_rate REAL,
+           risk_index REAL,
+           revenue_at_risk REAL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_supplier_metrics_product ON supplier_metrics (product_id)",
+]
+
+# Derived columns, recomputed from the stored counters for the rows that changed.
+# risk_index = 0.4 * unreliability + 0.3 * lead time (saturating) + 0.3 * supply issue rate
+DERIVED = f"""
+    UPDATE supplier_metrics SET
+        units_per_month = ROUND(units_sold * 1.0 / {{months}}, 2),
+        revenue_per_month = ROUND(revenue / {{months}}, 2),
+        issue_rate = ROUND(CASE WHEN sales_count > 0 THEN tickets * 1.0 / sales_count END, 4),
+        supply_issue_rate = ROUND(CASE WHEN sales_count > 0 THEN supply_issues * 1.0 / sales_count END, 4),
+        risk_index = ROUND(
+            0.4 * (1 - COALESCE(reliability_score, 0))
+            + 0.3 * MIN(COALESCE(lead_time_days, {MAX_LEAD_TIME_DAYS}) * 1.0 / {MAX_LEAD_TIME_DAYS}, 1)
+            + 0.3 * MIN(CASE WHEN sales_count > 0 THEN supply_issues * 1.0 / sales_count ELSE 0 END, 1),
+            4
+        ),
+        revenue_at_risk = NULL
+    WHERE {{condition}}
+"""
+# Months between the first and last sale, inclusive
+SELLING_MONTHS = """MAX(1,
+    (CAST(strftime('%Y', last_sale) AS INTEGER) - CAST(strftime('%Y', first_sale) AS INTEGER)) * 12
+    + CAST(strftime('%m', last_sale) AS INTEGER) - CAST(strftime('%m', first_sale) AS INTEGER) + 1)"""
+
+
+class SupplierMetrics:
+    """
+    One row per supplier joining its lead time and reliability with the sales
+    velocity and support issue rates of the product it supplies, plus a
+    supplier risk index. Built in one vectorized pass at ingest and updated
+    per product as transactions and tickets are appended.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def ensure(self):
+        """
+        Build the metrics if the database was ingested before they existed.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'supplier_metrics'"
+        ).fetchone()
+        if not exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Recompute every supplier row from supplier_data, products, sales and tickets.
+        """
+        self.conn.execute("DROP TABLE IF EXISTS supplier_metrics")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+
+        suppliers = pd.read_sql("SELECT * FROM supplier_data", self.conn)
+        products = pd.read_sql("SELECT product_id, product_name, category FROM products", self.conn)
+        sales = pd.read_sql(
+            """
+            SELECT product_id, COUNT(*) AS sales_count, COALESCE(SUM(quantity), 0) AS units_sold,
+                   SUM(sale_amount) AS revenue, MIN(transaction_date) AS first_sale, MAX(transaction_date) AS last_sale
+            FROM sales_transactions
+            GROUP BY product_id
+            """,
+            self.conn,
+        )
+        tickets = pd.read_sql(
+            f"""
+            SELECT product_id, COUNT(*) AS tickets,
+                   SUM(issue_type IN ({",".join("?" * len(SUPPLY_ISSUE_TYPES))})) AS supply_issues
+            FROM support_tickets
+            GROUP BY product_id
+            """,
+            self.conn,
+            params=list(SUPPLY_ISSUE_TYPES),
+        )
+        metrics = (
+            suppliers.merge(products, on="product_id", how="left")
+            .merge(sales, on="product_id", how="left")
+            .merge(tickets, on="product_id", how="left")
+        )
+        counters = ["sales_count", "units_sold", "revenue", "tickets", "supply_issues"]
+        metrics[counters] = metrics[counters].fillna(0)
+        metrics.to_sql("supplier_metrics", self.conn, if_exists="append", index=False)
+        self._derive("1 = 1", [])
+        self.conn.commit()
+
+    def add_transactions(self, sales: pd.DataFrame):
+        """
+        Add appended sales to the counters of the suppliers of their products. Does not commit.
+        """
+        quantity = sales["quantity"] if "quantity" in sales.columns else 0
+        per_product = (
+            sales.assign(quantity=quantity)
+            .groupby("product_id")
+            .agg(
+                sales_count=("sale_amount", "size"),
+                units_sold=("quantity", "sum"),
+                revenue=("sale_amount", "sum"),
+                first_sale=("transaction_date", "min"),
+                last_sale=("transaction_date", "max"),
+            )
+        )
+        self.conn.executemany(
+            """
+            UPDATE supplier_metrics SET
+                sales_count = sales_count + ?,
+                units_sold = units_sold + ?,
+                revenue = revenue + ?,
+                first_sale = MIN(COALESCE(first_sale, ?), ?),
+                last_sale = MAX(COALESCE(last_sale, ?), ?)
+            WHERE product_id = ?
+            """,
+            (
+                (int(r.sales_count), int(r.units_sold), float(r.revenue),
+                 r.first_sale, r.first_sale, r.last_sale, r.last_sale, int(product_id))
+                for product_id, r in zip(per_product.index, per_product.itertuples())
+            ),
+        )
+        self._derive_products(per_product.index)
+
+    def add_tickets(self, tickets: pd.DataFrame):
+        """
+        Add appended tickets to the counters of the suppliers of their products. Does not commit.
+        """
+        per_product = (
+            tickets.assign(supply_issue=tickets["issue_type"].isin(SUPPLY_ISSUE_TYPES))
+            .groupby("product_id")
+            .agg(tickets=("supply_issue", "size"), supply_issues=("supply_issue", "sum"))
+        )
+        self.conn.executemany(
+            "UPDATE supplier_metrics SET tickets = tickets + ?, supply_issues = supply_issues + ? WHERE product_id = ?",
+            (
+                (int(r.tickets), int(r.supply_issues), int(product_id))
+                for product_id, r in zip(per_product.index, per_product.itertuples())
+            ),
+        )
+        self._derive_products(per_product.index)
+
+    def _derive_products(self, product_ids):
+        product_ids = [int(p) for p in product_ids]
+        for start in range(0, len(product_ids), 900):
+            chunk = product_ids[start:start + 900]
+            self._derive(f"product_id IN ({','.join('?' * len(chunk))})", chunk)
+
+    def _derive(self, condition, params):
+        self.conn.execute(DERIVED.format(months=SELLING_MONTHS, condition=condition), params)
+        self.conn.execute(
+            f"UPDATE supplier_metrics SET revenue_at_risk = ROUND(risk_index * revenue_per_month, 2) WHERE {condition}",
+            params,
+        )
+
+
+class SupplierService:
+    def __init__(self):
+        pass
+
+    def get_suppliers(self):
+        """
+        List suppliers with their product and risk metrics, riskiest first.
+        """
+        return to_records(self.get_suppliers_frame())
+
+    def get_suppliers_frame(self):
+        """
+        DataFrame version of get_suppliers.
+        """
+        conn = connect()
+        suppliers = pd.read_sql(
+            """
+            SELECT supplier_id, supplier_name, product_id, product_name, category,
+                   lead_time_days, reliability_score, units_per_month, supply_issue_rate,
+                   risk_index, revenue_at_risk
+            FROM supplier_metrics
+            ORDER BY risk_index DESC, supplier_id
+            """,
+            conn,
+        )
+        conn.close()
+        return suppliers
+
+    def get_supplier_profile(self, supplier_id: int):
+        """
+        All stored metrics of one supplier.
+        """
+        conn = connect()
+        supplier = pd.read_sql("SELECT * FROM supplier_metrics WHERE supplier_id = ?", conn, params=[supplier_id])
+        conn.close()
+        if supplier.empty:
+            return {"error": "Supplier not found"}
+        return to_records(supplier)[0]
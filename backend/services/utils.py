@@ -0,0 +1,21 @@
+import pandas as pd
+
+# SQLite's default limit on bound variables per statement is 999 on older builds.
+SQLITE_MAX_VARIABLES = 900
+
+
+def read_sql_in(conn, query, ids, params=()):
+    """
+    Run a query containing an ``IN ({ids})`` placeholder for a list of ids.
+    The id list is split into chunks that stay under SQLite's bound-variable
+    limit and the partial results are concatenated.
+    """
+    ids = list(ids)
+    chunks = [ids[i:i + SQLITE_MAX_VARIABLES] for i in range(0, len(ids), SQLITE_MAX_VARIABLES)] or [[]]
+    frames = []
+    for chunk in chunks:
+        placeholders = ",".join("?" * len(chunk))
+        frames.append(
+            pd.read_sql(query.format(ids=placeholders), conn, params=list(chunk) + list(params))
+        )
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
@@ -0,0 +1,21 @@
+# Run from backend/ (python -m pytest), like the benchmarks: the config reads
+# env.json from the working directory
+import os
+import shutil
+
+import pytest
+
+from config import config
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    A copy of the shipped database, which config.DB_PATH points to for the test.
+    """
+    path = str(tmp_path / "database.db")
+    shutil.copy(os.path.join(BACKEND, "database.db"), path)
+    monkeypatch.setattr(config, "DB_PATH", path)
+    return path
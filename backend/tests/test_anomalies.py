@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from services.anomalies import AnomalyEngine
+
+BUILT = date(2025, 5, 15)
+
+
+@pytest.mark.parametrize("days_later", [0, 30, 90, 200])
+def test_reads_expire_the_window_in_memory(database, days_later):
+    conn = sqlite3.connect(database)
+    AnomalyEngine(conn, 180).rebuild(BUILT)
+    today = BUILT + timedelta(days=days_later)
+
+    changes = conn.total_changes
+    lazy = AnomalyEngine(conn, 180).anomalies(1.0, today)
+    assert conn.total_changes == changes and not conn.in_transaction
+
+    AnomalyEngine(conn, 180).rebuild(today)
+    rebuilt = AnomalyEngine(conn, 180).anomalies(1.0, today)
+    conn.close()
+    pd.testing.assert_frame_equal(lazy, rebuilt, check_dtype=False, rtol=1e-9)
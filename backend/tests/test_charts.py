@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from services.charts import downsample, lttb_indices
+
+
+def reference_lttb(y, threshold):
+    """
+    Plain Python Largest-Triangle-Three-Buckets (Steinarsson, 2013), one point at a time.
+    """
+    n = len(y)
+    every = (n - 2) / (threshold - 2)
+    selected, a = [0], 0
+    for i in range(threshold - 2):
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, n)
+        avg_x = sum(range(avg_start, avg_end)) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((a - avg_x) * (y[j] - y[a]) - (a - j) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    return selected + [n - 1]
+
+
+def test_short_series_are_kept_whole():
+    assert lttb_indices([3.0, 1.0, 2.0], 5).tolist() == [0, 1, 2]
+    assert lttb_indices([3.0, 1.0, 2.0, 4.0], None).tolist() == [0, 1, 2, 3]
+
+
+def test_known_series():
+    # Buckets [1, 2] and [3, 4, 5]: 2 forms the largest triangle with 0 and
+    # the next bucket's average, then the peak at 3 with 2 and the last point
+    assert lttb_indices([0, 1, 0, 5, 0, 1, 0], 4).tolist() == [0, 2, 3, 6]
+
+
+def test_keeps_peaks_and_endpoints():
+    y = np.zeros(1000)
+    y[137], y[612] = 50.0, -40.0
+    selected = lttb_indices(y, 20)
+    assert len(selected) == 20
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 137 in selected and 612 in selected
+    assert (np.diff(selected) > 0).all()
+
+
+def test_matches_reference_implementation():
+    rng = np.random.default_rng(7)
+    for n, threshold in [(10, 3), (100, 10), (1001, 37), (5000, 250)]:
+        y = rng.normal(size=n).cumsum()
+        assert lttb_indices(y, threshold).tolist() == reference_lttb(y.tolist(), threshold)
+
+
+def test_downsample_frame():
+    frame = pd.DataFrame({"date": [f"2024-01-{day:02d}" for day in range(1, 8)], "value": [0, 1, 0, 5, 0, 1, 0]})
+    result = downsample(frame, "value", 4)
+    assert result["date"].tolist() == ["2024-01-01", "2024-01-03", "2024-01-04", "2024-01-07"]
+    assert result.index.tolist() == [0, 1, 2, 3]
+    assert downsample(frame, "value") is frame
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pandas as pd
+
+from services.cohorts import CohortCube
+
+# Customer 4 joined on 2024-06-19 and bought in June 2024
+CUSTOMER, JOINED = 4, "2024-06"
+
+
+def pre_join_sales():
+    return pd.DataFrame(
+        {
+            "customer_id": [CUSTOMER, CUSTOMER],
+            "transaction_date": ["2024-04-10", "2024-05-20"],
+            "sale_amount": [100.0, 50.0],
+        }
+    )
+
+
+def month_zero(cube):
+    grid = cube.slice()
+    return grid[(grid["cohort_month"] == JOINED) & (grid["months_since_join"] == 0)].iloc[0]
+
+
+def test_pre_join_activity_counts_once_in_month_zero(database):
+    conn = sqlite3.connect(database)
+    cube = CohortCube(conn)
+    cube.rebuild()
+    before = month_zero(cube)
+
+    # Appended and rebuilt, purchases before joining add revenue to month 0 but no active customer
+    cube.add_transactions(pre_join_sales())
+    appended = month_zero(cube)
+    pre_join_sales().to_sql("sales_transactions", conn, if_exists="append", index=False)
+    cube.rebuild()
+    rebuilt = month_zero(cube)
+    conn.close()
+
+    for cell in (appended, rebuilt):
+        assert cell["active_customers"] == before["active_customers"]
+        assert cell["revenue"] == round(before["revenue"] + 150.0, 2)
+        assert cell["retention"] <= 1
@@ -0,0 +1,95 @@
+"""
+Derived tables kept up to date by IngestService.append() must end up the
+same as rebuilding them from the fact tables.
+"""
+from datetime import date
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from config import config
+from db import build_customer_product_purchases, build_sales_shards, ensure_indexes
+from services import IngestService
+from services.anomalies import AnomalyEngine
+from services.approx import ApproxStore
+from services.cohorts import CohortCube
+from services.leaderboards import Leaderboards
+from services.sla import SlaHistograms
+from services.suppliers import SupplierMetrics
+
+# Rows from this date on are held back and appended
+CUTOFF = "2025-01-01"
+TODAY = date(2025, 5, 15)
+# Fact tables, and tables that differ between the two paths by design
+NOT_DERIVED = {"customers", "products", "sales_transactions", "support_tickets", "supplier_data", "meta", "profile_touches"}
+
+
+def rebuild_all(conn, today):
+    """
+    Rebuild every derived table from the fact tables, as ingest_to_db.py does.
+    """
+    ensure_indexes(conn)
+    build_sales_shards(conn)
+    build_customer_product_purchases(conn)
+    AnomalyEngine(conn, config.ANOMALY_WINDOW_DAYS).rebuild(today)
+    CohortCube(conn).rebuild()
+    SlaHistograms(conn).rebuild()
+    SupplierMetrics(conn).rebuild()
+    ApproxStore(conn).rebuild()
+    Leaderboards(conn).rebuild()
+
+
+def derived_tables(conn):
+    """
+    {table: rows sorted by every column} of the derived tables.
+    """
+    names = [
+        name
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+        if name not in NOT_DERIVED
+    ]
+    tables = {}
+    for name in names:
+        frame = pd.read_sql(f"SELECT * FROM {name}", conn)
+        tables[name] = frame.sort_values(list(frame.columns)).reset_index(drop=True)
+    return tables
+
+
+@pytest.mark.parametrize("window_days", [None, 120])
+def test_append_matches_rebuild(database, monkeypatch, window_days):
+    monkeypatch.setattr(config, "ANOMALY_WINDOW_DAYS", window_days)
+    conn = sqlite3.connect(database)
+    sales = pd.read_sql("SELECT * FROM sales_transactions WHERE transaction_date >= ?", conn, params=[CUTOFF])
+    tickets = pd.read_sql("SELECT * FROM support_tickets WHERE creation_date >= ?", conn, params=[CUTOFF])
+    assert len(sales) and len(tickets)
+    conn.execute("DELETE FROM sales_transactions WHERE transaction_date >= ?", (CUTOFF,))
+    conn.execute("DELETE FROM support_tickets WHERE creation_date >= ?", (CUTOFF,))
+    rebuild_all(conn, TODAY)
+    conn.commit()
+
+    # Two appends, so rows land both in existing and in new months, customers and days
+    half = len(sales) // 2
+    IngestService().append(sales=sales.iloc[:half], tickets=tickets.iloc[: len(tickets) // 2], today=TODAY, conn=conn)
+    IngestService().append(sales=sales.iloc[half:], tickets=tickets.iloc[len(tickets) // 2 :], today=TODAY, conn=conn)
+    incremental = derived_tables(conn)
+
+    rebuild_all(conn, TODAY)
+    conn.commit()
+    rebuilt = derived_tables(conn)
+    conn.close()
+
+    for name in [
+        "anomaly_customer_counts",
+        "anomaly_daily_counts",
+        "anomaly_stats",
+        "cohort_retention",
+        "sla_resolution_histogram",
+        "supplier_metrics",
+        "leaderboards",
+        "approx_daily_sentiment",
+    ]:
+        assert name in rebuilt
+    assert incremental.keys() == rebuilt.keys()
+    for name in rebuilt:
+        pd.testing.assert_frame_equal(incremental[name], rebuilt[name], check_dtype=False, rtol=1e-9, obj=name)
@@ -0,0 +1,48 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from config import config
+from main import prepare_database
+from services import IngestService
+from services.daterange import ALL_TIME, DateRange
+from services.leaderboards import LeaderboardService
+from services.overview import OverViewService
+
+UNLISTED = 999999
+
+
+@pytest.fixture
+def unlisted_big_spender(database):
+    """
+    A prepared copy of the database with a top-spending customer id that is
+    not in the customers table.
+    """
+    prepare_database()
+    IngestService().append(
+        sales=pd.DataFrame(
+            {
+                "customer_id": [UNLISTED],
+                "product_id": [1],
+                "quantity": [1],
+                "sale_amount": [10_000_000.0],
+                "transaction_date": ["2024-06-01"],
+            }
+        )
+    )
+
+
+@pytest.mark.parametrize("date_range", [ALL_TIME, DateRange(date(2024, 1, 1), date(2024, 12, 31))])
+def test_overview_top_customers_skip_unlisted_ids(unlisted_big_spender, date_range):
+    top = OverViewService().get_overview(date_range)["customer_overview"]["top_customers"]
+    assert len(top) == config.LEADERBOARD_SIZE
+    assert UNLISTED not in [row["customer_id"] for row in top]
+
+
+@pytest.mark.parametrize("scope", [{}, {"month": "2024-06"}])
+def test_customer_leaderboard_skips_unlisted_ids(unlisted_big_spender, scope):
+    board = LeaderboardService().get_leaderboard_frame("customers", 10, **scope)
+    assert len(board) == 10
+    assert UNLISTED not in board["customer_id"].tolist()
+    assert board["customer_name"].notna().all()
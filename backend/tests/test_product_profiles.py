@@ -0,0 +1,25 @@
+from datetime import date
+import sqlite3
+
+import pytest
+
+from config import config
+from main import prepare_database
+from services.daterange import ALL_TIME, DateRange
+from services.product import ProductService
+from services.serialization import to_python
+
+
+@pytest.mark.parametrize("date_range", [ALL_TIME, DateRange(date(2024, 1, 1), date(2024, 12, 31))])
+def test_batch_profiles_match_single_profiles(database, monkeypatch, date_range):
+    monkeypatch.setattr(config, "PROFILE_CACHE_SIZE", 0)
+    prepare_database()
+    conn = sqlite3.connect(database)
+    product_ids = [row[0] for row in conn.execute("SELECT product_id FROM products ORDER BY product_id")]
+    conn.close()
+
+    service = ProductService()
+    batch = list(service.get_product_profiles(product_ids, date_range=date_range))
+    assert [profile["product"]["product_id"] for profile in batch] == product_ids
+    for product_id, profile in zip(product_ids, batch):
+        assert profile == to_python(service.get_product_profile(product_id, date_range=date_range))
@@ -0,0 +1,36 @@
+from datetime import date
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from services.daterange import DateRange
+from services.risk import CustomerRiskScorer
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 16, 64])
+# Lists that end inside a run of tied scores
+@pytest.mark.parametrize("top_n", [6, 14, 46])
+def test_top_customers_do_not_depend_on_block_size(database, block_size, top_n):
+    conn = sqlite3.connect(database)
+    (customers,) = conn.execute("SELECT COUNT(*) FROM customers").fetchone()
+    whole = CustomerRiskScorer(conn, block_size=customers).score(top_n=top_n)
+    blocked = CustomerRiskScorer(conn, block_size=block_size).score(top_n=top_n)
+    conn.close()
+    pd.testing.assert_frame_equal(blocked, whole)
+
+
+def test_range_start_leaves_out_earlier_rows(database):
+    conn = sqlite3.connect(database)
+    scorer = CustomerRiskScorer(conn)
+    (last,) = conn.execute("SELECT MAX(transaction_date) FROM sales_transactions").fetchone()
+    end = date.fromisoformat(last[:10])
+    start = date(end.year, end.month, 1)
+    bounded = scorer.score(top_n=1000, date_range=DateRange(start, end))
+
+    # The same range with everything before its start deleted scores the same
+    conn.execute("DELETE FROM sales_transactions WHERE transaction_date < ?", (start.isoformat(),))
+    conn.execute("DELETE FROM support_tickets WHERE creation_date < ?", (start.isoformat(),))
+    trimmed = scorer.score(top_n=1000, date_range=DateRange(None, end))
+    conn.close()
+    pd.testing.assert_frame_equal(bounded, trimmed)
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from config import config
+from db import get_data_version
+from main import prepare_database
+from writer import IngestWriter
+
+
+@pytest.fixture
+def writer(database, monkeypatch):
+    """
+    An IngestWriter on a prepared copy of the database that lets batches
+    queued within a second join one group.
+    """
+    monkeypatch.setattr(config, "INGEST_GROUP_WAIT_SECONDS", 1.0)
+    prepare_database()
+    writer = IngestWriter()
+    yield writer
+    writer.stop()
+
+
+def transactions(n, transaction_date="2025-06-01"):
+    return pd.DataFrame(
+        {
+            "customer_id": [1 + i % 10 for i in range(n)],
+            "product_id": [1 + i % 5 for i in range(n)],
+            "quantity": 1,
+            "sale_amount": 10.0,
+            "transaction_date": transaction_date,
+        }
+    )
+
+
+def tickets(n):
+    return pd.DataFrame(
+        {
+            "customer_id": [1 + i % 10 for i in range(n)],
+            "product_id": 1,
+            "issue_type": "Delivery Delay",
+            "status": "Open",
+            "creation_date": "2025-06-01",
+            "resolution_date": None,
+            "sentiment_score": 0.1,
+        }
+    )
+
+
+def counts():
+    conn = sqlite3.connect(config.DB_PATH)
+    try:
+        sales, = conn.execute("SELECT COUNT(*) FROM sales_transactions").fetchone()
+        support, = conn.execute("SELECT COUNT(*) FROM support_tickets").fetchone()
+        return sales, support, get_data_version(conn)
+    finally:
+        conn.close()
+
+
+def test_queued_batches_share_one_commit(writer):
+    sales, support, version = counts()
+    futures = [
+        writer.submit("transactions", transactions(3)),
+        writer.submit("tickets", tickets(2)),
+        writer.submit("transactions", transactions(4)),
+        writer.submit("tickets", tickets(1)),
+    ]
+    assert {future.result(timeout=60) for future in futures} == {version + 1}
+    assert counts() == (sales + 7, support + 3, version + 1)
+    stats = writer.stats()
+    assert (stats["commits"], stats["batches"], stats["rows"]) == (1, 4, 10)
+    assert stats["failed_batches"] == 0
+
+
+def test_failed_group_is_retried_batch_by_batch(writer):
+    sales, support, version = counts()
+    good = writer.submit("transactions", transactions(3))
+    bad = writer.submit("transactions", transactions(2, transaction_date="not a date"))
+    also_good = writer.submit("tickets", tickets(2))
+
+    assert good.result(timeout=60) == version + 1
+    with pytest.raises(Exception):
+        bad.result(timeout=60)
+    assert also_good.result(timeout=60) == version + 2
+    # The failed group was rolled back: only the good batches' rows are in
+    assert counts() == (sales + 3, support + 2, version + 2)
+    stats = writer.stats()
+    assert (stats["commits"], stats["batches"], stats["failed_batches"]) == (2, 2, 1)
+
+
+def test_unknown_kind_is_rejected(writer):
+    with pytest.raises(ValueError):
+        writer.submit("customers", transactions(1))
+
+
+def test_writers_of_different_workers_number_rows_apart(writer):
+    # Each worker process runs its own writer; both number rows after the current maximum
+    other = IngestWriter()
+    try:
+        sales, _, version = counts()
+        futures = [w.submit("transactions", transactions(50)) for _ in range(5) for w in (writer, other)]
+        versions = [future.result(timeout=60) for future in futures]
+    finally:
+        other.stop()
+    conn = sqlite3.connect(config.DB_PATH)
+    try:
+        total, distinct = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT transaction_id) FROM sales_transactions"
+        ).fetchone()
+    finally:
+        conn.close()
+    assert total == distinct == sales + 500
+    assert max(versions) == counts()[2] > version
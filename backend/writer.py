@@ -0,0 +1,148 @@
+from concurrent.futures import Future
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from config import config
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("transactions", "tickets")
+
+
+class QueueFull(Exception):
+    """
+    Raised by IngestWriter.submit() when the write queue is at capacity.
+    """
+
+
+class IngestWriter:
+    """
+    Writer for rows posted to the ingest API, one per worker process.
+    Batches wait in a bounded queue; one thread takes everything queued at
+    once (up to INGEST_GROUP_ROWS rows) and appends it through
+    IngestService.append() in a single transaction: one commit, one data
+    version bump and one update of the derived tables per group instead of
+    per batch. The writers of different workers take turns on the database
+    write lock. The database is switched to WAL mode, so readers are never
+    blocked by a writer. If a group fails, its batches are retried one by
+    one, so only the bad batch is rejected.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "rows": 0, "commits": 0, "failed_batches": 0, "rejected_batches": 0}
+        self._commit_seconds = 0.0
+
+    def submit(self, kind, rows: "pd.DataFrame") -> Future:
+        """
+        Queue a batch of "transactions" or "tickets". The Future resolves to
+        the data version that made the rows visible. Raises QueueFull when
+        INGEST_QUEUE_SIZE batches are already waiting.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind: {kind}")
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((kind, rows, future))
+        except queue.Full:
+            self._stats["rejected_batches"] += 1
+            raise QueueFull()
+        return future
+
+    def stop(self):
+        """
+        Write what is queued, then stop the writer thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self):
+        commits = self._stats["commits"]
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": config.INGEST_QUEUE_SIZE,
+            "rows_per_commit": round(self._stats["rows"] / commits, 1) if commits else None,
+            "seconds_per_commit": round(self._commit_seconds / commits, 4) if commits else None,
+        }
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(config.DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                group, rows = [item], len(item[1])
+                # Whatever queued up during the previous commit joins this one
+                deadline = time.monotonic() + config.INGEST_GROUP_WAIT_SECONDS
+                while rows < config.INGEST_GROUP_ROWS:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    group.append(item)
+                    rows += len(item[1])
+                self._write(conn, group)
+        finally:
+            conn.close()
+
+    def _write(self, conn, group):
+        try:
+            version = self._append(conn, group)
+        except Exception as e:
+            if len(group) > 1:
+                for item in group:
+                    self._write(conn, [item])
+                return
+            logger.exception("Ingest batch failed")
+            self._stats["failed_batches"] += 1
+            group[0][2].set_exception(e)
+            return
+        for _, _, future in group:
+            future.set_result(version)
+
+    def _append(self, conn, group):
+        import pandas as pd
+        from services import IngestService
+
+        frames = {kind: [rows for item_kind, rows, _ in group if item_kind == kind] for kind in KINDS}
+        started = time.perf_counter()
+        version = IngestService().append(
+            sales=pd.concat(frames["transactions"], ignore_index=True) if frames["transactions"] else None,
+            tickets=pd.concat(frames["tickets"], ignore_index=True) if frames["tickets"] else None,
+            conn=conn,
+        )
+        self._commit_seconds += time.perf_counter() - started
+        self._stats["commits"] += 1
+        self._stats["batches"] += len(group)
+        self._stats["rows"] += sum(len(rows) for _, rows, _ in group)
+        return version
+
+
+ingest_writer = IngestWriter()
@@ -23,7 +23,7 @@ export default function CustomerProfile() {
   useEffect(() => {
     async function fetchCustomerProfile() {
       try {
-        const response = await fetch(`${import.meta.env.VITE_API_URL}customers/${id}`);
+        const response = await fetch(`${import.meta.env.VITE_API_URL}customers/${id}?max_points=120`);
         const data = await response.json();
         setProfile(data);
       } catch (error) {
@@ -24,7 +24,7 @@ export default function ProductProfile() {
     // Fetch product details using the ID
     async function fetchProductDetails() {
       try {
-        const response = await fetch(`${import.meta.env.VITE_API_URL}products/${id}`);
+        const response = await fetch(`${import.meta.env.VITE_API_URL}products/${id}?max_points=120`);
         const data = await response.json();
         setProductDetails(data);
       } catch (error) {
@@ -11,33 +11,19 @@ export default function AIInsightView() {
 
   // Fetch data on component mount
   useEffect(() => {
-    fetchAnomalousCustomers();
-    fetchTrendingProducts();
+    fetchInsights();
   }, []);
 
-  // Fetch anomalous customers
-  const fetchAnomalousCustomers = async () => {
+  // Fetch anomalous customers and trending products in one request
+  const fetchInsights = async () => {
     setLoading(true);
     setError(null);
     try {
-      const res = await axios.get(`${import.meta.env.VITE_API_URL}insights/anomalies`);
-      setAnomalousCustomers(res.data);
+      const res = await axios.get(`${import.meta.env.VITE_API_URL}dashboard?sections=anomalies,trends`);
+      setAnomalousCustomers(res.data.anomalies);
+      setTrendingProducts(res.data.trends);
     } catch (err) {
-      setError("Failed to fetch anomalous customers");
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  // Fetch trending products
-  const fetchTrendingProducts = async () => {
-    setLoading(true);
-    setError(null);
-    try {
-      const res = await axios.get(`${import.meta.env.VITE_API_URL}insights/trends`);
-      setTrendingProducts(res.data);
-    } catch (err) {
-      setError("Failed to fetch trending products");
+      setError("Failed to fetch insights");
     } finally {
       setLoading(false);
     }
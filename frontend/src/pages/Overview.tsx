@@ -1,31 +1,56 @@
 import React, { useEffect, useState } from "react";
-import axios from "axios";
 import SalesOverview from "../components/SalesOverview";
 import CustomerOverview from "../components/CustomerOverview";
 import ProductOverview from "../components/ProductOverview";
 import SupportOverview from "../components/SupportOverview";
 
+// Apply a JSON merge patch (RFC 7396) from the live dashboard stream
+function applyMergePatch(target: any, patch: any): any {
+  if (patch === null || typeof patch !== "object" || Array.isArray(patch)) {
+    return patch;
+  }
+  const result = { ...(target && typeof target === "object" && !Array.isArray(target) ? target : {}) };
+  for (const [key, value] of Object.entries(patch)) {
+    if (value === null) {
+      delete result[key];
+    } else {
+      result[key] = applyMergePatch(result[key], value);
+    }
+  }
+  return result;
+}
+
 export default function Overview() {
   const [overviewData, setOverviewData] = useState<any>(null);
-  const [loading, setLoading] = useState(false);
+  const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
-    fetchOverviewData();
-  }, []);
-
-  const fetchOverviewData = async () => {
-    setLoading(true);
-    setError(null);
-    try {
-      const res = await axios.get(`${import.meta.env.VITE_API_URL}overview`);
-      setOverviewData(res.data);
-    } catch (err) {
-      setError("Failed to fetch overview data");
-    } finally {
+    // The stream's first event is a full snapshot, so the page loads from it
+    // alone; after each ingest the server pushes the changes
+    const events = new EventSource(`${import.meta.env.VITE_API_URL}dashboard/stream?sections=overview`);
+    let received = false;
+    events.addEventListener("snapshot", (e) => {
+      received = true;
+      setOverviewData(JSON.parse((e as MessageEvent).data).data.overview);
+      setError(null);
       setLoading(false);
-    }
-  };
+    });
+    events.addEventListener("delta", (e) => {
+      const patch = JSON.parse((e as MessageEvent).data).data.overview;
+      if (patch !== undefined) {
+        setOverviewData((current: any) => applyMergePatch(current, patch));
+      }
+    });
+    // EventSource reconnects by itself; only report failures before the first snapshot
+    events.onerror = () => {
+      if (!received) {
+        setError("Failed to fetch overview data");
+        setLoading(false);
+      }
+    };
+    return () => events.close();
+  }, []);
 
   if (loading) {
     return <div className="text-center py-4">Loading...</div>;
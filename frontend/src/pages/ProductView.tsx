@@ -38,7 +38,9 @@ export default function ProductView() {
     setLoadingProductDetails(true);
     setError(null);
     try {
-      const res = await axios.get(`${import.meta.env.VITE_API_URL}products/${productId}`);
+      const res = await axios.get(`${import.meta.env.VITE_API_URL}products/${productId}`, {
+        params: { max_points: 120 },
+      });
       setProductDetails(res.data);
       setSelectedProductId(productId);
     } catch (error) {